@@ -1,12 +1,17 @@
 from horsemen.constants import METERS_PER_FURLONG, METERS_PER_LENGTH
 import numpy as np
+from collections import defaultdict
 from scipy.interpolate import InterpolatedUnivariateSpline
+from django.db import transaction
 from django.db.models import Q
-from horsemen.models import Entries, FractionalTimes, PointsOfCall, SplitCallVelocities
+from horsemen.models import Entries, FractionalTimes, PointsOfCall, SplitCallVelocities, VelocityProfiles
 import logging
 
 logger = logging.getLogger(__name__)
 
+# number of entries to calculate and write per transaction
+VELOCITY_CHUNK_SIZE = 500
+
 
 def get_position_velocity_array_from_fractions_and_points_of_call(fractions, points_of_call, num_points=5):
     """Calculate velocity array from fractional times and points of call."""
@@ -14,7 +19,7 @@ def get_position_velocity_array_from_fractions_and_points_of_call(fractions, poi
         logger.debug(f"Starting velocity calculation with {len(fractions)} fractions, {len(points_of_call)} points")
         
         # get the race distance (everything in meters)
-        race_distance = fractions.last().distance * METERS_PER_FURLONG
+        race_distance = fractions[len(fractions)-1].distance * METERS_PER_FURLONG
         
         # get the array of distances based on num points
         evaluation_distances = np.linspace(0, race_distance, num_points+1)
@@ -61,7 +66,7 @@ def get_position_velocity_array_from_fractions_and_points_of_call(fractions, poi
         horse_velocities = (evaluation_distances[1]-evaluation_distances[0]) / np.diff(horse_times)
 
         if np.max(horse_velocities) > 30:
-            logger.error(f'bad velocity calculate for {points_of_call.first().entry}, distance: {race_distance}, fracs:{fractional_times}, horse_lb: {horse_lb}, horse_lb_distance: {horse_lb_distance}')
+            logger.error(f'bad velocity calculate for {points_of_call[0].entry}, distance: {race_distance}, fracs:{fractional_times}, horse_lb: {horse_lb}, horse_lb_distance: {horse_lb_distance}')
         
         logger.debug(f"Velocity calculation complete - {len(horse_velocities)} points")
         return horse_velocities, horse_times, horse_lb_at_distance, evaluation_distances
@@ -71,92 +76,314 @@ def get_position_velocity_array_from_fractions_and_points_of_call(fractions, poi
         raise
 
 
-def calculate_split_call_velocities(recalculate_all=False):
+def interpolate_rows(x, xp, fp_rows):
+    """
+    np.interp for many rows of fp values that share the same xp.
+
+    Args:
+        x: Points to evaluate
+        xp: Increasing data point positions shared by every row
+        fp_rows: 2-D array with one row of data point values per series
+
+    Returns:
+        np.ndarray: 2-D array of interpolated values, one row per series
+    """
+    x = np.asarray(x, dtype=float)
+    xp = np.asarray(xp, dtype=float)
+    fp_rows = np.asarray(fp_rows, dtype=float)
+
+    # np.interp handles anything that isnt a simple increasing grid
+    if len(xp) < 2 or np.any(np.diff(xp) <= 0):
+        return np.array([np.interp(x, xp, fp) for fp in fp_rows]).reshape(len(fp_rows), len(x))
+
+    # same arithmetic as np.interp, clamped to the end values outside of xp
+    index = np.clip(np.searchsorted(xp, x, side='right') - 1, 0, len(xp) - 2)
+    slope = (fp_rows[:, index+1] - fp_rows[:, index]) / (xp[index+1] - xp[index])
+    interpolated = slope * (x - xp[index]) + fp_rows[:, index]
+    interpolated[:, x <= xp[0]] = fp_rows[:, :1]
+    interpolated[:, x >= xp[-1]] = fp_rows[:, -1:]
+    return interpolated
+
+
+def get_position_velocity_arrays_for_race(fractions, points_of_call_by_entry, num_points=5):
+    """
+    Calculate velocity arrays for every entry of a race in one vectorized pass.
+
+    Args:
+        fractions: Fractional times of the race ordered by point
+        points_of_call_by_entry: Points of call of each entry ordered by point
+        num_points: Number of equal length splits to calculate
+
+    Returns:
+        tuple: velocities (entries x num_points), times and lengths back
+            (entries x num_points+1) and the evaluation distances (num_points+1),
+            the rows of entries whose points of call cant be used are nan
+    """
+    try:
+        logger.debug(f"Starting race velocity calculation with {len(fractions)} fractions, {len(points_of_call_by_entry)} entries")
+
+        # get the race distance (everything in meters)
+        race_distance = fractions[len(fractions)-1].distance * METERS_PER_FURLONG
+
+        # get the array of distances based on num points
+        evaluation_distances = np.linspace(0, race_distance, num_points+1)
+
+        # fractional data formatting
+        fractional_distances = [0]
+        fractional_times = [0]
+        for fraction in fractions:
+            fractional_distances.append(fraction.distance * METERS_PER_FURLONG)
+            fractional_times.append(fraction.time)
+
+        # the leaders distance to time curve is shared by every entry, linear
+        # spline so it extrapolates past the race distance for trailing horses
+        fractional_distance_time_spline = InterpolatedUnivariateSpline(
+            fractional_distances,
+            fractional_times,
+            k=1 # linear extrapolation
+        )
+
+        # points of call data formatting, grouping entries with the same call distances
+        horse_lb_by_entry = []
+        bad_entry_indexes = []
+        entry_indexes_by_call_distances = defaultdict(list)
+        for entry_index, points_of_call in enumerate(points_of_call_by_entry):
+            horse_lb_distance=[0]
+            horse_lb=[0]
+            try:
+                for point_of_call in points_of_call:
+                    if point_of_call.distance > 0:
+                        horse_lb_distance.append(point_of_call.distance * METERS_PER_FURLONG)
+                        horse_lb.append(point_of_call.lengths_back * METERS_PER_LENGTH if point_of_call.position > 1 else 0)
+            except Exception as e:
+                # leave the rest of the race to be calculated without this entry
+                logger.error(f"Bad points of call for entry {points_of_call[0].entry_id}: {str(e)}")
+                horse_lb_by_entry.append(None)
+                bad_entry_indexes.append(entry_index)
+                continue
+            horse_lb_by_entry.append(horse_lb)
+            entry_indexes_by_call_distances[tuple(horse_lb_distance)].append(entry_index)
+
+        # get horses lengths back from leader at each interval
+        horse_lb_at_distance = np.zeros((len(points_of_call_by_entry), len(evaluation_distances)))
+        for horse_lb_distance, entry_indexes in entry_indexes_by_call_distances.items():
+            horse_lb_at_distance[entry_indexes] = interpolate_rows(
+                evaluation_distances,
+                horse_lb_distance,
+                [horse_lb_by_entry[entry_index] for entry_index in entry_indexes]
+            )
+
+        # get leaders position when each horse is crossing each interval
+        leader_distance_at_horse_distance = evaluation_distances + horse_lb_at_distance
+
+        # get leaders time at those positions (which is the horses time at the intervals)
+        horse_times = fractional_distance_time_spline(
+            leader_distance_at_horse_distance.ravel()
+        ).reshape(leader_distance_at_horse_distance.shape)
+
+        # entries with bad points of call get nan rows
+        horse_lb_at_distance[bad_entry_indexes] = np.nan
+        horse_times[bad_entry_indexes] = np.nan
+
+        # get velocity, entries with repeated times get infinite rows that are skipped
+        with np.errstate(divide='ignore', invalid='ignore'):
+            horse_velocities = (evaluation_distances[1]-evaluation_distances[0]) / np.diff(horse_times, axis=1)
+
+        for entry_index in np.flatnonzero(np.max(horse_velocities, axis=1) > 30):
+            logger.error(f'bad velocity calculate for entry {points_of_call_by_entry[entry_index][0].entry_id}, distance: {race_distance}, fracs:{fractional_times}, horse_lb: {horse_lb_by_entry[entry_index]}')
+
+        logger.debug(f"Race velocity calculation complete - {horse_velocities.shape} points")
+        return horse_velocities, horse_times, horse_lb_at_distance, evaluation_distances
+
+    except Exception as e:
+        logger.error(f"Race velocity calculation error: {str(e)}", exc_info=True)
+        raise
+
+
+def get_split_call_velocities_for_entry(entry, velocities, times, lengths_back, distances):
+    """
+    Build unsaved split call velocity records for an entry.
+
+    Args:
+        entry: Entry the velocities belong to
+        velocities: Velocity of each split
+        times: Horse's time at each evaluation distance
+        lengths_back: Horse's distance behind the leader at each evaluation distance
+        distances: Evaluation distances
+
+    Returns:
+        list: Unsaved SplitCallVelocities instances
+    """
+    # Create velocity records
+    split_call_velocities = []
+    for i, velocity in enumerate(velocities):
+
+        # get start and end distance of this fraction
+        start_distance = distances[i] if i < len(distances) else distances[-1]
+        end_distance = distances[i+1] if i+1 < len(distances) else distances[-1]
+
+        # Calculate split time and total time
+        split_time = times[i+1] - times[i] if i+1 < len(times) else 0
+        total_time = times[i+1] if i+1 < len(times) else 0
+        
+        # Calculate lengths back
+        current_lengths_back = lengths_back[i+1] if i+1 < len(times) else 0
+        
+        split_call_velocities.append(SplitCallVelocities(
+            entry=entry,
+            point=i,
+            start_distance=start_distance,
+            end_distance=end_distance,
+            split_time=split_time,
+            total_time=total_time,
+            velocity=velocity,
+            lengths_back=current_lengths_back
+        ))
+
+    return split_call_velocities
+
+
+def calculate_split_call_velocities(recalculate_all=False, chunk_size=VELOCITY_CHUNK_SIZE):
     """
     Calculate split call velocities for entries that don't have them.
+
+    Only entries whose velocities are missing or out of date are processed, the data
+    loader clears Entries.split_call_velocities_calculated whenever an entry's points
+    of call or its race's fractional times change.
+
+    Entries are processed in chunks of chunk_size. Each chunk loads its fractional
+    times and points of call in one query each and replaces its velocities with a
+    single bulk insert inside one transaction.
+
+    Entries whose velocities cant be calculated lose any old velocities and are marked
+    calculated as well, so they arent attempted again until their data changes.
     
     Args:
         recalculate_all (bool): If True, delete all existing velocities and recalculate them.
+        chunk_size (int): Number of entries to process per chunk.
     """
     try:
         if recalculate_all:
             count = SplitCallVelocities.objects.all().count()
             logger.info(f"Deleting {count} existing velocities")
             SplitCallVelocities.objects.all().delete()
+            VelocityProfiles.objects.all().delete()
         
         # Get entries that need velocities calculated
         entries = Entries.objects.filter(
             pointsofcall__isnull=False,
             race__fractionaltimes__isnull=False
-        ).distinct()
+        ).distinct().order_by('id').only('id', 'race', 'horse')
+        if not recalculate_all:
+            entries = entries.filter(split_call_velocities_calculated=False)
         
         total_entries = entries.count()
         logger.info(f"Processing {total_entries} entries")
         
+        processed_count = 0
         success_count = 0
         error_count = 0
+        updated_horse_ids = set()
         
-        for i, entry in enumerate(entries, 1):
-            try:
-                # Get fractional times
-                fractions = FractionalTimes.objects.filter(
-                    race=entry.race
-                ).order_by('point')
-                
-                if not fractions:
+        last_entry_id = 0
+        while True:
+
+            # stream the next chunk of entries
+            entry_chunk = list(entries.filter(id__gt=last_entry_id)[:chunk_size])
+            if not entry_chunk:
+                break
+            last_entry_id = entry_chunk[-1].id
+
+            # Get fractional times for every race in the chunk
+            fractions_by_race = defaultdict(list)
+            for fraction in FractionalTimes.objects.filter(
+                race_id__in={entry.race_id for entry in entry_chunk}
+            ).order_by('race_id', 'point'):
+                fractions_by_race[fraction.race_id].append(fraction)
+
+            # Get points of call for every entry in the chunk
+            points_of_call_by_entry = defaultdict(list)
+            for point_of_call in PointsOfCall.objects.filter(
+                entry_id__in=[entry.id for entry in entry_chunk]
+            ).order_by('entry_id', 'point'):
+                points_of_call_by_entry[point_of_call.entry_id].append(point_of_call)
+
+            # Group entries that have data by race
+            entries_by_race = defaultdict(list)
+            for entry in entry_chunk:
+                processed_count += 1
+                if not fractions_by_race[entry.race_id]:
                     logger.warning(f"Entry {entry.id}: No fractional times")
                     continue
-                    
-                # Get points of call
-                points_of_call = PointsOfCall.objects.filter(
-                    entry=entry
-                ).order_by('point')
-                
-                if not points_of_call:
+                if not points_of_call_by_entry[entry.id]:
                     logger.warning(f"Entry {entry.id}: No points of call")
                     continue
-                
-                logger.debug(f"Entry {entry.id}: Processing with {len(fractions)} fractions, {len(points_of_call)} points")
-                
-                # Calculate velocities
-                velocities, times, lengths_back, distances = get_position_velocity_array_from_fractions_and_points_of_call(
-                    fractions,
-                    points_of_call
-                )
-                
-                # Create velocity records
-                for i, velocity in enumerate(velocities):
-
-                    # get start and end distance of this fraction
-                    start_distance = distances[i] if i < len(distances) else distances[-1]
-                    end_distance = distances[i+1] if i+1 < len(distances) else distances[-1]
-
-                    # Calculate split time and total time
-                    split_time = times[i+1] - times[i] if i+1 < len(times) else 0
-                    total_time = times[i+1] if i+1 < len(times) else 0
-                    
-                    # Calculate lengths back
-                    current_lengths_back = lengths_back[i+1] if i+1 < len(times) else 0
-                    
-                    SplitCallVelocities.objects.create(
-                        entry=entry,
-                        point=i,
-                        start_distance=start_distance,
-                        end_distance=end_distance,
-                        split_time=split_time,
-                        total_time=total_time,
-                        velocity=velocity,
-                        lengths_back=current_lengths_back
+                entries_by_race[entry.race_id].append(entry)
+
+            # Calculate velocities for each race at once
+            split_call_velocities = []
+            chunk_success_count = 0
+            chunk_entry_ids = []
+            chunk_failed_entry_ids = []
+            chunk_horse_ids = set()
+            for race_id, race_entries in entries_by_race.items():
+                try:
+                    logger.debug(f"Race {race_id}: Processing {len(race_entries)} entries with {len(fractions_by_race[race_id])} fractions")
+
+                    velocities, times, lengths_back, distances = get_position_velocity_arrays_for_race(
+                        fractions_by_race[race_id],
+                        [points_of_call_by_entry[entry.id] for entry in race_entries]
                     )
 
-                success_count += 1
-                if i % 100 == 0:
-                    logger.info(f"Processed {i}/{total_entries} entries")
-                
+                    for entry_index, entry in enumerate(race_entries):
+
+                        # skip only the entries that couldnt be calculated
+                        if not np.all(np.isfinite(velocities[entry_index])):
+                            logger.error(f"Entry {entry.id}: Invalid velocities {velocities[entry_index]}")
+                            chunk_failed_entry_ids.append(entry.id)
+                            chunk_horse_ids.add(entry.horse_id)
+                            continue
+
+                        split_call_velocities.extend(get_split_call_velocities_for_entry(
+                            entry,
+                            velocities[entry_index],
+                            times[entry_index],
+                            lengths_back[entry_index],
+                            distances
+                        ))
+                        chunk_entry_ids.append(entry.id)
+                        chunk_horse_ids.add(entry.horse_id)
+                        chunk_success_count += 1
+
+                except Exception as e:
+                    logger.error(f"Race {race_id} error: {str(e)}", exc_info=True)
+                    for entry in race_entries:
+                        if entry.id not in chunk_entry_ids:
+                            chunk_failed_entry_ids.append(entry.id)
+                            chunk_horse_ids.add(entry.horse_id)
+                    continue
+
+            # Write the chunk, failed entries are left without velocities
+            try:
+                with transaction.atomic():
+                    SplitCallVelocities.objects.filter(entry_id__in=chunk_entry_ids + chunk_failed_entry_ids).delete()
+                    SplitCallVelocities.objects.bulk_create(split_call_velocities)
+                    Entries.objects.filter(
+                        id__in=chunk_entry_ids + chunk_failed_entry_ids
+                    ).update(split_call_velocities_calculated=True)
+                success_count += chunk_success_count
+                error_count += len(chunk_failed_entry_ids)
+                updated_horse_ids.update(chunk_horse_ids)
             except Exception as e:
-                error_count += 1
-                logger.error(f"Entry {entry.id} error: {str(e)}", exc_info=True)
-                continue
+                error_count += chunk_success_count + len(chunk_failed_entry_ids)
+                logger.error(f"Error writing velocities for entries up to {last_entry_id}: {str(e)}", exc_info=True)
+
+            logger.info(f"Processed {processed_count}/{total_entries} entries")
+
+        # cached velocity profiles for these horses are out of date
+        updated_horse_ids = list(updated_horse_ids)
+        for index in range(0, len(updated_horse_ids), 1000):
+            VelocityProfiles.objects.filter(horse_id__in=updated_horse_ids[index:index+1000]).delete()
         
         logger.info(f"Complete - Processed: {total_entries}, Success: {success_count}, Errors: {error_count}")
         
@@ -0,0 +1,227 @@
+import unittest
+from datetime import date
+from types import SimpleNamespace
+import numpy as np
+from django.test import TestCase
+from horsemen.constants import METERS_PER_FURLONG, METERS_PER_LENGTH
+from horsemen.models import Tracks, Races, Horses, Entries, PointsOfCall, SplitCallVelocities
+from horsemen.data_collection.data_loader import parse_fractional_time, parse_point_of_call
+from horsemen.analysis import data_processing
+from .data_processing import (
+    calculate_split_call_velocities,
+    interpolate_rows,
+    get_position_velocity_arrays_for_race,
+    get_position_velocity_array_from_fractions_and_points_of_call
+)
+
+class TestRaceVelocityKernel(unittest.TestCase):
+    def setUp(self):
+        # Sample six furlong race with a half mile call layout
+        self.fractions = [
+            SimpleNamespace(distance=2, time=22.5),
+            SimpleNamespace(distance=4, time=45.8),
+            SimpleNamespace(distance=6, time=70.9)
+        ]
+        self.points_of_call_by_entry = [
+            [
+                SimpleNamespace(distance=0, position=1, lengths_back=0, entry_id=1),
+                SimpleNamespace(distance=2, position=1, lengths_back=0, entry_id=1),
+                SimpleNamespace(distance=4, position=1, lengths_back=0, entry_id=1),
+                SimpleNamespace(distance=6, position=1, lengths_back=0, entry_id=1)
+            ],
+            [
+                SimpleNamespace(distance=0, position=2, lengths_back=0, entry_id=2),
+                SimpleNamespace(distance=2, position=2, lengths_back=1.5, entry_id=2),
+                SimpleNamespace(distance=4, position=3, lengths_back=2.25, entry_id=2),
+                SimpleNamespace(distance=6, position=2, lengths_back=0.5, entry_id=2)
+            ],
+            [
+                # missing the quarter call
+                SimpleNamespace(distance=0, position=3, lengths_back=0, entry_id=3),
+                SimpleNamespace(distance=4, position=2, lengths_back=1, entry_id=3),
+                SimpleNamespace(distance=6, position=3, lengths_back=4, entry_id=3)
+            ]
+        ]
+
+    def test_interpolate_rows_matches_np_interp(self):
+        x = np.linspace(-10, 1300, 7)
+        xp = np.array([0, 402.336, 804.672, 1207.008])
+        fp_rows = np.array([[0, 1, 2, 3], [0, 3.6, 5.4, 1.2]])
+        interpolated = interpolate_rows(x, xp, fp_rows)
+        for row_index, fp in enumerate(fp_rows):
+            np.testing.assert_allclose(interpolated[row_index], np.interp(x, xp, fp))
+
+    def test_interpolate_rows_single_point(self):
+        interpolated = interpolate_rows([0, 10, 20], [0], [[0], [0]])
+        np.testing.assert_array_equal(interpolated, np.zeros((2, 3)))
+
+    def test_race_kernel_matches_single_entry(self):
+        velocities, times, lengths_back, distances = get_position_velocity_arrays_for_race(
+            self.fractions,
+            self.points_of_call_by_entry
+        )
+        self.assertEqual(velocities.shape, (3, 5))
+        self.assertEqual(times.shape, (3, 6))
+
+        for entry_index, points_of_call in enumerate(self.points_of_call_by_entry):
+            entry_velocities, entry_times, entry_lengths_back, entry_distances = \
+                get_position_velocity_array_from_fractions_and_points_of_call(self.fractions, points_of_call)
+            np.testing.assert_allclose(velocities[entry_index], entry_velocities)
+            np.testing.assert_allclose(times[entry_index], entry_times)
+            np.testing.assert_allclose(lengths_back[entry_index], entry_lengths_back)
+            np.testing.assert_allclose(distances, entry_distances)
+
+    def test_leader_runs_fractional_times(self):
+        velocities, times, lengths_back, distances = get_position_velocity_arrays_for_race(
+            self.fractions,
+            self.points_of_call_by_entry
+        )
+        self.assertAlmostEqual(times[0][-1], 70.9)
+        self.assertTrue(np.all(times[1] >= times[0]))
+
+    def test_bad_entry_is_masked(self):
+        # trailing horse with no lengths back at the half
+        bad_points_of_call = [
+            SimpleNamespace(distance=0, position=4, lengths_back=0, entry_id=4),
+            SimpleNamespace(distance=4, position=4, lengths_back=None, entry_id=4),
+            SimpleNamespace(distance=6, position=4, lengths_back=6, entry_id=4)
+        ]
+        velocities, times, lengths_back, distances = get_position_velocity_arrays_for_race(
+            self.fractions,
+            self.points_of_call_by_entry[:2] + [bad_points_of_call] + self.points_of_call_by_entry[2:]
+        )
+        self.assertEqual(velocities.shape, (4, 5))
+        self.assertTrue(np.all(np.isnan(velocities[2])))
+        self.assertTrue(np.all(np.isnan(times[2])))
+
+        # the rest of the race is unaffected
+        good_velocities, good_times, good_lengths_back, good_distances = get_position_velocity_arrays_for_race(
+            self.fractions,
+            self.points_of_call_by_entry
+        )
+        np.testing.assert_allclose(velocities[[0, 1, 3]], good_velocities)
+        np.testing.assert_allclose(times[[0, 1, 3]], good_times)
+        np.testing.assert_allclose(lengths_back[[0, 1, 3]], good_lengths_back)
+
+class TestCalculateSplitCallVelocities(TestCase):
+    def setUp(self):
+        track = Tracks.objects.create(code='SAR', name='SARATOGA', country='USA')
+        self.race = Races.objects.create(
+            track=track, race_date=date(2024, 8, 1), race_number=1, distance=6, breed='TB'
+        )
+        parse_fractional_time({'fractional_time_array': [22.1, 45.3, 57.8, 70.9]}, parent_object=self.race)
+        self.entries = [self.add_entry(index) for index in range(2)]
+
+    def add_entry(self, index, lengths_back=1.5):
+        horse = Horses.objects.create(horse_name=f'HORSE {index}')
+        entry = Entries.objects.create(race=self.race, horse=horse, program_number=str(index+1))
+        for line_index, text in enumerate(['Start', '1/4', '1/2', 'Str', 'Fin']):
+            parse_point_of_call({
+                'position': index+1,
+                'lengths_back': lengths_back*index,
+                'text': text,
+                'line_index': line_index
+            }, parent_object=entry)
+        return entry
+
+    def mark_velocities(self, entry):
+        # stand in value that only survives if the entry isnt calculated again
+        SplitCallVelocities.objects.filter(entry=entry).update(velocity=-1)
+
+    def is_recalculated(self, entry):
+        return not SplitCallVelocities.objects.filter(entry=entry, velocity=-1).exists()
+
+    def test_calculated_entries_are_skipped(self):
+        calculate_split_call_velocities()
+        self.assertEqual(SplitCallVelocities.objects.count(), 10)
+        self.assertEqual(Entries.objects.filter(split_call_velocities_calculated=True).count(), 2)
+
+        for entry in self.entries:
+            self.mark_velocities(entry)
+        calculate_split_call_velocities()
+        self.assertFalse(any(self.is_recalculated(entry) for entry in self.entries))
+
+    def test_new_entries_are_picked_up(self):
+        calculate_split_call_velocities()
+        self.mark_velocities(self.entries[0])
+
+        new_entry = self.add_entry(2)
+        calculate_split_call_velocities()
+        self.assertEqual(SplitCallVelocities.objects.filter(entry=new_entry).count(), 5)
+        self.assertFalse(self.is_recalculated(self.entries[0]))
+
+    def test_changed_points_of_call_are_recalculated(self):
+        calculate_split_call_velocities()
+        for entry in self.entries:
+            self.mark_velocities(entry)
+
+        parse_point_of_call({'position': 2, 'lengths_back': 4, 'text': '1/2', 'line_index': 2}, parent_object=self.entries[1])
+        self.assertEqual(
+            list(Entries.objects.order_by('id').values_list('split_call_velocities_calculated', flat=True)),
+            [True, False]
+        )
+
+        calculate_split_call_velocities()
+        self.assertFalse(self.is_recalculated(self.entries[0]))
+        self.assertTrue(self.is_recalculated(self.entries[1]))
+        self.assertTrue(Entries.objects.get(id=self.entries[1].id).split_call_velocities_calculated)
+
+    def test_changed_fractions_are_recalculated(self):
+        calculate_split_call_velocities()
+        for entry in self.entries:
+            self.mark_velocities(entry)
+
+        parse_fractional_time({'fractional_time_array': [22.1, 45.9, 57.8, 70.9]}, parent_object=self.race)
+        self.assertFalse(Entries.objects.filter(split_call_velocities_calculated=True).exists())
+
+        calculate_split_call_velocities()
+        self.assertTrue(all(self.is_recalculated(entry) for entry in self.entries))
+
+    def test_bad_entry_is_skipped_until_it_changes(self):
+        bad_entry = self.add_entry(2)
+        calculate_split_call_velocities()
+
+        # a horse that always looks to be the leader's distance from the wire
+        # gives the leader the same time at two evaluation distances
+        race_distance = self.race.distance * METERS_PER_FURLONG
+        for point_of_call in PointsOfCall.objects.filter(entry=bad_entry, distance__gt=0):
+            point_of_call.lengths_back = (race_distance - point_of_call.distance * METERS_PER_FURLONG) / METERS_PER_LENGTH
+            point_of_call.save()
+        Entries.objects.filter(id=bad_entry.id).update(split_call_velocities_calculated=False)
+
+        # its old velocities go and it is marked so it isnt retried every run
+        with self.assertLogs(data_processing.logger, 'ERROR'):
+            calculate_split_call_velocities()
+        self.assertEqual(SplitCallVelocities.objects.filter(entry__in=self.entries).count(), 10)
+        self.assertFalse(SplitCallVelocities.objects.filter(entry=bad_entry).exists())
+        self.assertTrue(Entries.objects.get(id=bad_entry.id).split_call_velocities_calculated)
+        with self.assertNoLogs(data_processing.logger, 'ERROR'):
+            calculate_split_call_velocities()
+
+        # corrected points of call are calculated again
+        parse_point_of_call({'position': 3, 'lengths_back': 2, 'text': '1/2', 'line_index': 2}, parent_object=bad_entry)
+        for point_of_call in PointsOfCall.objects.filter(entry=bad_entry, distance__gt=0):
+            point_of_call.lengths_back = 2
+            point_of_call.save()
+        calculate_split_call_velocities()
+        self.assertEqual(SplitCallVelocities.objects.filter(entry=bad_entry).count(), 5)
+
+    def test_failed_race_isnt_retried(self):
+        calculate_split_call_velocities()
+        Entries.objects.update(split_call_velocities_calculated=False)
+
+        def get_arrays(fractions, points_of_call_by_entry):
+            raise ValueError('bad fractions')
+        original_get_arrays = data_processing.get_position_velocity_arrays_for_race
+        data_processing.get_position_velocity_arrays_for_race = get_arrays
+        self.addCleanup(setattr, data_processing, 'get_position_velocity_arrays_for_race', original_get_arrays)
+
+        with self.assertLogs(data_processing.logger, 'ERROR'):
+            calculate_split_call_velocities()
+        self.assertFalse(SplitCallVelocities.objects.exists())
+        self.assertFalse(Entries.objects.filter(split_call_velocities_calculated=False).exists())
+        with self.assertNoLogs(data_processing.logger, 'ERROR'):
+            calculate_split_call_velocities()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -151,6 +151,25 @@ DAY_EVENING_CHOICES = [
     ('E', 'Evening')
 ]
 
+RAW_FILE_STATUS_CHOICES = [
+    ('F', 'Fetched'),
+    ('P', 'Parsed'),
+    ('X', 'Failed')
+]
+
+FETCH_KIND_CHOICES = [
+    ('ENTRIES', 'Equibase Entries'),
+    ('HORSERESULTS', 'Equibase Horse Results'),
+    ('CHART', 'Equibase Chart')
+]
+
+FETCH_STATUS_CHOICES = [
+    ('Q', 'Queued'),
+    ('C', 'Claimed'),
+    ('D', 'Done'),
+    ('X', 'Failed')
+]
+
 RACE_SURFACE = [
     ('D', 'Dirt'),
     ('T', 'Turf')
@@ -0,0 +1,506 @@
+"""
+Bulk loader module for loading parsed horse racing data with set based writes.
+Flattens parsed objects into per model batches and upserts each batch on its natural key.
+"""
+
+import logging
+from typing import Dict, Any, List
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from fuzzywuzzy import fuzz
+from horsemen.data_collection.data_loader import (
+    IdentityMap, current_identity_map, remember_instance,
+    parse_track, parse_horse, get_call_for_point_of_call, update_point_of_call,
+    OBJECT_MAP, RACE_UPDATE_FIELDS
+)
+from horsemen.data_collection.utils import (
+    create_fractional_data_from_array_and_object,
+    get_post_time_from_drf
+)
+from horsemen.models import (
+    FractionalTimes, Races, PointsOfCall, Payoffs, Entries, Workouts
+)
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# unique fields each model is upserted on
+NATURAL_KEYS = {
+    Races: ['track', 'race_date', 'race_number'],
+    Entries: ['race', 'horse'],
+    PointsOfCall: ['entry', 'point'],
+    FractionalTimes: ['race', 'point'],
+    Payoffs: ['race', 'wager_type', 'winning_numbers'],
+    Workouts: ['track', 'workout_date', 'horse']
+}
+BULK_BATCH_SIZE = 500
+
+
+def get_natural_key(model, **values) -> tuple:
+    """Natural key of a row from its field values, cleaned the way the database stores them."""
+    key = []
+    for name in NATURAL_KEYS[model]:
+        field = model._meta.get_field(name)
+        value = values[name]
+        if field.is_relation:
+            key.append(value if isinstance(value, int) else value.pk)
+        else:
+            key.append(field.to_python(value))
+    return tuple(key)
+
+
+def get_instance_natural_key(instance) -> tuple:
+    model = type(instance)
+    return tuple(
+        getattr(instance, model._meta.get_field(name).attname)
+        for name in NATURAL_KEYS[model]
+    )
+
+
+def get_existing_instances(model, keys) -> Dict[tuple, Any]:
+    """Load the rows for a set of natural keys in one query."""
+    keys = set(keys)
+    if not keys:
+        return {}
+
+    lookup = {}
+    for index, name in enumerate(NATURAL_KEYS[model]):
+        lookup[f'{model._meta.get_field(name).attname}__in'] = {key[index] for key in keys}
+
+    instances = {}
+    for instance in model.objects.filter(**lookup).order_by('pk'):
+        key = get_instance_natural_key(instance)
+        if key in keys:
+            instances.setdefault(key, instance)
+    return instances
+
+
+def upsert_instances(model, instances: List[Any]) -> None:
+    """Insert or update instances with one statement per batch, on the model's natural key."""
+    if not instances:
+        return
+    unique_fields = NATURAL_KEYS[model]
+    update_fields = [
+        field.name for field in model._meta.concrete_fields
+        if not field.primary_key and field.name not in unique_fields
+    ]
+    model.objects.bulk_create(
+        instances,
+        batch_size=BULK_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=unique_fields,
+        update_fields=update_fields
+    )
+    logger.info("Upserted %d %s", len(instances), model._meta.verbose_name_plural)
+
+
+def update_fields_from_data(instance, data: Dict[str, Any], exclude: List[str]) -> bool:
+    """Copy parsed values onto an instance's matching attributes, returning True if any changed."""
+    changed = False
+    for key, value in data.items():
+        if key not in exclude and hasattr(instance, key):
+            if getattr(instance, key) != value:
+                setattr(instance, key, value)
+                changed = True
+    return changed
+
+
+class ParsedObjectBatch:
+    """
+    Parsed objects flattened into per model batches.
+
+    Races keep their entries, fractional times and payoffs and entries keep their
+    points of call so each batch can be tied back to its parent once the parent
+    has been written.
+    """
+
+    def __init__(self):
+        self.entities = []
+        self.races = []
+        self.entries = []
+        self.workouts = []
+        self.other_children = []
+
+    def add(self, parsed_object: Dict[str, Any]) -> None:
+        if 'object_type' not in parsed_object:
+            raise ValueError(f"Missing object_type in parsed object: {parsed_object}")
+
+        object_type = parsed_object['object_type']
+        if object_type == 'race':
+            self.add_race(parsed_object)
+        elif object_type == 'entry':
+            self.add_entry(parsed_object, self.add_race(parsed_object['race']))
+        elif object_type == 'workout':
+            self.workouts.append(parsed_object)
+        elif object_type in ['track', 'horse', 'trainer', 'jockey']:
+            self.entities.append(parsed_object)
+        elif object_type in OBJECT_MAP:
+            raise ValueError(f"Object type needs a parent object: {object_type}: {parsed_object}")
+        else:
+            raise ValueError(f"Unsupported object type: {object_type}: {parsed_object}")
+
+    def add_race(self, race_data: Dict[str, Any]) -> Dict[str, Any]:
+        race_record = {
+            'data': race_data,
+            'race': None,
+            'fractional_times': [],
+            'payoffs': []
+        }
+        self.races.append(race_record)
+        for child in race_data.get('children', []):
+            if child['object_type'] == 'entry':
+                self.add_entry(child, race_record)
+            elif child['object_type'] == 'fractional_time':
+                race_record['fractional_times'].append(child)
+            elif child['object_type'] == 'payoff':
+                race_record['payoffs'].append(child)
+            elif child['object_type'] in OBJECT_MAP:
+                self.other_children.append((child, race_record, 'race'))
+        return race_record
+
+    def add_entry(self, entry_data: Dict[str, Any], race_record: Dict[str, Any]) -> None:
+        entry_record = {
+            'data': entry_data,
+            'race_record': race_record,
+            'entry': None,
+            'points_of_call': []
+        }
+        self.entries.append(entry_record)
+        for child in entry_data.get('children', []):
+            if child['object_type'] == 'point_of_call':
+                entry_record['points_of_call'].append(child)
+            elif child['object_type'] in OBJECT_MAP:
+                self.other_children.append((child, entry_record, 'entry'))
+
+    def load(self) -> None:
+        """Write every batch, parents before children."""
+        for entity_data in self.entities:
+            OBJECT_MAP[entity_data['object_type']](entity_data)
+        self.load_races()
+        self.load_entries()
+        self.load_points_of_call()
+        self.load_fractional_times()
+        self.load_payoffs()
+        self.load_workouts()
+        for child, parent_record, parent_type in self.other_children:
+            OBJECT_MAP[child['object_type']](child, parent_record[parent_type])
+
+    def load_races(self) -> None:
+        # find each race's natural key
+        for race_record in self.races:
+            race_data = race_record['data']
+            for field in ['track', 'race_date', 'race_number']:
+                if field not in race_data or not race_data[field]:
+                    raise ValueError(f"The '{field}' field is required and cannot be empty.")
+            race_record['track'] = parse_track(race_data['track'])
+            race_record['key'] = get_natural_key(
+                Races,
+                track=race_record['track'],
+                race_date=race_data['race_date'],
+                race_number=race_data['race_number']
+            )
+
+        # merge parsed data into existing or new races, in order
+        races = get_existing_instances(Races, [race_record['key'] for race_record in self.races])
+        changed_keys = set()
+        for race_record in self.races:
+            race_data = race_record['data']
+            key = race_record['key']
+            race = races.get(key)
+            if race is None:
+                race = Races(track=race_record['track'], race_date=key[1], race_number=key[2])
+                races[key] = race
+                changed_keys.add(key)
+            race.track = race_record['track']
+
+            # non-standard processing
+            if 'post_time_string' in race_data:
+                race_data['post_time'] = get_post_time_from_drf(race.track, race.race_date, race_data['post_time_string'])
+
+            for field in RACE_UPDATE_FIELDS:
+                if field in race_data and getattr(race, field) != race_data[field]:
+                    setattr(race, field, race_data[field])
+                    changed_keys.add(key)
+            race_record['race'] = race
+
+        changed_races = [races[key] for key in changed_keys]
+        for race in changed_races:
+            race.clean()
+        upsert_instances(Races, changed_races)
+
+    def load_entries(self) -> None:
+        # existing entries of every race in the batch
+        race_ids = {entry_record['race_record']['race'].pk for entry_record in self.entries}
+        race_entries = {race_id: [] for race_id in race_ids}
+        for entry in Entries.objects.filter(race_id__in=race_ids).select_related(
+            'horse', 'jockey', 'trainer'
+        ).order_by('pk'):
+            entry.horse = remember_instance(entry.horse)
+            entry.jockey = remember_instance(entry.jockey)
+            entry.trainer = remember_instance(entry.trainer)
+            race_entries[entry.race_id].append(entry)
+
+        deleted_entries = []
+        changed_entries = {}
+        for entry_record in self.entries:
+            entry_data = entry_record['data']
+            race = entry_record['race_record']['race']
+            entries = race_entries[race.pk]
+
+            # find existing entry by program number
+            entry = None
+            if 'program_number' in entry_data and entry_data['program_number'] != '':
+                entry = next((
+                    race_entry for race_entry in entries
+                    if race_entry.program_number == entry_data['program_number']
+                ), None)
+
+                # Validate horse hasn't changed
+                if entry and 'horse' in entry_data and 'horse_name' in entry_data['horse']:
+                    if entry.horse.horse_name != entry_data['horse']['horse_name']:
+                        if fuzz.partial_ratio(entry.horse.horse_name, entry_data['horse']['horse_name']) < 90:
+                            logger.warning(
+                                "Horse changed for program number %s from %s to %s",
+                                entry.program_number,
+                                entry.horse.horse_name,
+                                entry_data['horse']['horse_name']
+                            )
+                            entries.remove(entry)
+                            changed_entries.pop(id(entry), None)
+                            if entry.pk:
+                                deleted_entries.append(entry)
+                            entry = None
+                        else:
+                            logger.error(f"There was an issue parsing {entry_data['horse']['horse_name']} as entry.horse.horse_name")
+
+            # find or create entry by horse
+            if not entry and 'horse' in entry_data:
+                horse = None
+                if 'horse_name' in entry_data['horse']:
+                    for race_entry in entries:
+                        if race_entry.horse.horse_name == entry_data['horse']['horse_name']:
+                            horse = race_entry.horse
+                            entry = race_entry
+
+                horse = parse_horse(entry_data['horse'], horse)
+                if horse and not entry:
+                    entry = next((race_entry for race_entry in entries if race_entry.horse_id == horse.pk), None)
+                    if not entry:
+                        entry = Entries(race=race, horse=horse)
+                        entries.append(entry)
+                        changed_entries[id(entry)] = entry
+                elif not horse:
+                    raise ValueError("Could not parse horse data")
+            elif entry and 'horse' in entry_data:
+                parse_horse(entry_data['horse'], entry.horse)
+
+            if not entry:
+                raise ValueError("No matching entry found or could be created: %s", entry_data)
+
+            # Update entry attributes
+            for key, value in entry_data.items():
+                if isinstance(value, dict):
+                    if key not in ['race', 'horse'] and value['object_type'] in OBJECT_MAP:
+                        old_id = getattr(entry, key).id if getattr(entry, key) else None
+                        parsed_value = OBJECT_MAP[value['object_type']](
+                            value,
+                            existing_instance=getattr(entry, key)
+                        )
+                        if old_id != parsed_value.id:
+                            setattr(entry, key, parsed_value)
+                            changed_entries[id(entry)] = entry
+                elif hasattr(entry, key) and getattr(entry, key) != value:
+                    setattr(entry, key, value)
+                    changed_entries[id(entry)] = entry
+
+            entry_record['entry'] = entry
+
+        if deleted_entries:
+            Entries.objects.filter(id__in=[entry.pk for entry in deleted_entries]).delete()
+            logger.info("Deleted %d entries with changed horses", len(deleted_entries))
+
+        changed_entries = list(changed_entries.values())
+        for entry in changed_entries:
+            entry.clean()
+        upsert_instances(Entries, changed_entries)
+
+    def load_points_of_call(self) -> None:
+        entry_records = [entry_record for entry_record in self.entries if entry_record['points_of_call']]
+
+        # map each point of call to its call
+        keyed_points_of_call = []
+        for entry_record in entry_records:
+            entry = entry_record['entry']
+            race = entry_record['race_record']['race']
+            for point_of_call_data in entry_record['points_of_call']:
+                call = get_call_for_point_of_call(race, point_of_call_data)
+                key = get_natural_key(PointsOfCall, entry=entry, point=call['point'])
+                keyed_points_of_call.append((key, point_of_call_data, call, entry, race))
+
+        points_of_call = get_existing_instances(PointsOfCall, [key for key, *_ in keyed_points_of_call])
+        changed_keys = set()
+        for key, point_of_call_data, call, entry, race in keyed_points_of_call:
+            point_of_call = points_of_call.get(key)
+            if point_of_call is None:
+                point_of_call = PointsOfCall(entry=entry, point=call['point'])
+                points_of_call[key] = point_of_call
+            if update_point_of_call(point_of_call, point_of_call_data, call, race):
+                changed_keys.add(key)
+
+        upsert_instances(PointsOfCall, [points_of_call[key] for key in changed_keys])
+
+        # the entries' split call velocities need to be calculated again
+        changed_entry_ids = {key[0] for key in changed_keys}
+        if changed_entry_ids:
+            Entries.objects.filter(id__in=changed_entry_ids).update(split_call_velocities_calculated=False)
+
+    def load_fractional_times(self) -> None:
+        keyed_fractional_times = []
+        for race_record in self.races:
+            race = race_record['race']
+            for fractional_time_data in race_record['fractional_times']:
+                if 'fractional_time_array' in fractional_time_data:
+                    time_objects = create_fractional_data_from_array_and_object(
+                        fractional_time_data['fractional_time_array'],
+                        race.distance
+                    )
+                else:
+                    time_objects = [fractional_time_data]
+                for time_object in time_objects:
+                    if 'point' not in time_object:
+                        raise ValueError("point is required")
+                    key = get_natural_key(FractionalTimes, race=race, point=time_object['point'])
+                    keyed_fractional_times.append((key, time_object, race))
+
+        fractional_times = get_existing_instances(FractionalTimes, [key for key, *_ in keyed_fractional_times])
+        changed_keys = set()
+        for key, time_object, race in keyed_fractional_times:
+            fractional_time = fractional_times.get(key)
+            if fractional_time is None:
+                fractional_time = FractionalTimes(race=race, point=time_object['point'])
+                fractional_times[key] = fractional_time
+            if update_fields_from_data(fractional_time, time_object, ['object_type', 'children', 'race']):
+                changed_keys.add(key)
+
+        upsert_instances(FractionalTimes, [fractional_times[key] for key in changed_keys])
+
+        # the races' split call velocities need to be calculated again
+        changed_race_ids = {key[0] for key in changed_keys}
+        if changed_race_ids:
+            Entries.objects.filter(race_id__in=changed_race_ids).update(split_call_velocities_calculated=False)
+
+    def load_payoffs(self) -> None:
+        keyed_payoffs = []
+        for race_record in self.races:
+            race = race_record['race']
+            for payoff_data in race_record['payoffs']:
+                if not all(field in payoff_data for field in ['wager_type', 'winning_numbers']):
+                    raise ValueError("wager_type and winning_numbers are required")
+                key = get_natural_key(
+                    Payoffs,
+                    race=race,
+                    wager_type=payoff_data['wager_type'],
+                    winning_numbers=payoff_data['winning_numbers']
+                )
+                keyed_payoffs.append((key, payoff_data, race))
+
+        payoffs = get_existing_instances(Payoffs, [key for key, *_ in keyed_payoffs])
+        changed_keys = set()
+        for key, payoff_data, race in keyed_payoffs:
+            payoff = payoffs.get(key)
+            if payoff is None:
+                payoff = Payoffs(race=race, wager_type=key[1], winning_numbers=key[2])
+                payoffs[key] = payoff
+                changed_keys.add(key)
+            if update_fields_from_data(payoff, payoff_data, ['object_type', 'children', 'race']):
+                changed_keys.add(key)
+
+        changed_payoffs = [payoffs[key] for key in changed_keys]
+        for payoff in changed_payoffs:
+            payoff.clean()
+        upsert_instances(Payoffs, changed_payoffs)
+
+    def load_workouts(self) -> None:
+        required_fields = [
+            'workout_date', 'surface', 'distance',
+            'time_seconds', 'note', 'workout_rank', 'workout_total'
+        ]
+
+        # workouts that cant be resolved are skipped like parse_workout does
+        keyed_workouts = []
+        for workout_data in self.workouts:
+            try:
+                horse = parse_horse(workout_data['horse'])
+                if 'track' not in workout_data:
+                    raise ValueError("Track data is required")
+                track = parse_track(workout_data['track'])
+                for field in required_fields:
+                    if field not in workout_data:
+                        raise ValueError(f"Required field missing: {field}")
+                key = get_natural_key(Workouts, track=track, workout_date=workout_data['workout_date'], horse=horse)
+                keyed_workouts.append((key, workout_data, track, horse))
+            except Exception as e:
+                logger.error("Error parsing workout: %s", e)
+
+        workouts = get_existing_instances(Workouts, [key for key, *_ in keyed_workouts])
+        changed_keys = set()
+        for key, workout_data, track, horse in keyed_workouts:
+            workout = workouts.get(key)
+            if workout is None:
+                workout = Workouts(track=track, workout_date=key[1], horse=horse)
+                workouts[key] = workout
+                changed_keys.add(key)
+            for field in required_fields[1:]:
+                if getattr(workout, field) != workout_data[field]:
+                    setattr(workout, field, workout_data[field])
+                    changed_keys.add(key)
+
+        changed_workouts = []
+        for key in changed_keys:
+            try:
+                workouts[key].clean()
+                changed_workouts.append(workouts[key])
+            except ValidationError as e:
+                logger.error("Validation error parsing workout: %s", e)
+        upsert_instances(Workouts, changed_workouts)
+
+
+def bulk_process_parsed_objects(parsed_objects: List[Dict[str, Any]]) -> int:
+    """
+    Load a list of parsed objects with set based writes, the bulk counterpart of
+    process_parsed_objects.
+
+    Tracks, horses, trainers and jockeys are resolved through the load's identity map,
+    then races, entries, points of call, fractional times, payoffs and workouts are each
+    written with bulk upserts on their natural keys.
+
+    Args:
+        parsed_objects: List of dictionaries containing object data to parse
+
+    Returns:
+        Number of children that were skipped, always 0 since a bad child fails the whole load
+
+    Raises:
+        ValueError: If object type is not supported
+    """
+    logger.info("Bulk processing parsed objects")
+
+    identity_map = IdentityMap()
+    token = current_identity_map.set(identity_map)
+
+    try:
+        with transaction.atomic():
+            identity_map.preload(parsed_objects)
+
+            batch = ParsedObjectBatch()
+            for parsed_object in parsed_objects:
+                batch.add(parsed_object)
+            batch.load()
+
+    except Exception as e:
+        logger.error("Error bulk processing parsed objects: %s", e)
+        raise
+    finally:
+        current_identity_map.reset(token)
+
+    return 0
@@ -3,6 +3,14 @@ Collector module for coordinating data collection from various sources.
 """
 
 import logging
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import django
+from django.conf import settings
+from django.db import connections
 from horsemen.data_collection.utils import SCRAPING_FOLDER
 from horsemen.data_collection.equibase.charts.extractor import parse_equibase_chart
 from horsemen.data_collection.equibase.charts.data_parser import parse_extracted_chart_data
@@ -16,9 +24,15 @@ from horsemen.data_collection.equibase.horse_results.data_parser import parse_ex
 from horsemen.data_collection.drf.tracks.data_parser import fetch_tracks_data
 from horsemen.data_collection.drf.entries.data_parser import get_entries_data
 from horsemen.data_collection.drf.results.data_parser import get_results_data
+from horsemen.data_collection.drf.response_cache import DrfResponseCache
 from horsemen.data_collection.data_loader import process_parsed_objects
-from horsemen.models import Races, Entries, Horses, Tracks
-from horsemen.data_collection.scraping import scrape_url_zenrows
+from horsemen.data_collection.bulk_loader import bulk_process_parsed_objects
+from horsemen.data_collection.raw_store import archive_raw_file, store_unparsed_raw_file, RAW_FILE_PARSED
+from horsemen.data_collection.extraction_cache import extract_with_cache, extract_raw_file_with_cache
+from horsemen.data_collection.planner import plan_downloads
+from horsemen.models import Races, Tracks, RawFiles
+from horsemen.data_collection.fetch_queue import enqueue_fetches, fetch_queued_files, get_fetch_priority, \
+    FETCH_PRIORITY_CURRENT, FETCH_PRIORITY_BACKFILL
 from datetime import datetime, timedelta
 from django.utils import timezone
 from django.db.models import Q
@@ -26,6 +40,35 @@ from django.db.models import Q
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# files waiting between each stage of the download pipeline
+PIPELINE_QUEUE_SIZE = 10
+
+# loaders parsed objects can be written with, settings.DATA_LOADING_BACKEND picks one
+LOADING_BACKENDS = {
+    'row': process_parsed_objects,
+    'bulk': bulk_process_parsed_objects
+}
+
+def load_parsed_objects(parsed_objects, backend=None):
+    """
+    Load parsed objects with the configured loading backend.
+
+    The row backend loads each top level object in its own transaction and skips
+    bad children, the bulk backend writes each model with set based upserts in one
+    transaction so a bad object rolls back the whole batch.
+
+    Args:
+        parsed_objects: List of dictionaries containing object data to parse
+        backend: row or bulk, settings.DATA_LOADING_BACKEND by default
+
+    Returns:
+        Number of children that failed and were skipped, so the load was partial
+    """
+    backend = backend or settings.DATA_LOADING_BACKEND
+    if backend not in LOADING_BACKENDS:
+        raise ValueError(f'Unknown data loading backend {backend}')
+    return LOADING_BACKENDS[backend](parsed_objects)
+
 def command_line_downloader():
 
     # Run drf first
@@ -91,65 +134,23 @@ def command_line_downloader():
             else:
                 print(f"Available Race Dates for {selected_track.name}:")
 
-                race_date_info = {}
-
-                for idx, race in enumerate(races, 1):
-
-                    # get stats on what needs to be downloaded
-                    if race.race_date not in race_date_info:
-
-                        race_date_info[race.race_date] = {
-                            'total_entries': 0,
-                            'null_id_entries': 0,
-                            'results_needed': 0,
-                            'charts_needed': 0
-                        }
-                    
-                    # Get entries with null equibase_horse_id
-                    null_id_entries = Entries.objects.filter(
-                        race=race,
-                        horse__equibase_horse_id__isnull=True
-                    )
-                    race_date_info[race.race_date]['total_entries'] += len(race.entries_set.all())
-                    race_date_info[race.race_date]['null_id_entries'] += len(null_id_entries)
-
-                    # Horse results history
-                    results_entries = Entries.objects.filter(
-                        race=race,
-                        equibase_horse_results_import=False,
-                        equibase_horse_entries_import=False,
-                        horse__equibase_horse_id__isnull=False
-                    ).select_related('horse')
-                    race_date_info[race.race_date]['results_needed'] += len(results_entries)
-
-                    # get charts
-                    # Get all horses in tomorrow's races
-                    race_horses = Horses.objects.filter(entries__race=race)
-                    
-                    # Find their past races needing charts (if this is a race in the past, you can grab the chart for it as well)
-                    past_races = Races.objects.filter(
-                        entries__horse__in=race_horses,
-                        race_date__lt=timezone.now().date(),
-                        equibase_chart_import=False
-                    ).distinct()
-                    race_date_info[race.race_date]['charts_needed'] += len(past_races)
-
-                for idx, prompted_race_date in enumerate(race_date_info.keys(), 1):
-
-                    print(f"{idx}. {prompted_race_date}: {race_date_info[prompted_race_date]['null_id_entries']}/{race_date_info[prompted_race_date]['total_entries']} null eqb ids, {race_date_info[prompted_race_date]['results_needed']} needing results, {race_date_info[prompted_race_date]['charts_needed']} past races needing charts")
+                # get stats on what needs to be downloaded
+                plan = plan_downloads(races, before_date=timezone.now().date())
+                for idx, race_day in enumerate(plan.race_days, 1):
+                    print(f"{idx}. {race_day.race_date}: {race_day.null_id_entries}/{race_day.total_entries} null eqb ids, {race_day.results_needed} needing results, {race_day.charts_needed} past races needing charts")
                 
-                print(f'{len(race_date_info.keys())+1}. ALL ')
+                print(f'{len(plan.race_days)+1}. ALL ')
 
                 # Step 4: Prompt user to select a race date
                 race_dates = None
                 while True:
                     try:
                         race_choice = int(input("Select a race date by number: "))
-                        if race_choice == (len(race_date_info.keys())+1):
-                            race_dates = race_date_info.keys()
+                        if race_choice == (len(plan.race_days)+1):
+                            race_dates = [race_day.race_date for race_day in plan.race_days]
                             break
-                        elif 1 <= race_choice <= len(race_date_info.keys()):
-                            race_date = race_date_info.keys()[race_choice - 1]
+                        elif 1 <= race_choice <= len(plan.race_days):
+                            race_date = plan.race_days[race_choice - 1].race_date
                             break
                         else:
                             print("Invalid choice. Please choose a valid race date number.")
@@ -185,86 +186,31 @@ def donwload_and_process_single_race_day(race_date, track):
     logger.info(f'Found {races.count()} races for {track.name}')
 
     # Step 1: Get race cards that have horses with null equibase_horse_id
-    cards_to_process = set()
-    for race in races:
-        # Get entries with null equibase_horse_id
-        null_id_entries = Entries.objects.filter(
-            race=race,
-            horse__equibase_horse_id__isnull=True
-        )
-        all_entries = Entries.objects.filter(
-            race=race,
-        )
-        logger.debug(f'{len(null_id_entries)} null id entries in race out of {len(all_entries)} {race.race_number} at {race.track.name}')
-        if len(null_id_entries) > 0 or len(all_entries) == 0:
-            filename = f'EQB_ENTRIES_{race.track.code}_{race.race_date.strftime("%Y%m%d")}.html'
-            url = race.track.get_equibase_entries_url_for_date(race.race_date)
-            cards_to_process.add((url,filename))
+    plan = plan_downloads(races, before_date=timezone.now().date())
+    priority = get_fetch_priority(race_date)
 
     # Download and process equibase entries in order to get equibase horse ids
-    for url, filename in cards_to_process:
+    for url, filename in plan.entries_cards:
         logger.info(f'Processing entries: {filename}')
-        scrape_url_zenrows(url, filename)
-    
-    if cards_to_process:
-        parse_equibase_files_by_type('ENTRIES')
+    download_and_process_files(plan.entries_cards, 'ENTRIES', priority=priority)
+
+    # loaded entries fill in horse ids, which changes the rest of the plan
+    if plan.entries_cards:
+        plan = plan_downloads(races, before_date=timezone.now().date())
 
     # Step 2: Get horse results (results in past for horses in these races) for entries needing them
-    horses_needing_results = set()
-    logger.info('looking for horse results')
-    for race in races:
-        entries = Entries.objects.filter(
-            race=race,
-            equibase_horse_results_import=False,
-            equibase_horse_entries_import=False,
-            horse__equibase_horse_id__isnull=False
-        ).select_related('horse')
-        
-        for entry in entries:
-            logger.debug(f'for results parsing, {entry.horse.horse_name} for race {entry.race.race_number} at {entry.race.track.name} has a results flag of {entry.equibase_horse_results_import} ')
-            horses_needing_results.add((entry.horse, entry.race.race_date))
-
-    # Download and process horse results
-    for horse, race_date in horses_needing_results:
-        url = horse.get_equibase_horse_results_url()
-        if url:
-            filename = (
-                f'EQB_HORSERESULTS_{horse.equibase_horse_id}_'
-                f'{race_date.strftime("%Y%m%d")}.html'
-            )
-            logger.info(f'Processing horse results: {filename}')
-            scrape_url_zenrows(url, filename)
-
-    if horses_needing_results:
-        parse_equibase_files_by_type('HORSERESULTS')
+    for url, filename in plan.horse_results:
+        logger.info(f'Processing horse results: {filename}')
+    download_and_process_files(plan.horse_results, 'HORSERESULTS', priority=priority)
 
-    # Step 3: Get charts for past races
-    charts_to_process = set()
-    for race in races:
-        # Get all horses in tomorrow's races
-        horses = Horses.objects.filter(entries__race=race)
-        
-        # Find their past races needing charts (if this is a race in the past, you can grab the chart for it as well)
-        past_races = Races.objects.filter(
-            entries__horse__in=horses,
-            race_date__lt=timezone.now().date(),
-            equibase_chart_import=False
-        ).distinct()
-
-        logger.info(f'found {len(past_races)} past races necessary to fill in past performance for {len(horses)} for race {race.race_number} at {race.track.name} on {race.race_date}')
-        
-        for past_race in past_races:
-            url = past_race.track.get_equibase_chart_url_for_date(past_race.race_date)
-            filename = f'EQB_CHART_{past_race.track.code}_{past_race.race_date.strftime("%Y%m%d")}.pdf'
-            charts_to_process.add((url, filename))
+    # loaded results add the horses' past races
+    if plan.horse_results:
+        plan = plan_downloads(races, before_date=timezone.now().date())
 
-    # Download and process charts
-    for url, filename in charts_to_process:
+    # Step 3: Get charts for past races
+    for url, filename in plan.charts:
         logger.info(f'Processing chart: {filename}')
-        scrape_url_zenrows(url, filename)
-
-    if charts_to_process:
-        parse_equibase_files_by_type('CHART')
+    download_and_process_files(plan.charts, 'CHART', priority=priority)
 
     logger.info('Completed downloading and processing all required Equibase files')
 
@@ -295,93 +241,48 @@ def download_equibase_files_for_tomorrow_and_yesterday():
     logger.info(f'Found {races.count()} races tomorrow or yesterday')
 
     # Step 1: Get race cards that have horses with null equibase_horse_id
-    cards_to_process = set()
-    for race in races:
-        # Get entries with null equibase_horse_id
-        null_id_entries = Entries.objects.filter(
-            race=race,
-            horse__equibase_horse_id__isnull=True
-        )
-        logger.debug(f'{len(null_id_entries)} null id entries in race {race.race_number} at {race.track.name}')
-        if len(null_id_entries) > 0:
-            filename = f'EQB_ENTRIES_{race.track.code}_{race.race_date.strftime("%Y%m%d")}.html'
-            url = race.track.get_equibase_entries_url_for_date(race.race_date)
-            cards_to_process.add((url,filename))
-
+    plan = plan_downloads(races, before_date=tomorrow, include_empty_cards=False)
 
     # Download and process entries
-    for url, filename in cards_to_process:
+    for url, filename in plan.entries_cards:
         logger.info(f'Processing entries: {filename}')
-        scrape_url_zenrows(url, filename)
+    fetch_files(plan.entries_cards, 'ENTRIES', FETCH_PRIORITY_CURRENT)
     
-    if cards_to_process:
+    if plan.entries_cards:
         parse_equibase_files_by_type('ENTRIES')
 
-    # Step 2: Get horse results for entries needing them
-    horses_needing_results = set()
-    logger.info('looking for horse results')
-    for race in races:
-        entries = Entries.objects.filter(
-            race=race,
-            equibase_horse_results_import=False,
-            equibase_horse_entries_import=False,
-            horse__equibase_horse_id__isnull=False
-        ).select_related('horse')
-        
-        for entry in entries:
-            logger.debug(f'for results parsing, {entry.horse.horse_name} for race {entry.race.race_number} at {entry.race.track.name} has a results flag of {entry.equibase_horse_results_import} ')
-            horses_needing_results.add((entry.horse, entry.race.race_date))
-
-    # Download and process horse results
-    for horse, race_date in horses_needing_results:
-        url = horse.get_equibase_horse_results_url()
-        if url:
-            filename = (
-                f'EQB_HORSERESULTS_{horse.equibase_horse_id}_'
-                f'{race_date.strftime("%Y%m%d")}.html'
-            )
-            logger.info(f'Processing horse results: {filename}')
-            scrape_url_zenrows(url, filename)
-
-    if horses_needing_results:
+        # loaded entries fill in horse ids, which changes the rest of the plan
+        plan = plan_downloads(races, before_date=tomorrow, include_empty_cards=False)
+
+    # Step 2: Download and process horse results for entries needing them
+    for url, filename in plan.horse_results:
+        logger.info(f'Processing horse results: {filename}')
+    fetch_files(plan.horse_results, 'HORSERESULTS', FETCH_PRIORITY_CURRENT)
+
+    if plan.horse_results:
         parse_equibase_files_by_type('HORSERESULTS')
 
-    # Step 3: Get charts for past races
-    charts_to_process = set()
-    for race in races:
-        # Get all horses in tomorrow's races
-        horses = Horses.objects.filter(entries__race=race)
-        
-        # Find their past races needing charts
-        past_races = Races.objects.filter(
-            entries__horse__in=horses,
-            race_date__lt=tomorrow,
-            equibase_chart_import=False
-        ).distinct()
-
-        logger.info(f'found {len(past_races)} past races necessary to fill in past performance for {len(horses)} for race {race.race_number} at {race.track.name} on {race.race_date}')
-        
-        for past_race in past_races:
-            url = past_race.track.get_equibase_chart_url_for_date(past_race.race_date)
-            filename = f'EQB_CHART_{past_race.track.code}_{past_race.race_date.strftime("%Y%m%d")}.pdf'
-            charts_to_process.add((url, filename))
+        # loaded results add the horses' past races
+        plan = plan_downloads(races, before_date=tomorrow, include_empty_cards=False)
 
-    # Download and process charts
-    for url, filename in charts_to_process:
+    # Step 3: Download and process charts for past races
+    for url, filename in plan.charts:
         logger.info(f'Processing chart: {filename}')
-        scrape_url_zenrows(url, filename)
+    fetch_files(plan.charts, 'CHART', FETCH_PRIORITY_CURRENT)
 
-    if charts_to_process:
+    if plan.charts:
         parse_equibase_files_by_type('CHART')
 
     logger.info('Completed downloading and processing all required Equibase files')
 
-def parse_equibase_files():
-    """Parse Equibase files from the scraping folder."""
-    # Create processed folder
-    processed_folder = SCRAPING_FOLDER / 'processed'
-    processed_folder.mkdir(exist_ok=True)
+def parse_equibase_files(parallel=False, max_workers=None):
+    """
+    Parse Equibase files from the scraping folder.
 
+    Args:
+        parallel: Extract CHART files in a process pool after the other files are loaded
+        max_workers: Chart extraction processes when parallel, one per core by default
+    """
     for file_path in SCRAPING_FOLDER.iterdir():
         logger.info('Processing %s from %s', file_path.name, file_path)
         if not file_path.is_file() or 'EQB' not in file_path.name:
@@ -390,28 +291,37 @@ def parse_equibase_files():
         if 'ENTRIES' in file_path.name:
             extracted_data = parse_equibase_entries(file_path)
             objects_to_load = parse_extracted_entries_data(extracted_data)
-            process_parsed_objects(objects_to_load)
-            file_path.rename(processed_folder / file_path.name)
+            load_parsed_objects(objects_to_load)
+            archive_raw_file(file_path)
 
         elif 'HORSERESULTS' in file_path.name:
             extracted_data = parse_equibase_horse_results(file_path)
             objects_to_load = parse_extracted_horse_results_data(extracted_data)
-            process_parsed_objects(objects_to_load)
-            file_path.rename(processed_folder / file_path.name)
+            load_parsed_objects(objects_to_load)
+            archive_raw_file(file_path)
 
-        elif 'CHART' in file_path.name and '.pdf' in file_path.name:
+        elif 'CHART' in file_path.name and '.pdf' in file_path.name and not parallel:
             extracted_data = parse_equibase_chart(file_path, False)
             objects_to_load = parse_extracted_chart_data(extracted_data)
-            process_parsed_objects(objects_to_load)
-            try:
-                file_path.rename(processed_folder / file_path.name)
-            except PermissionError as p:
-                logger.error('Could not delete %s due to permission error %s', file_path.name, p)
+            load_parsed_objects(objects_to_load)
+            archive_raw_file(file_path)
 
-def parse_equibase_files_by_type(file_type, debug_flag = False):
-    """Parse specific type of Equibase files from the scraping folder."""
-    processed_folder = SCRAPING_FOLDER / 'processed'
-    processed_folder.mkdir(exist_ok=True)
+    if parallel:
+        parse_equibase_chart_files_in_parallel(max_workers=max_workers)
+
+def parse_equibase_files_by_type(file_type, debug_flag = False, parallel = False, max_workers = None):
+    """
+    Parse specific type of Equibase files from the scraping folder.
+
+    Args:
+        file_type: ENTRIES, HORSERESULTS or CHART
+        debug_flag: Write the extracted data next to each file as json
+        parallel: Extract CHART files in a process pool (see parse_equibase_chart_files_in_parallel)
+        max_workers: Chart extraction processes when parallel, one per core by default
+    """
+    if parallel and file_type == 'CHART':
+        parse_equibase_chart_files_in_parallel(debug_flag, max_workers)
+        return
 
     for file_path in SCRAPING_FOLDER.iterdir():
 
@@ -421,54 +331,276 @@ def parse_equibase_files_by_type(file_type, debug_flag = False):
                 continue
 
             if file_type in file_path.name:
-                logger.info('Processing %s from %s', file_path.name, file_path)
-                processed = False
-                
-                if file_type == 'ENTRIES':
-                    extracted_data = parse_equibase_entries(file_path)
-                    objects_to_load = parse_extracted_entries_data(extracted_data)
-                    processed = True
-                elif file_type == 'HORSERESULTS':
-                    extracted_data = parse_equibase_horse_results(file_path)
-                    objects_to_load = parse_extracted_horse_results_data(extracted_data)
-                    processed = True
-                elif file_type == 'CHART' and '.pdf' in file_path.name:
-                    extracted_data = parse_equibase_chart(file_path, debug=debug_flag)
-                    objects_to_load = parse_extracted_chart_data(extracted_data)
-                    processed = True
-                else:
+
+                # chart debug json sits next to the pdf, byte identical files dont need parsing again
+                if file_type == 'CHART' and '.pdf' not in file_path.name:
+                    continue
+                raw_file = store_unparsed_raw_file(file_path)
+                if raw_file is None:
                     continue
 
-                process_parsed_objects(objects_to_load)
+                logger.info('Processing %s from %s', file_path.name, file_path)
+                objects_to_load = extract_equibase_file(file_path, file_type, debug_flag)
+                load_parsed_objects(objects_to_load)
 
-                # Move processed files to processed folder
-                if processed:
-                    try:
-                        file_path.rename(processed_folder / file_path.name)
-                    except PermissionError as p:
-                        logger.error('Could not delete %s due to permission error %s', file_path.name, p)
-                    except WindowsError as p:
-                        logger.error('Could not delete %s due to windows error %s', file_path.name, p)
+                # Move processed files to the raw store
+                archive_raw_file(file_path, raw_file=raw_file)
         except Exception as e:
             logger.error(f'eror parsing {file_path.name}: {e}')
 
+def parse_extracted_equibase_data(extracted_data, file_type):
+    """Parse an Equibase file's extracted data into objects to load."""
+    if file_type == 'ENTRIES':
+        return parse_extracted_entries_data(extracted_data)
+    elif file_type == 'HORSERESULTS':
+        return parse_extracted_horse_results_data(extracted_data)
+    elif file_type == 'CHART':
+        return parse_extracted_chart_data(extracted_data)
+    raise ValueError(f'Unknown equibase file type {file_type}')
+
+def extract_equibase_file(file_path, file_type, debug_flag=False):
+    """Extract and parse an Equibase file into objects to load, runs in a worker process."""
+    extracted_data = extract_with_cache(file_path, file_type, debug_flag)
+    return parse_extracted_equibase_data(extracted_data, file_type)
+
+def reprocess_raw_files(file_type):
+    """
+    Load every parsed file of a type in the raw store again, oldest first.
+
+    Extraction comes from the extraction cache when the file and extractor havent
+    changed, so changes to the data parsers and loader can be rerun over history
+    without redoing the pdf and html parsing.
+
+    Args:
+        file_type: ENTRIES, HORSERESULTS or CHART
+    """
+    raw_files = RawFiles.objects.filter(
+        source=f'EQB_{file_type}',
+        status=RAW_FILE_PARSED
+    ).order_by('file_date', 'id')
+
+    for raw_file in raw_files.iterator():
+        try:
+            logger.info('Reprocessing %s', raw_file.key)
+            extracted_data = extract_raw_file_with_cache(raw_file, file_type)
+            load_parsed_objects(parse_extracted_equibase_data(extracted_data, file_type))
+        except Exception as e:
+            logger.error(f'eror reprocessing {raw_file.key}: {e}')
+
+def parse_equibase_chart_files_in_parallel(debug_flag=False, max_workers=None):
+    """
+    Parse Equibase chart pdfs from the scraping folder using a process pool.
+
+    The CPU bound pdf extraction and parsing runs in worker processes (one per core
+    by default) while this process loads the results one file at a time, in file
+    order, and moves each file to the raw store once it is loaded.
+    """
+    raw_files = {}
+    for file_path in SCRAPING_FOLDER.iterdir():
+        if file_path.is_file() and 'EQB' in file_path.name and 'CHART' in file_path.name and '.pdf' in file_path.name:
+            raw_file = store_unparsed_raw_file(file_path)
+            if raw_file is not None:
+                raw_files[file_path] = raw_file
+    if not raw_files:
+        return
+
+    # workers only read the pdf and read or write the extraction cache on disk,
+    # django.setup is just for importing the parsers, so dont let them inherit
+    # our database connections
+    connections.close_all()
+
+    max_workers = max_workers or os.cpu_count()
+    logger.info('Extracting %s charts with %s workers', len(raw_files), max_workers)
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=django.setup) as executor:
+        futures = [
+            executor.submit(extract_equibase_file, file_path, 'CHART', debug_flag)
+            for file_path in raw_files
+        ]
+
+        # single writer
+        for (file_path, raw_file), future in zip(raw_files.items(), futures):
+            try:
+                objects_to_load = future.result()
+                logger.info('Processing %s from %s', file_path.name, file_path)
+                load_parsed_objects(objects_to_load)
+                archive_raw_file(file_path, raw_file=raw_file)
+            except Exception as e:
+                logger.error(f'eror parsing {file_path.name}: {e}')
+
+
+def fetch_files(url_filenames, file_type, priority=FETCH_PRIORITY_BACKFILL):
+    """
+    Queue Equibase files and download them.
+
+    Args:
+        url_filenames: Iterable of (url, filename) tuples
+        file_type: ENTRIES, HORSERESULTS or CHART
+        priority: Queue priority, higher is downloaded first
+    """
+    url_filenames = list(url_filenames)
+    filenames = [filename for url, filename in url_filenames]
+    if not enqueue_fetches(url_filenames, file_type, priority):
+        return
+    for _ in fetch_queued_files([file_type], filenames=filenames):
+        pass
+
+
+def download_and_process_files(url_filenames, file_type, debug_flag=False, max_workers=None, priority=FETCH_PRIORITY_BACKFILL):
+    """
+    Download, extract and load a batch of Equibase files as a pipeline.
+
+    Each file goes to extraction as soon as it is downloaded and is loaded as soon as
+    it is extracted, so downloads, cpu bound parsing in worker processes and database
+    writes overlap. Bounded queues between the stages keep a fast stage from running
+    too far ahead of a slow one.
+
+    The files go through the fetch queue, so other collector processes draining it
+    share the downloads. Only this batch's files are downloaded here, the rest of
+    the queue is left to process_queued_files.
+
+    Args:
+        url_filenames: Iterable of (url, filename) tuples
+        file_type: ENTRIES, HORSERESULTS or CHART
+        debug_flag: Write extracted chart data next to each file as json
+        max_workers: Extraction processes, defaults to one per core
+        priority: Queue priority, higher is downloaded first
+    """
+    url_filenames = list(url_filenames)
+    filenames = [filename for url, filename in url_filenames]
+    if not enqueue_fetches(url_filenames, file_type, priority):
+        return
+    process_queued_files(file_type, debug_flag, max_workers, filenames)
+
+
+def process_queued_files(file_type, debug_flag=False, max_workers=None, filenames=None):
+    """
+    Download, extract and load queued Equibase files of a type, see download_and_process_files.
+
+    Without filenames this drains every ready file of the type, for worker processes
+    sharing the fetch queue.
+
+    Args:
+        file_type: ENTRIES, HORSERESULTS or CHART
+        debug_flag: Write extracted chart data next to each file as json
+        max_workers: Extraction processes, defaults to one per core
+        filenames: Only download these files, the whole queue if None
+    """
+    downloaded_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    extracting_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+
+    # set when a stage fails so the download stage stops claiming files
+    stopping = threading.Event()
+
+    # spawn so workers dont fork from a process with download threads running
+    with ProcessPoolExecutor(
+        max_workers=max_workers or os.cpu_count(),
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=django.setup
+    ) as executor:
+
+        # stage 1: download queued files, passing each one on when it lands, files
+        # still claimed when it stops are claimed again once their claims go stale
+        def download():
+            try:
+                for file_path in fetch_queued_files([file_type], filenames=filenames):
+                    downloaded_queue.put(file_path)
+                    if stopping.is_set():
+                        break
+                downloaded_queue.put(None)
+            except Exception as e:
+                logger.exception('Download stage failed for %s files', file_type)
+                downloaded_queue.put(e)
+            finally:
+                connections.close_all()
+
+        # stage 2: hand downloaded files that havent been parsed before to the extraction processes
+        def extract():
+            try:
+                while (file_path := downloaded_queue.get()) is not None:
+                    if isinstance(file_path, Exception):
+                        # pass the download stage's error on to be raised
+                        extracting_queue.put(file_path)
+                        return
+                    raw_file = store_unparsed_raw_file(file_path)
+                    if raw_file is None:
+                        continue
+                    extracting_queue.put((file_path, raw_file, executor.submit(extract_equibase_file, file_path, file_type, debug_flag)))
+                extracting_queue.put(None)
+            except Exception as e:
+                logger.exception('Extract stage failed for %s files', file_type)
+                stopping.set()
+                extracting_queue.put(e)
+
+                # let the download stage finish instead of blocking on a full queue
+                while not (file_path is None or isinstance(file_path, Exception)):
+                    file_path = downloaded_queue.get()
+            finally:
+                connections.close_all()
+
+        threading.Thread(target=download, daemon=True).start()
+        threading.Thread(target=extract, daemon=True).start()
+
+        # stage 3: load extracted files here so there is a single database writer,
+        # a stage that failed has its error raised once the files before it are loaded
+        while (item := extracting_queue.get()) is not None:
+            if isinstance(item, Exception):
+                raise item
+            file_path, raw_file, future = item
+            try:
+                objects_to_load = future.result()
+                logger.info('Processing %s from %s', file_path.name, file_path)
+                load_parsed_objects(objects_to_load)
+                archive_raw_file(file_path, raw_file=raw_file)
+            except Exception as e:
+                logger.error(f'eror parsing {file_path.name}: {e}')
+
+
+def load_drf_cards(objects_by_url, response_cache):
+    """
+    Load each DRF card on its own and save the validators of the ones that loaded whole.
+
+    A card that fails, or loads with skipped children, is discarded from the response
+    cache so its json is fetched and loaded in full again on the next run.
+
+    Args:
+        objects_by_url: Parsed objects of each card keyed by its url
+        response_cache: DrfResponseCache the cards were fetched with
+    """
+    for url, objects_to_load in objects_by_url.items():
+        try:
+            skipped_count = load_parsed_objects(objects_to_load)
+        except Exception as e:
+            logger.error(f'eror loading {url}: {e}')
+            response_cache.discard(url)
+            continue
+        if skipped_count:
+            logger.warning('Skipped %s objects loading %s, it will be loaded again next run', skipped_count, url)
+            response_cache.discard(url)
+    response_cache.save()
 
 def drf_run():
-    """Run DRF data collection process."""
+    """Run DRF data collection process, skipping json that hasnt changed since it was last loaded."""
+    response_cache = DrfResponseCache()
+
     # Run tracks
-    objects_to_load = fetch_tracks_data()
-    process_parsed_objects(objects_to_load)
+    objects_to_load = fetch_tracks_data(response_cache)
+    load_parsed_objects(objects_to_load)
+    response_cache.save()
 
     # Get entries
-    objects_to_load = get_entries_data()
-    process_parsed_objects(objects_to_load)
+    load_drf_cards(get_entries_data(response_cache), response_cache)
 
     # Get results
-    objects_to_load = get_results_data()
-    process_parsed_objects(objects_to_load)
+    load_drf_cards(get_results_data(response_cache), response_cache)
+
+def single_run(parallel=False, max_workers=None):
+    """
+    Run a single data collection cycle.
 
-def single_run():
-    """Run a single data collection cycle."""
+    Args:
+        parallel: Extract the downloaded charts in a process pool, for backfills
+        max_workers: Chart extraction processes when parallel, one per core by default
+    """
     # Get entries files
     get_equibase_entries_files()
     parse_equibase_files()
@@ -479,7 +611,7 @@ def single_run():
 
     # Get charts for completed races
     get_equibase_chart_files()
-    parse_equibase_files()
+    parse_equibase_files(parallel, max_workers)
 
 def collect_all_data_sequentially():
     """
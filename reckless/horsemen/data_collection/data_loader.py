@@ -4,9 +4,11 @@ Handles parsing of tracks, races, horses, entries, and related data.
 """
 
 import logging
+from collections import defaultdict
+from contextvars import ContextVar
 from typing import Optional, Dict, Any, List, Union
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
-from django.db.models import Q
+from django.db import transaction
 from horsemen.data_collection.utils import (
     create_fractional_data_from_array_and_object,
     get_point_of_call_object_from_furlongs,
@@ -17,11 +19,183 @@ from horsemen.models import (
     Jockeys, PointsOfCall, Payoffs, Entries, Workouts
 )
 from horsemen.constants import FURLONGS_PER_FEET
-from fuzzywuzzy import process, fuzz
+from fuzzywuzzy import fuzz
+from horsemen.data_collection.matching import get_track_name_matcher, get_track_names_key
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# identifiers the parsers look up each model by, preloaded for every load session
+IDENTITY_FIELDS = {
+    'track': ['code', 'name'],
+    'horse': ['registration_number', 'equibase_horse_id', 'horse_name'],
+    'trainer': ['drf_trainer_id', 'equibase_trainer_id', 'last_name'],
+    'jockey': ['drf_jockey_id', 'equibase_jockey_id', 'last_name']
+}
+IDENTITY_LOAD_BATCH_SIZE = 1000
+
+
+class IdentityMap:
+    """
+    Identity map of tracks, horses, trainers and jockeys for one load session.
+
+    Every row is held as a single instance per primary key, so changes made while
+    loading are seen by later lookups. Rows are loaded in bulk by identifier up front
+    and lookups on a loaded identifier are answered from memory.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        """Forget every row, used when a rollback may have undone changes to them."""
+        # model -> pk -> instance
+        self.instances = defaultdict(dict)
+        # (model, field) -> values whose rows are all in instances
+        self.loaded_values = defaultdict(set)
+        # models with every row in instances
+        self.loaded_models = set()
+
+    def clean_value(self, model, field, value):
+        return model._meta.get_field(field).to_python(value)
+
+    def add(self, instance):
+        """Add an instance, returning the instance already held for its row if there is one."""
+        return self.instances[type(instance)].setdefault(instance.pk, instance)
+
+    def load_all(self, model):
+        """Load every row of a small table."""
+        if model in self.loaded_models:
+            return
+        for instance in model.objects.all():
+            self.add(instance)
+        self.loaded_models.add(model)
+
+    def load(self, model, field, values):
+        """Load every row whose field is one of values."""
+        if model in self.loaded_models:
+            return
+        cleaned_values = set()
+        for value in values:
+            try:
+                cleaned_values.add(self.clean_value(model, field, value))
+            except ValidationError:
+                continue
+        cleaned_values = list(cleaned_values - self.loaded_values[(model, field)] - {None, ''})
+        for i in range(0, len(cleaned_values), IDENTITY_LOAD_BATCH_SIZE):
+            batch = cleaned_values[i:i+IDENTITY_LOAD_BATCH_SIZE]
+            for instance in model.objects.filter(**{f'{field}__in': batch}):
+                self.add(instance)
+        self.loaded_values[(model, field)].update(cleaned_values)
+
+    def matches(self, instance, lookup):
+        for key, value in lookup.items():
+            field, _, operator = key.partition('__')
+            current_value = getattr(instance, field)
+            if operator == 'startswith':
+                if current_value is None or not current_value.startswith(value):
+                    return False
+            elif current_value != value:
+                return False
+        return True
+
+    def get(self, model, **lookup):
+        """
+        Same as model.objects.filter(**lookup).first(), supports exact and
+        startswith lookups.
+        """
+        try:
+            cleaned_lookup = {}
+            for key, value in lookup.items():
+                field, _, operator = key.partition('__')
+                cleaned_lookup[key] = value if operator else self.clean_value(model, field, value)
+        except ValidationError:
+            cleaned_lookup = None
+
+        # answer from memory when every candidate row is loaded
+        if cleaned_lookup is not None and (model in self.loaded_models or any(
+            '__' not in key and value in self.loaded_values[(model, key)]
+            for key, value in cleaned_lookup.items()
+        )):
+            matches = [
+                instance for pk, instance in sorted(self.instances[model].items())
+                if self.matches(instance, cleaned_lookup)
+            ]
+            return matches[0] if matches else None
+
+        instance = model.objects.filter(**lookup).first()
+        if instance:
+            instance = self.add(instance)
+        return instance
+
+    def preload(self, parsed_objects):
+        """Load the rows for every identifier found in the parsed objects."""
+        identifiers = defaultdict(set)
+
+        def collect(parsed_object):
+            if isinstance(parsed_object, list):
+                for child in parsed_object:
+                    collect(child)
+            elif isinstance(parsed_object, dict):
+                object_type = parsed_object.get('object_type')
+                for field in IDENTITY_FIELDS.get(object_type, []):
+                    if field in parsed_object and parsed_object[field] is not None:
+                        identifiers[(object_type, field)].add(parsed_object[field])
+                for value in parsed_object.values():
+                    if isinstance(value, (dict, list)):
+                        collect(value)
+        collect(parsed_objects)
+
+        self.load_all(Tracks)
+        for (object_type, field), values in identifiers.items():
+            self.load(IDENTITY_MODELS[object_type], field, values)
+
+
+# identity map of the load session in progress, None outside of process_parsed_objects
+current_identity_map: ContextVar[Optional[IdentityMap]] = ContextVar('current_identity_map', default=None)
+
+# children skipped by the load in progress, None outside of process_parsed_objects
+current_skipped_children: ContextVar[Optional[List[Dict[str, Any]]]] = ContextVar('current_skipped_children', default=None)
+
+
+def find_instance(model, **lookup):
+    """Look up the first matching row, from the current load session's identity map when there is one."""
+    identity_map = current_identity_map.get()
+    if identity_map is None:
+        return model.objects.filter(**lookup).first()
+    return identity_map.get(model, **lookup)
+
+
+def remember_instance(instance):
+    """Add an instance to the current load session's identity map, returning the instance to use."""
+    identity_map = current_identity_map.get()
+    if identity_map is None or instance is None:
+        return instance
+    return identity_map.add(instance)
+
+
+def attach_related_instances(instance, field_names):
+    """Point foreign keys at rows in the current load session's identity map so following them doesnt query."""
+    identity_map = current_identity_map.get()
+    if identity_map is None or instance is None:
+        return
+    for field_name in field_names:
+        field = instance._meta.get_field(field_name)
+        related_instance = identity_map.instances[field.related_model].get(getattr(instance, field.attname))
+        if related_instance is not None:
+            setattr(instance, field_name, related_instance)
+
+
+def save_instance(instance):
+    """Save an instance, putting back its saved values if the save fails so the identity map matches the database."""
+    try:
+        instance.save()
+    except Exception:
+        if instance.pk and current_identity_map.get() is not None:
+            instance.refresh_from_db()
+        raise
+
+
 def parse_track(track_data: Dict[str, Any]) -> Tracks:
     """
     Parse track data and return corresponding Tracks model instance.
@@ -41,24 +215,26 @@ def parse_track(track_data: Dict[str, Any]) -> Tracks:
         # Try to find track by code first, then by name
         track = None
         if 'code' in track_data:
-            track = Tracks.objects.filter(code=track_data['code']).first()
+            track = find_instance(Tracks, code=track_data['code'])
         if not track and 'name' in track_data:
-            track = Tracks.objects.filter(name=track_data['name']).first()
+            track = find_instance(Tracks, name=track_data['name'])
 
             if not track:
                 # use a fuzzy search on track names
 
                 # Retrieve all track names from the database
-                track_names = list(Tracks.objects.values_list('name', flat=True))
+                identity_map = current_identity_map.get()
+                if identity_map is None:
+                    track_names = list(Tracks.objects.values_list('name', flat=True))
+                else:
+                    track_names = [instance.name for instance in identity_map.instances[Tracks].values()]
 
-                # Use fuzzywuzzy to find the closest match
-                closest_match, match_score = process.extractOne(track_data['name'], track_names)
-                
-                # Check if the match score meets the threshold
-                if match_score >= 80:
-                    track = Tracks.objects.filter(name=closest_match).first()
+                # find the closest match that meets the threshold
+                closest_match = get_track_name_matcher(get_track_names_key(track_names)).match(track_data['name'])
+                if closest_match:
+                    track = find_instance(Tracks, name=closest_match)
                 else:
-                    logger.error(f'in store_race_info_in_table, {track_data['name']} doesnt match existing tracks with fuzzywuzzy')
+                    logger.error(f'in store_race_info_in_table, {track_data['name']} doesnt match existing tracks with fuzzy matching')
 
         if track:
             return track
@@ -70,7 +246,7 @@ def parse_track(track_data: Dict[str, Any]) -> Tracks:
                     name = track_data['code'],
                     country = 'USA'
                 )
-                return track
+                return remember_instance(track)
             else:
                 raise ValueError(f'No matching track found for data: {track_data}')
 
@@ -78,6 +254,20 @@ def parse_track(track_data: Dict[str, Any]) -> Tracks:
         logger.error("Error parsing track: %s", e)
         raise
 
+# race fields copied from parsed race data
+RACE_UPDATE_FIELDS = [
+    'drf_tracks_import', 'day_evening',
+    'drf_entries_import', 'post_time', 'age_restriction',
+    'sex_restriction', 'minimum_claiming_price',
+    'maximum_claiming_price', 'distance', 'purse',
+    'wager_text', 'breed', 'cancelled',
+    'race_surface', 'drf_results_import',
+    'condition', 'off_time',
+    'equibase_entries_import', 'equibase_chart_import',
+    'race_type', 'race_name', 'grade',
+    'record_horse_name', 'record_time', 'record_date', 'hurdles',
+]
+
 def parse_race(race_data: Dict[str, Any]) -> Races:
     """
     Parse race data and return corresponding Races model instance.
@@ -117,25 +307,13 @@ def parse_race(race_data: Dict[str, Any]) -> Races:
 
         # Update fields if changed
         changed = False
-        update_fields = [
-            'drf_tracks_import', 'day_evening',
-            'drf_entries_import', 'post_time', 'age_restriction',
-            'sex_restriction', 'minimum_claiming_price',
-            'maximum_claiming_price', 'distance', 'purse',
-            'wager_text', 'breed', 'cancelled',
-            'race_surface', 'drf_results_import',
-            'condition', 'off_time',
-            'equibase_entries_import', 'equibase_chart_import',
-            'race_type', 'race_name', 'grade',
-            'record_horse_name', 'record_time', 'record_date', 'hurdles',
-        ]
 
         # non-standard processing
         if 'post_time_string' in race_data:
             race_data['post_time'] = get_post_time_from_drf(race.track, race.race_date, race_data['post_time_string'])
         
         # standard processing
-        for field in update_fields:
+        for field in RACE_UPDATE_FIELDS:
             if field in race_data:
                 current_value = getattr(race, field)
                 new_value = race_data[field]
@@ -150,9 +328,7 @@ def parse_race(race_data: Dict[str, Any]) -> Races:
     
         # Process children
         if 'children' in race_data:
-            for child in race_data['children']:
-                if child['object_type'] in OBJECT_MAP:
-                    OBJECT_MAP[child['object_type']](child, race)
+            process_child_objects(race_data['children'], race)
     
         return race
 
@@ -193,7 +369,7 @@ def parse_horse(horse_data: Dict[str, Any], existing_instance: Optional[Horses]
             ]
             for field, lookup in identifiers:
                 if not horse and field in horse_data:
-                    horse = Horses.objects.filter(**{lookup: horse_data[field]}).first()
+                    horse = find_instance(Horses, **{lookup: horse_data[field]})
 
         # Create new horse if needed
         if not horse:
@@ -204,6 +380,7 @@ def parse_horse(horse_data: Dict[str, Any], existing_instance: Optional[Horses]
             logger.info("Created new horse: %s", horse)
         else:
             logger.info("Found existing horse: %s", horse)
+        horse = remember_instance(horse)
 
         # Update attributes
         changed = False
@@ -216,7 +393,7 @@ def parse_horse(horse_data: Dict[str, Any], existing_instance: Optional[Horses]
                     logger.debug(f"Updated '%s' for horse from %s to %s: %s", key, old_value, value, horse)
         
         if changed:
-            horse.save()
+            save_instance(horse)
             
         return horse
 
@@ -260,21 +437,25 @@ def parse_trainer(trainer_data: Dict[str, Any], existing_instance: Optional[Trai
                 if not trainer:
                     if isinstance(fields, list):
                         if all(f in trainer_data for f in fields):
-                            trainer = Trainers.objects.filter(**lookup(trainer_data)).first()
+                            trainer = find_instance(Trainers, **lookup(trainer_data))
                     elif fields in trainer_data:
-                        trainer = Trainers.objects.filter(**{fields: trainer_data[fields]}).first()
+                        trainer = find_instance(Trainers, **{fields: trainer_data[fields]})
         
         # custom first initial search
         if not trainer and 'last_name' in trainer_data and trainer_data['last_name'] != '':
             if 'first_initials' in trainer_data:
-                trainer = Trainers.objects.filter(
-                    Q(last_name=trainer_data['last_name']) & Q(first_name__startswith=trainer_data['first_initials'][0])
-                ).first()
+                trainer = find_instance(
+                    Trainers,
+                    last_name=trainer_data['last_name'],
+                    first_name__startswith=trainer_data['first_initials'][0]
+                )
             if not trainer and 'first_name' in trainer_data:
                 if trainer_data['last_name'] != '' and trainer_data['first_name'] != '':
-                    trainer = Trainers.objects.filter(
-                        Q(last_name=trainer_data['last_name']) & Q(first_initials__startswith=trainer_data['first_name'][0])
-                    ).first()
+                    trainer = find_instance(
+                        Trainers,
+                        last_name=trainer_data['last_name'],
+                        first_initials__startswith=trainer_data['first_name'][0]
+                    )
 
         # Create new trainer if needed
         if not trainer:
@@ -296,6 +477,7 @@ def parse_trainer(trainer_data: Dict[str, Any], existing_instance: Optional[Trai
             logger.info("Created new trainer: %s", trainer)
         else:
             logger.info("Found existing trainer: %s", trainer)
+        trainer = remember_instance(trainer)
 
         # Update attributes
         changed = False
@@ -307,7 +489,7 @@ def parse_trainer(trainer_data: Dict[str, Any], existing_instance: Optional[Trai
                     logger.debug("Updated '%s' for trainer: %s", key, trainer)
         
         if changed:
-            trainer.save()
+            save_instance(trainer)
             
         return trainer
 
@@ -351,20 +533,24 @@ def parse_jockey(jockey_data: Dict[str, Any], existing_instance: Optional[Jockey
                 if not jockey:
                     if isinstance(fields, list):
                         if all(f in jockey_data for f in fields):
-                            jockey = Jockeys.objects.filter(**lookup(jockey_data)).first()
+                            jockey = find_instance(Jockeys, **lookup(jockey_data))
                     elif fields in jockey_data:
-                        jockey = Jockeys.objects.filter(**{fields: jockey_data[fields]}).first()
+                        jockey = find_instance(Jockeys, **{fields: jockey_data[fields]})
 
         # custom first initial search
         if not jockey and 'last_name' in jockey_data and jockey_data['last_name'] != '':
             if 'first_initials' in jockey_data:
-                jockey = Jockeys.objects.filter(
-                    Q(last_name=jockey_data['last_name']) & Q(first_name__startswith=jockey_data['first_initials'][0])
-                ).first()
+                jockey = find_instance(
+                    Jockeys,
+                    last_name=jockey_data['last_name'],
+                    first_name__startswith=jockey_data['first_initials'][0]
+                )
             if not jockey and 'first_name' in jockey_data:
-                jockey = Jockeys.objects.filter(
-                    Q(last_name=jockey_data['last_name']) & Q(first_initials__startswith=jockey_data['first_name'][0])
-                ).first()
+                jockey = find_instance(
+                    Jockeys,
+                    last_name=jockey_data['last_name'],
+                    first_initials__startswith=jockey_data['first_name'][0]
+                )
 
         # Create new jockey if needed
         if not jockey:
@@ -384,6 +570,7 @@ def parse_jockey(jockey_data: Dict[str, Any], existing_instance: Optional[Jockey
             logger.info("Created new jockey: %s", jockey)
         else:
             logger.info("Found existing jockey: %s", jockey)
+        jockey = remember_instance(jockey)
 
         # Update attributes
         changed = False
@@ -395,7 +582,7 @@ def parse_jockey(jockey_data: Dict[str, Any], existing_instance: Optional[Jockey
                     logger.debug("Updated '%s' for jockey: %s", key, jockey)
         
         if changed:
-            jockey.save()
+            save_instance(jockey)
             
         return jockey
 
@@ -432,6 +619,7 @@ def parse_entry(entry_data: Dict[str, Any], parent_object: Optional[Races] = Non
                 race=race,
                 program_number=entry_data['program_number']
             ).first()
+            attach_related_instances(entry, ['horse', 'jockey', 'trainer'])
             
             # Validate horse hasn't changed
             if entry and 'horse' in entry_data:
@@ -502,9 +690,7 @@ def parse_entry(entry_data: Dict[str, Any], parent_object: Optional[Races] = Non
             
         # Process children
         if 'children' in entry_data:
-            for child in entry_data['children']:
-                if child['object_type'] in OBJECT_MAP:
-                    OBJECT_MAP[child['object_type']](child, entry)
+            process_child_objects(entry_data['children'], entry)
 
         return entry
 
@@ -634,6 +820,9 @@ def parse_fractional_time(
         
         if changed:
             fractional_time.save()
+
+            # the race's split call velocities need to be calculated again
+            Entries.objects.filter(race=race).update(split_call_velocities_calculated=False)
             
         return fractional_time
 
@@ -641,6 +830,83 @@ def parse_fractional_time(
         logger.error("Error parsing fractional time: %s", e)
         raise
 
+def get_call_for_point_of_call(race: Races, point_of_call_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Get the call a point of call's line index refers to for the race's distance and breed.
+
+    Raises:
+        ValueError: If the race distance has no calls or the line index is out of range
+    """
+    # Get point of call object based on distance if available
+    point_of_call_object = get_point_of_call_object_from_furlongs(
+        race.distance,
+        quarter_horse_flag=((race.breed == 'QH') or (race.breed == 'MX'))
+    )
+
+    # Validate required fields
+    if not point_of_call_object:
+        raise ValueError(f"No point of call object found for {race.distance} furlong race: {point_of_call_data}")
+    
+    # Map point to point of call
+    if point_of_call_data['line_index'] > len(point_of_call_object['calls'])-1:
+        raise ValueError(f"Bad point of call line index: {point_of_call_data}")
+    return point_of_call_object['calls'][point_of_call_data['line_index']]
+
+def update_point_of_call(
+    point_of_call: PointsOfCall,
+    point_of_call_data: Dict[str, Any],
+    call: Dict[str, Any],
+    race: Races
+) -> bool:
+    """
+    Update a point of call from parsed data and its call.
+
+    Returns:
+        bool: True if any attribute changed
+    """
+    # Update attributes
+    changed = False
+    for key, value in point_of_call_data.items():
+        if key not in ['object_type', 'children', 'entry'] and hasattr(point_of_call, key):
+            if getattr(point_of_call, key) != value:
+                setattr(point_of_call, key, value)
+                changed = True
+                logger.debug("Updated '%s' for point of call: %s", key, point_of_call)
+
+    if point_of_call.text == "FIN" and point_of_call.position == 1:
+        if point_of_call.lengths_back != 0:
+            changed = True
+            point_of_call.lengths_back = 0
+
+    # handle call ditance
+    if 'feet' in call:
+        if call['text'] == 'Fin':
+            furlong_value = race.distance
+        else:
+            furlong_value = value * FURLONGS_PER_FEET
+        if point_of_call.distance is not None:
+            if point_of_call.distance != furlong_value:
+                point_of_call.distance = furlong_value
+                logger.debug("Updated '%s' for point of call: %s", 'distance', point_of_call)
+                changed = True
+        else:
+            point_of_call.distance = furlong_value
+            logger.debug("Updated '%s' for point of call: %s", 'distance', point_of_call)
+            changed = True
+    else: 
+        # handle points of call with no distance in them
+        if point_of_call.distance is not None:
+            if point_of_call.distance != 0:
+                point_of_call.distance = 0
+                logger.debug("Updated '%s' for point of call: %s", 'distance', point_of_call)
+                changed = True
+        else:
+            point_of_call.distance = 0
+            logger.debug("Updated '%s' for point of call: %s", 'distance', point_of_call)
+            changed = True
+
+    return changed
+
 def parse_point_of_call(point_of_call_data: Dict[str, Any], parent_object: Optional[Entries] = None) -> PointsOfCall:
     """
     Parse point of call data and return corresponding PointsOfCall model instance.
@@ -662,24 +928,8 @@ def parse_point_of_call(point_of_call_data: Dict[str, Any], parent_object: Optio
         entry = parent_object or parse_entry(point_of_call_data['entry'])
         if not entry:
             raise ValueError(f"Parent entry is required: {point_of_call_data}")
-        
-        # Figure out QH or Mixed
-
 
-        # Get point of call object based on distance if available
-        point_of_call_object = get_point_of_call_object_from_furlongs(
-            entry.race.distance,
-            quarter_horse_flag=((entry.race.breed == 'QH') or (entry.race.breed == 'MX'))
-        )
-
-        # Validate required fields
-        if not point_of_call_object:
-            raise ValueError(f"No point of call object found for {entry.race.distance} furlong race: {point_of_call_data}")
-        
-        # Map point to point of call
-        if point_of_call_data['line_index'] > len(point_of_call_object['calls'])-1:
-            raise ValueError(f"Bad point of call line index: {point_of_call_data}")
-        call = point_of_call_object['calls'][point_of_call_data['line_index']]
+        call = get_call_for_point_of_call(entry.race, point_of_call_data)
 
         # Get or create point of call
         point_of_call = PointsOfCall.objects.filter(
@@ -693,49 +943,14 @@ def parse_point_of_call(point_of_call_data: Dict[str, Any], parent_object: Optio
             point_of_call.entry = entry
             point_of_call.point = call['point']
 
-        # Update attributes
-        changed = False
-        for key, value in point_of_call_data.items():
-            if key not in ['object_type', 'children', 'entry'] and hasattr(point_of_call, key):
-                if getattr(point_of_call, key) != value:
-                    setattr(point_of_call, key, value)
-                    changed = True
-                    logger.debug("Updated '%s' for point of call: %s", key, point_of_call)
-
-        if point_of_call.text == "FIN" and point_of_call.position == 1:
-            if point_of_call.lengths_back != 0:
-                changed = True
-                point_of_call.lengths_back = 0
-
-        # handle call ditance
-        if 'feet' in call:
-            if call['text'] == 'Fin':
-                furlong_value = entry.race.distance
-            else:
-                furlong_value = value * FURLONGS_PER_FEET
-            if point_of_call.distance is not None:
-                if point_of_call.distance != furlong_value:
-                    point_of_call.distance = furlong_value
-                    logger.debug("Updated '%s' for point of call: %s", 'distance', point_of_call)
-                    changed = True
-            else:
-                point_of_call.distance = furlong_value
-                logger.debug("Updated '%s' for point of call: %s", 'distance', point_of_call)
-                changed = True
-        else: 
-            # handle points of call with no distance in them
-            if point_of_call.distance is not None:
-                if point_of_call.distance != 0:
-                    point_of_call.distance = 0
-                    logger.debug("Updated '%s' for point of call: %s", 'distance', point_of_call)
-                    changed = True
-            else:
-                point_of_call.distance = 0
-                logger.debug("Updated '%s' for point of call: %s", 'distance', point_of_call)
-                changed = True
+        changed = update_point_of_call(point_of_call, point_of_call_data, call, entry.race)
 
         if changed:
             point_of_call.save()
+
+            # the entry's split call velocities need to be calculated again
+            Entries.objects.filter(id=entry.id).update(split_call_velocities_calculated=False)
+            entry.split_call_velocities_calculated = False
             
         return point_of_call
 
@@ -831,31 +1046,84 @@ def parse_workout(workout_data: Dict[str, Any], parent_object: Optional[Horses]
         logger.error("Error parsing workout: %s", e)
         return None
 
-def process_parsed_objects(parsed_objects: List[Dict[str, Any]]) -> None:
+def process_child_objects(children: List[Dict[str, Any]], parent_object: Any) -> None:
+    """
+    Process the children of a parsed object, each in its own savepoint so a bad
+    child is rolled back and skipped without losing the rest.
+    
+    Args:
+        children: List of dictionaries containing child object data to parse
+        parent_object: Parent instance passed to each child's parser
+    """
+    for child in children:
+        if child['object_type'] in OBJECT_MAP:
+            try:
+                with transaction.atomic():
+                    OBJECT_MAP[child['object_type']](child, parent_object)
+            except Exception as e:
+                logger.exception("Skipping %s of %s: %s", child['object_type'], parent_object, e)
+                skipped_children = current_skipped_children.get()
+                if skipped_children is not None:
+                    skipped_children.append(child)
+
+                # rows cached since the savepoint may have been rolled back
+                identity_map = current_identity_map.get()
+                if identity_map is not None:
+                    identity_map.clear()
+
+def process_parsed_objects(parsed_objects: List[Dict[str, Any]]) -> int:
     """
     Process a list of parsed objects using the appropriate parser from OBJECT_MAP.
+
+    Each top level object (a race and all of its children for charts and entries)
+    is loaded in its own transaction so a failure rolls the whole object back.
     
     Args:
         parsed_objects: List of dictionaries containing object data to parse
+
+    Returns:
+        Number of children that failed and were skipped, so the load was partial
         
     Raises:
         ValueError: If object type is not supported
     """
     logger.info("Processing parsed objects")
 
+    # share one identity map across the whole load
+    identity_map = IdentityMap()
+    token = current_identity_map.set(identity_map)
+    skipped_children = []
+    skipped_token = current_skipped_children.set(skipped_children)
+
     try:
+        identity_map.preload(parsed_objects)
+
         for parsed_object in parsed_objects:
             if 'object_type' not in parsed_object:
                 raise ValueError(f"Missing object_type in parsed object: {parsed_object}")
                 
             if parsed_object['object_type'] in OBJECT_MAP:
-                OBJECT_MAP[parsed_object['object_type']](parsed_object)
+                with transaction.atomic():
+                    OBJECT_MAP[parsed_object['object_type']](parsed_object)
             else:
                 raise ValueError(f"Unsupported object type: {parsed_object['object_type']}: {parsed_object}")
 
     except Exception as e:
         logger.error("Error processing parsed objects: %s", e)
         raise
+    finally:
+        current_identity_map.reset(token)
+        current_skipped_children.reset(skipped_token)
+
+    return len(skipped_children)
+
+# Map of object types to the models held in the identity map
+IDENTITY_MODELS = {
+    'track': Tracks,
+    'horse': Horses,
+    'trainer': Trainers,
+    'jockey': Jockeys
+}
 
 # Map of object types to their parser functions
 OBJECT_MAP = {
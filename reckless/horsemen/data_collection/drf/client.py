@@ -0,0 +1,114 @@
+"""
+Client for the DRF formulator JSON api.
+
+Every request goes through one shared requests session whose connection pool is
+sized to DRF_CONCURRENCY, so connections to drf.com are kept alive between
+requests instead of doing a new TLS handshake each time, and requests start no
+faster than the drf.com limit in scraping.DOMAIN_LIMITS allows. Passing a
+DrfResponseCache makes the requests conditional and skips unchanged payloads.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+from requests.adapters import HTTPAdapter
+from horsemen.data_collection.scraping import get_domain_rate_limiter
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# requests in flight at once
+DRF_CONCURRENCY = 8
+
+# seconds to wait for a response
+DRF_TIMEOUT = 30
+
+# shared session, created on first use
+_session_lock = threading.Lock()
+_drf_session = None
+
+
+def get_drf_session():
+    """Get the requests session shared by every DRF request, pooled for DRF_CONCURRENCY connections."""
+    global _drf_session
+    with _session_lock:
+        if _drf_session is None:
+            _drf_session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=DRF_CONCURRENCY)
+            _drf_session.mount('https://', adapter)
+            _drf_session.mount('http://', adapter)
+        return _drf_session
+
+
+def get_drf_response(url, headers=None):
+    """Get a DRF url over the shared session, waiting for the drf.com rate limit first."""
+    rate_limiter = get_domain_rate_limiter(url)
+    if rate_limiter:
+        rate_limiter.wait()
+    return get_drf_session().get(url, headers=headers, timeout=DRF_TIMEOUT)
+
+
+def fetch_drf_json(url, response_cache=None):
+    """
+    Fetch a DRF url's json.
+
+    Args:
+        url: DRF api url
+        response_cache: DrfResponseCache to make the request conditional, its
+            validators for url must already be loaded
+
+    Returns:
+        Tuple of whether the payload changed since it was last loaded and the
+        decoded json, the json is None if it didnt change or the request failed
+    """
+    headers = response_cache.get_headers(url) if response_cache else None
+    response = get_drf_response(url, headers)
+    if response.status_code == 304:
+        logger.info(f'{url} not modified')
+        return False, None
+    if response.status_code != 200:
+        logger.error(f'Failed to fetch {url}. Status code: {response.status_code}')
+        return True, None
+    if response_cache and not response_cache.update(url, response):
+        logger.info(f'{url} unchanged')
+        return False, None
+    return True, response.json()
+
+
+def fetch_drf_json_as_completed(keyed_urls, max_workers=DRF_CONCURRENCY, response_cache=None):
+    """
+    Fetch many DRF urls at once and yield each one's json as soon as it arrives.
+
+    Failed requests are logged and yield None so callers can tell which keys are
+    missing. With a response_cache, payloads that havent changed since they were
+    last loaded arent yielded at all.
+
+    Args:
+        keyed_urls: Iterable of (key, url) tuples, the key is handed back with the json
+        max_workers: Requests in flight at once
+        response_cache: DrfResponseCache to make the requests conditional
+
+    Yields:
+        Tuple of key and the decoded json, or None if the request failed
+    """
+    keyed_urls = list(keyed_urls)
+    if not keyed_urls:
+        return
+
+    # read the validators here so the fetch threads dont use the database
+    if response_cache:
+        response_cache.load([url for key, url in keyed_urls])
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(fetch_drf_json, url, response_cache): (key, url) for key, url in keyed_urls}
+        for future in as_completed(futures):
+            key, url = futures[future]
+            try:
+                changed, data = future.result()
+            except Exception as e:
+                logger.error(f'Error fetching {url}: {str(e)}')
+                yield key, None
+                continue
+            if changed:
+                yield key, data
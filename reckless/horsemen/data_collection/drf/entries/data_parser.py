@@ -1,19 +1,25 @@
 import logging
 from datetime import datetime, timedelta
 import pytz
-import requests
 from django.db.models import Q
 from horsemen.models import Races
 from horsemen.data_collection.utils import convert_string_to_furlongs, get_best_choice_from_description_code, get_horsename_and_country_from_drf
+from horsemen.data_collection.drf.client import fetch_drf_json_as_completed
 from horsemen.constants import BREED_CHOICES
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-def get_entries_data():
+def get_entries_data(response_cache=None):
     """
     Get entries data for races in the next 3 days that haven't been imported
     or any races happening today regardless of import status
+
+    With a DrfResponseCache, cards whose json hasnt changed since it was last
+    loaded are skipped. Its validators are saved by the caller after loading.
+
+    Returns:
+        Parsed entries data of each card keyed by the card's url
     """
     logger.info('running get_entries_data')
 
@@ -30,26 +36,25 @@ def get_entries_data():
     # Get unique track and date combinations
     track_date_combos = set((race.track, race.race_date) for race in races)
 
-    # Process each track/date combination
-    parsed_entries_data = []
-    for track, race_date in track_date_combos:
-        # Get entries URL for this track and date
-        url = track.get_drf_entries_url_for_date(race_date)
-        
+    # Fetch every track/date combination at once, parsing each as it arrives
+    parsed_entries_data = {}
+    urls = {
+        (track, race_date): track.get_drf_entries_url_for_date(race_date)
+        for track, race_date in track_date_combos
+    }
+    for (track, race_date), data in fetch_drf_json_as_completed(urls.items(), response_cache=response_cache):
+        if data is None:
+            logger.error(f'Failed to fetch entries data for {track.name} on {race_date}')
+            continue
         try:
-            # Fetch data from URL
-            response = requests.get(url)
-            if response.status_code == 200:
-                # Parse the JSON response
-                data = response.json()
-                # Parse the extracted data
-                parsed_data = parse_extracted_entries_data(data)
-                parsed_entries_data.extend(parsed_data)
-                logger.info(f'Successfully fetched and parsed entries data for {track.name} on {race_date}')
-            else:
-                logger.error(f'Failed to fetch entries data from URL {url}. Status code: {response.status_code}')
+            # Parse the extracted data
+            parsed_data = parse_extracted_entries_data(data)
+            parsed_entries_data[urls[(track, race_date)]] = parsed_data
+            logger.info(f'Successfully fetched and parsed entries data for {track.name} on {race_date}')
         except Exception as e:
-            logger.error(f'Error fetching entries data for {track.name} on {race_date}: {str(e)}')
+            logger.error(f'Error parsing entries data for {track.name} on {race_date}: {str(e)}')
+            if response_cache:
+                response_cache.discard(urls[(track, race_date)])
 
     return parsed_entries_data
 
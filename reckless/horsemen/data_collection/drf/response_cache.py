@@ -0,0 +1,86 @@
+"""
+Conditional GET cache for DRF json.
+
+The ETag, Last-Modified and body hash of the last loaded response for each url are
+kept in CachedResponses. Requests send them back as If-None-Match and
+If-Modified-Since, and a 304 or a body with the same hash means the payload is
+unchanged, so it is neither parsed nor loaded again.
+
+New validators are only saved once the payload has been loaded without skipping
+anything, so a parse or load that fails is fetched in full again on the next run.
+"""
+
+import hashlib
+import logging
+from django.utils import timezone
+from horsemen.models import CachedResponses
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class DrfResponseCache:
+    """Cached validators for DRF urls, with the changes from this run waiting to be saved."""
+
+    def __init__(self):
+        self.cached = {}
+        self.pending = {}
+
+    def load(self, urls):
+        """Read the cached validators for urls in one query."""
+        urls = [url for url in urls if url not in self.cached]
+        for cached_response in CachedResponses.objects.filter(url__in=urls):
+            self.cached[cached_response.url] = cached_response
+
+    def get_headers(self, url):
+        """Conditional request headers for a url, empty if it has never been loaded."""
+        cached_response = self.cached.get(url)
+        headers = {}
+        if cached_response:
+            if cached_response.etag:
+                headers['If-None-Match'] = cached_response.etag
+            if cached_response.last_modified:
+                headers['If-Modified-Since'] = cached_response.last_modified
+        return headers
+
+    def update(self, url, response):
+        """
+        Hold a 200 response's validators to be saved once its payload is loaded.
+
+        Args:
+            url: Requested url
+            response: requests response with a 200 status
+
+        Returns:
+            False if the body is the same as the last one loaded
+        """
+        content_hash = hashlib.sha256(response.content).hexdigest()
+        self.pending[url] = CachedResponses(
+            url=url,
+            etag=response.headers.get('ETag'),
+            last_modified=response.headers.get('Last-Modified'),
+            content_hash=content_hash
+        )
+        cached_response = self.cached.get(url)
+        return not (cached_response and cached_response.content_hash == content_hash)
+
+    def discard(self, url):
+        """Forget a response whose payload couldnt be parsed so it is fetched in full next time."""
+        self.pending.pop(url, None)
+
+    def save(self):
+        """Save the validators of every response held since the last save, once its payload is loaded."""
+        if not self.pending:
+            return
+        now = timezone.now()
+        for cached_response in self.pending.values():
+            cached_response.updated_at = now
+        CachedResponses.objects.bulk_create(
+            list(self.pending.values()),
+            update_conflicts=True,
+            unique_fields=['url'],
+            update_fields=['etag', 'last_modified', 'content_hash', 'updated_at']
+        )
+        logger.info(f'cached {len(self.pending)} DRF responses')
+        self.cached.update(self.pending)
+        self.pending = {}
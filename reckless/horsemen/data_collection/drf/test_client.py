@@ -0,0 +1,43 @@
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from horsemen.data_collection.drf import client
+
+class JsonHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.connections.add(self.client_address)
+        status = 404 if self.path == '/missing' else 200
+        body = json.dumps({'path': self.path}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class TestDrfClient(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), JsonHandler)
+        self.server.connections = set()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.base_url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def test_fetches_every_url_over_kept_alive_connections(self):
+        keyed_urls = [(number, f'{self.base_url}/{number}') for number in range(40)]
+        results = dict(client.fetch_drf_json_as_completed(keyed_urls, max_workers=4))
+        self.assertEqual(results, {number: {'path': f'/{number}'} for number in range(40)})
+        self.assertLessEqual(len(self.server.connections), client.DRF_CONCURRENCY)
+
+    def test_failed_requests_yield_none(self):
+        results = dict(client.fetch_drf_json_as_completed([('missing', f'{self.base_url}/missing')]))
+        self.assertEqual(results, {'missing': None})
+
+if __name__ == '__main__':
+    unittest.main()
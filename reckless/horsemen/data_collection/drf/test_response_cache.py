@@ -0,0 +1,76 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.test import TestCase
+from horsemen.models import CachedResponses
+from horsemen.data_collection.drf.client import fetch_drf_json_as_completed
+from horsemen.data_collection.drf.response_cache import DrfResponseCache
+
+class JsonHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = json.dumps(self.server.payload).encode()
+        etag = self.server.etag
+        self.server.requests.append(self.headers.get('If-None-Match'))
+        if etag and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        if etag:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class TestDrfResponseCache(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), JsonHandler)
+        self.server.payload = {'races': [1]}
+        self.server.etag = '"v1"'
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/entries'
+
+    def fetch(self, response_cache):
+        return dict(fetch_drf_json_as_completed([('card', self.url)], response_cache=response_cache))
+
+    def test_unchanged_payloads_are_skipped_once_loaded(self):
+        self.assertEqual(self.fetch(DrfResponseCache()), {'card': {'races': [1]}})
+
+        # nothing was saved, so the next run gets the full payload again
+        response_cache = DrfResponseCache()
+        self.assertEqual(self.fetch(response_cache), {'card': {'races': [1]}})
+        response_cache.save()
+        self.assertEqual(CachedResponses.objects.get().etag, '"v1"')
+
+        # a 304 on the next run
+        self.assertEqual(self.fetch(DrfResponseCache()), {})
+        self.assertEqual(self.server.requests[-1], '"v1"')
+
+        # a changed payload comes through
+        self.server.payload = {'races': [1, 2]}
+        self.server.etag = '"v2"'
+        self.assertEqual(self.fetch(DrfResponseCache()), {'card': {'races': [1, 2]}})
+
+    def test_same_body_without_etag_is_skipped(self):
+        self.server.etag = None
+        response_cache = DrfResponseCache()
+        self.fetch(response_cache)
+        response_cache.save()
+        self.assertEqual(self.fetch(DrfResponseCache()), {})
+
+    def test_discarded_responses_arent_saved(self):
+        response_cache = DrfResponseCache()
+        self.fetch(response_cache)
+        response_cache.discard(self.url)
+        response_cache.save()
+        self.assertFalse(CachedResponses.objects.exists())
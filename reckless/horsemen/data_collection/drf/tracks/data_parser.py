@@ -1,21 +1,23 @@
-import requests
 import logging
 from datetime import datetime
 import pytz
+from horsemen.data_collection.drf.client import fetch_drf_json
 
 # init logging
 logger = logging.getLogger(__name__)
 
-def fetch_tracks_data():
+def fetch_tracks_data(response_cache=None):
 
     logger.info('running fetch_tracks_data')
 
-    # get data from url
+    # get data from url, skipping it if it hasnt changed since it was last loaded
     url = "https://formulator.drf.com/formulator-service/api/raceTracks"
-    response = requests.get(url)
+    if response_cache:
+        response_cache.load([url])
+    changed, data = fetch_drf_json(url, response_cache)
 
-    if response.status_code == 200:
-        return parse_extracted_tracks_data(response.json())
+    if data is not None:
+        return parse_extracted_tracks_data(data)
     else:
         return []
 
@@ -6,25 +6,47 @@ import json
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# bump when the extracted data changes so cached extractions are rebuilt
+EXTRACTOR_VERSION = 1
+
 # precompile regex
 page_type_pattern = re.compile(r'^([A-Za-z0-9\s\&]+)-([A-Za-z0-9\s\,]+)-\s?Race\s?(\d+)')
 
+# height in points of the strip at the top of a page that holds the race header line
+PAGE_HEADER_HEIGHT = 72
+
+def get_page_header_text(page):
+    """
+    Get the first line of text from the strip at the top of a page.
+
+    Args:
+        page: pdfplumber page
+
+    Returns:
+        The first line's text or None if the strip has no text
+    """
+    x0, top, x1, bottom = page.bbox
+    header_lines = page.crop((x0, top, x1, min(top + PAGE_HEADER_HEIGHT, bottom))).extract_text_lines()
+    if header_lines:
+        return header_lines[0]['text']
+    return None
+
 # parsing lines into normal lines
 def get_text_with_spaces(line):
 
     # init return
-    return_text = ''
+    text_parts = []
 
     # loop chars
     last_x1 = line['chars'][0]['x1']
     for char in line['chars']:
         if char['x0']-last_x1 > 1.5:
-            return_text += ' '
-        return_text += char['text']
+            text_parts.append(' ')
+        text_parts.append(char['text'])
         last_x1 = char['x1']
 
     # return
-    return return_text
+    return ''.join(text_parts)
 
 def get_header_info(line):
     header_chars = line['chars']
@@ -59,55 +81,162 @@ def get_header_info(line):
 
     return header_order, header_positions
 
-def get_table_values_from_line(header_order, header_positions, line):
+def get_column_ends(header_order, header_positions):
+    """
+    Args:
+        header_order: Header labels in order
+        header_positions: Dictionary of header label to starting x0
 
-    # init return
-    return_dict = {}
-    for label in header_order:
-        return_dict[label] = {
-            'normal_text': '',
-            'super_text': ''
-        }
+    Returns:
+        List of where each column ends, less the point of slack a char gets, the last one goes on forever
+    """
+    return [header_positions[label]-1 for label in header_order[1:]] + [100000-1]
+
+def get_table_values_from_line(header_order, header_positions, line, column_ends=None):
+
+    # column ends only depend on the header so tables pass them in
+    if column_ends is None:
+        column_ends = get_column_ends(header_order, header_positions)
+
+    # init return buffers
+    normal_parts = {label: [] for label in header_order}
+    super_parts = {label: [] for label in header_order}
 
     # init loop
     current_header_index = 0
-    current_header = header_order[current_header_index]
-    end_x0 = header_positions[header_order[current_header_index+1]]
-    font_y0 = line['chars'][0]['y0']
+    end_x0 = column_ends[current_header_index]
+    normal_buffer = normal_parts[header_order[current_header_index]]
+    super_buffer = super_parts[header_order[current_header_index]]
+    super_y0 = line['chars'][0]['y0']+1
     last_x1 = line['chars'][0]['x0']
     for char in line['chars']:
+        char_x0 = char['x0']
 
         # check if we crossed a header boundry
-        while char['x0'] >= end_x0-1:
+        if char_x0 >= end_x0:
 
             # increment the header
-            current_header_index += 1
-            current_header = header_order[current_header_index]
-            
-            # if we're at the end of the headers, set the line end to something huge
-            if current_header_index+1 >= len(header_order):
-                end_x0 = 100000
-            else:
-                end_x0 = header_positions[header_order[current_header_index+1]]
+            while char_x0 >= column_ends[current_header_index]:
+                current_header_index += 1
+            end_x0 = column_ends[current_header_index]
+            normal_buffer = normal_parts[header_order[current_header_index]]
+            super_buffer = super_parts[header_order[current_header_index]]
 
             # set last_x1 so that we dont put a space at the beginning of a new column
-            last_x1 = char['x0']
+            last_x1 = char_x0
 
         # check if there needs to be a space
         char_to_append = char['text'].upper()
-        if char['x0']-last_x1 > 1:
+        if char_x0-last_x1 > 1:
             char_to_append = ' ' + char_to_append
 
         # check if the character is normal or super
-        if char['y0']>font_y0+1:
-            return_dict[current_header]['super_text'] += char_to_append
+        if char['y0']>super_y0:
+            super_buffer.append(char_to_append)
         else:
-            return_dict[current_header]['normal_text'] += char_to_append
+            normal_buffer.append(char_to_append)
 
         # set last x1 to find spaces
         last_x1 = char['x1']
 
-    return return_dict
+    return {
+        label: {
+            'normal_text': ''.join(normal_parts[label]),
+            'super_text': ''.join(super_parts[label])
+        }
+        for label in header_order
+    }
+
+
+# configure tables
+TABLE_CONFIGS = [
+    {
+        'header_pattern': r'Wager\s*Type\s*Winning\s*Numbers',
+        'stop_pattern': r'Past\s*Performance',
+        'table_name': 'payoffs'
+    },
+    {
+        'header_pattern': r'Last\s*Raced\s*Pgm',
+        'stop_pattern': r'(?:Fractional\s*Times|Run\s*-?\s*Up|Winner|Final\s*Time)',
+        'table_name': 'entries'
+    },
+    {
+        'header_pattern': r'Horse\s*Name\s*(Start|1|2)',
+        'stop_pattern': r'(?:Trainers:|Owners:)',
+        'table_name': 'past_performance'
+    }
+]
+
+def extract_race_data(extracted_lines):
+    """
+    Split one race's pdfplumber lines into text lines and tables.
+
+    Args:
+        extracted_lines: Lines from extract_text_lines for every page of the race
+
+    Returns:
+        Dictionary with the race's lines and tables
+    """
+
+    # init data storage
+    data = {
+        'lines': [],
+        'tables': {}
+    }
+
+    # process lines
+    table = None
+    active_table_config = None
+    for line in extracted_lines:
+
+        # table processing vs line processing
+        if table:
+            # table processing
+            # check if this is the end of the table
+            if re.match(active_table_config['stop_pattern'], line['text']):
+                data['tables'][active_table_config['table_name']] = table
+                table = None
+                active_table_config = None
+            else:
+                # process table row
+                table['data'].append(get_table_values_from_line(table['header_order'], table['header_positions'], line, column_ends))
+
+        # check for table headers
+        if not table:
+            for table_config in TABLE_CONFIGS:
+                if re.search(table_config['header_pattern'], line['text']):
+
+                    # load config
+                    active_table_config = table_config
+
+                    # parse header
+                    header_order, header_positions = get_header_info(line=line)
+                    column_ends = get_column_ends(header_order, header_positions)
+
+                    # init table data
+                    table = {
+                        'header_order': header_order,
+                        'header_positions': header_positions,
+                        'data': []
+                    }
+
+                    # dont search anymore
+                    break
+
+        # after all the table stuff, if were not dealing with it append the line
+        if not table:
+            #line processing
+            stripped_line = get_text_with_spaces(line).strip()
+            pattern = r'([\w\s]+:)|(Footnotes)'
+            if len(data['lines'])==0 or re.match(pattern, stripped_line):
+                data['lines'].append(stripped_line)
+            else:
+                data['lines'][-1] += ' ' + stripped_line
+
+    # log
+    logger.info(f'parsed {len(data['tables'])} tables and {len(data['lines'])} lines')
+
+    return data
 
 
 class EquibaseChartExtractor:
@@ -132,114 +261,60 @@ class EquibaseChartExtractor:
         """
         Parse the file and extract race information.
         """
+        for data in self.iter_races():
+            self.data.append(data)
+
+    def iter_races(self):
+        """
+        Extract the file one race at a time.
+
+        Each race is yielded as soon as its pages are read and every page's cached
+        chars and objects are released once its lines are extracted, so pdfplumber's
+        page caches don't grow with the size of the card.
+
+        Yields:
+            Dictionary with the race's lines and tables
+        """
         logger.info(f'EquibaseChartParser parsing {self.filename}')
 
         # init lines
-        plumber_lines = []
+        race_lines = None
+        race_count = 0
 
         # parse pdf
         with pdfplumber.open(self.filename) as pdf:
 
             # loop through pages and extract lines
-            
             for page in pdf.pages:
 
-                # extract lines
+                # pages before the first race are classified from their header strip alone
+                if race_lines is None:
+                    header_text = get_page_header_text(page)
+                    if header_text is not None and not page_type_pattern.search(header_text):
+                        page.close()
+                        continue
+
+                # extract lines then drop the page's caches
                 extracted_lines = page.extract_text_lines()
+                page.close()
 
                 # check what kind of page this is
                 if page_type_pattern.search(extracted_lines[0]['text']):
-                    # this is the first page of a race
-                    plumber_lines.append(extracted_lines)
+                    # this is the first page of a race so the last one is done
+                    if race_lines is not None:
+                        yield extract_race_data(race_lines)
+                    race_lines = extracted_lines
+                    race_count += 1
                 else:
                     # this is the second page of race, hopefully
-                    if len(plumber_lines)>0:
-                        plumber_lines[-1].extend(extracted_lines)
-
-            logger.info(f'{self.filename} has {len(pdf.pages)} pdf pages but {len(plumber_lines)} races')
-            pdf.close()
-
-        # process lines
-        for extracted_lines in plumber_lines:
-
-            # init data storage
-            data = {
-                'lines': [],
-                'tables': {}
-            }
-
-            # configure tables
-            table_configs = [
-                {
-                    'header_pattern': r'Wager\s*Type\s*Winning\s*Numbers',
-                    'stop_pattern': r'Past\s*Performance',
-                    'table_name': 'payoffs'
-                },
-                {
-                    'header_pattern': r'Last\s*Raced\s*Pgm',
-                    'stop_pattern': r'(?:Fractional\s*Times|Run\s*-?\s*Up|Winner|Final\s*Time)',
-                    'table_name': 'entries'
-                },
-                {
-                    'header_pattern': r'Horse\s*Name\s*(Start|1|2)',
-                    'stop_pattern': r'(?:Trainers:|Owners:)',
-                    'table_name': 'past_performance'
-                }
-            ]
-
-            # process lines
-            table = None
-            active_table_config = None
-            for line in extracted_lines:
-
-                # table processing vs line processing
-                if table:
-                    # table processing
-                    # check if this is the end of the table
-                    if re.match(active_table_config['stop_pattern'], line['text']):
-                        data['tables'][active_table_config['table_name']] = table
-                        table = None
-                        active_table_config = None
-                    else:
-                        # process table row
-                        table['data'].append(get_table_values_from_line(table['header_order'], table['header_positions'], line))
-
-                # check for table headers
-                if not table:
-                    for table_config in table_configs:
-                        if re.search(table_config['header_pattern'], line['text']):
-
-                            # load config
-                            active_table_config = table_config
-
-                            # parse header
-                            header_order, header_positions = get_header_info(line=line)
-
-                            # init table data
-                            table = {
-                                'header_order': header_order,
-                                'header_positions': header_positions,
-                                'data': []
-                            }
-
-                            # dont search anymore
-                            break
-
-                # after all the table stuff, if were not dealing with it append the line
-                if not table:
-                    #line processing
-                    stripped_line = get_text_with_spaces(line).strip()
-                    pattern = r'([\w\s]+:)|(Footnotes)'
-                    if len(data['lines'])==0 or re.match(pattern, stripped_line):
-                        data['lines'].append(stripped_line)
-                    else:
-                        data['lines'][-1] += ' ' + stripped_line
-
-            # append to data
-            self.data.append(data)
+                    if race_lines is not None:
+                        race_lines.extend(extracted_lines)
 
-            # log
-            logger.info(f'parsed {len(data['tables'])} tables and {len(data['lines'])} lines')
+            # finish the last race
+            if race_lines is not None:
+                yield extract_race_data(race_lines)
+
+            logger.info(f'{self.filename} has {len(pdf.pages)} pdf pages but {race_count} races')
 
 # main extraction sub
 def parse_equibase_chart(filename, debug=False):
@@ -259,5 +334,3 @@ def parse_equibase_chart(filename, debug=False):
 
     # return extracted data
     return extractor.data
-
-
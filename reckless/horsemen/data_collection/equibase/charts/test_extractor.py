@@ -0,0 +1,46 @@
+import unittest
+from .extractor import get_text_with_spaces, get_header_info, get_table_values_from_line, get_column_ends
+
+def make_line(words, y0=100.0):
+    # words are (x0, text, y0 offset), chars are 4 points wide with no gap
+    chars = []
+    for x0, text, y0_offset in words:
+        for char_text in text:
+            chars.append({'text': char_text, 'x0': x0, 'x1': x0 + 4, 'y0': y0 + y0_offset})
+            x0 += 4
+    return {'chars': chars, 'text': ''.join(text for x0, text, y0_offset in words)}
+
+class TestChartTableSlicing(unittest.TestCase):
+    def setUp(self):
+        self.header_line = make_line([(10, 'Pgm', 0), (50, 'Horse', 0), (150, 'Odds', 0)])
+        self.header_order, self.header_positions = get_header_info(self.header_line)
+        self.row_line = make_line([
+            (10, '3', 0), (50, 'Fast', 0), (70, 'Horse', 0), (91, 'b', 2), (150, '2.40', 0), (166, '*', 0)
+        ])
+
+    def test_header_info(self):
+        self.assertEqual(self.header_order, ['PGM', 'HORSE', 'ODDS'])
+        self.assertEqual(self.header_positions, {'PGM': 10, 'HORSE': 50, 'ODDS': 150})
+
+    def test_table_values_from_line(self):
+        self.assertEqual(
+            get_table_values_from_line(self.header_order, self.header_positions, self.row_line),
+            {
+                'PGM': {'normal_text': '3', 'super_text': ''},
+                'HORSE': {'normal_text': 'FAST HORSE', 'super_text': 'B'},
+                'ODDS': {'normal_text': '2.40*', 'super_text': ''}
+            }
+        )
+
+    def test_column_ends_passed_in_match(self):
+        column_ends = get_column_ends(self.header_order, self.header_positions)
+        self.assertEqual(
+            get_table_values_from_line(self.header_order, self.header_positions, self.row_line, column_ends),
+            get_table_values_from_line(self.header_order, self.header_positions, self.row_line)
+        )
+
+    def test_text_with_spaces(self):
+        self.assertEqual(get_text_with_spaces(self.row_line), '3 Fast Horseb 2.40*')
+
+if __name__ == '__main__':
+    unittest.main()
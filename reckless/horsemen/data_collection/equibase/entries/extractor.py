@@ -13,6 +13,9 @@ from pathlib import Path
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# bump when the extracted data changes so cached extractions are rebuilt
+EXTRACTOR_VERSION = 1
+
 class EquibaseEntriesExtractor:
     def __init__(self, filename: Path):
         """
@@ -15,6 +15,9 @@ from horsemen.data_collection.utils import convert_string_to_furlongs, convert_s
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# bump when the extracted data changes so cached extractions are rebuilt
+EXTRACTOR_VERSION = 1
+
 class EquibaseHorseResultsExtractor:
     def __init__(self, filename: Path):
         """
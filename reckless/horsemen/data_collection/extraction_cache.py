@@ -0,0 +1,136 @@
+"""
+Cache of extracted Equibase files.
+
+The output of parse_equibase_chart, parse_equibase_entries and
+parse_equibase_horse_results is kept gzipped and pickled under
+EXTRACTION_CACHE_FOLDER, keyed by the raw file's content hash and the extractor's
+version, so reloading files only redoes the pdf and html parsing when the file or
+the extractor changes.
+"""
+
+import gzip
+import logging
+import pickle
+import tempfile
+from pathlib import Path
+from horsemen.data_collection.utils import EXTRACTION_CACHE_FOLDER
+from horsemen.data_collection.raw_store import get_content_hash, read_raw_file
+from horsemen.data_collection.equibase.charts import extractor as chart_extractor
+from horsemen.data_collection.equibase.entries import extractor as entries_extractor
+from horsemen.data_collection.equibase.horse_results import extractor as horse_results_extractor
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# extract function and extractor module for each file type
+EXTRACTORS = {
+    'CHART': (chart_extractor.parse_equibase_chart, chart_extractor),
+    'ENTRIES': (entries_extractor.parse_equibase_entries, entries_extractor),
+    'HORSERESULTS': (horse_results_extractor.parse_equibase_horse_results, horse_results_extractor)
+}
+
+
+def get_extractor(file_type):
+    """
+    Args:
+        file_type: ENTRIES, HORSERESULTS or CHART
+
+    Returns:
+        Tuple of the extract function and its current version
+    """
+    if file_type not in EXTRACTORS:
+        raise ValueError(f'Unknown equibase file type {file_type}')
+    extract_function, extractor_module = EXTRACTORS[file_type]
+    return extract_function, extractor_module.EXTRACTOR_VERSION
+
+
+def get_cache_path(file_type, content_hash):
+    """Path of the cached extraction for a file's content with the current extractor."""
+    extract_function, version = get_extractor(file_type)
+    return EXTRACTION_CACHE_FOLDER / file_type / f'{content_hash}_v{version}.pkl.gz'
+
+
+def read_cached_extraction(file_type, content_hash):
+    """
+    Args:
+        file_type: ENTRIES, HORSERESULTS or CHART
+        content_hash: sha256 of the raw file
+
+    Returns:
+        The cached extracted data or None if there isnt any
+    """
+    cache_path = get_cache_path(file_type, content_hash)
+    if not cache_path.exists():
+        return None
+    try:
+        with gzip.open(cache_path, 'rb') as cache_file:
+            return pickle.load(cache_file)
+    except (OSError, EOFError, pickle.UnpicklingError) as e:
+        logger.warning('Ignoring unreadable cached extraction %s: %s', cache_path, e)
+        return None
+
+
+def write_cached_extraction(file_type, content_hash, extracted_data):
+    """Cache extracted data, written to a temp file first so readers never see a partial file."""
+    cache_path = get_cache_path(file_type, content_hash)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=cache_path.parent, prefix=f'{cache_path.name}.', suffix='.tmp', delete=False) as temp_file:
+        temp_path = Path(temp_file.name)
+        try:
+            with gzip.GzipFile(fileobj=temp_file, mode='wb') as cache_file:
+                pickle.dump(extracted_data, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+    temp_path.replace(cache_path)
+
+
+def extract_with_cache(file_path, file_type, debug_flag=False, content_hash=None):
+    """
+    Extract an Equibase file, reusing the cached extraction of identical content.
+
+    Args:
+        file_path: Raw file to extract
+        file_type: ENTRIES, HORSERESULTS or CHART
+        debug_flag: Extract again so the extractor writes its json next to the file
+        content_hash: sha256 of the file if it is already known
+
+    Returns:
+        The extracted data
+    """
+    content_hash = content_hash or get_content_hash(file_path)
+    if not debug_flag:
+        extracted_data = read_cached_extraction(file_type, content_hash)
+        if extracted_data is not None:
+            logger.info('Using cached extraction of %s', file_path.name)
+            return extracted_data
+
+    extract_function, version = get_extractor(file_type)
+    if file_type == 'CHART':
+        extracted_data = extract_function(file_path, debug=debug_flag)
+    else:
+        extracted_data = extract_function(file_path)
+    write_cached_extraction(file_type, content_hash, extracted_data)
+    return extracted_data
+
+
+def extract_raw_file_with_cache(raw_file, file_type):
+    """
+    Extract a file from the raw store, only writing its blob out when it isnt cached.
+
+    Args:
+        raw_file: RawFiles manifest entry
+        file_type: ENTRIES, HORSERESULTS or CHART
+
+    Returns:
+        The extracted data
+    """
+    extracted_data = read_cached_extraction(file_type, raw_file.content_hash)
+    if extracted_data is not None:
+        return extracted_data
+
+    # extractors read from a path, keep the original name for its suffix
+    with tempfile.TemporaryDirectory() as temp_folder:
+        file_path = Path(temp_folder) / raw_file.key
+        file_path.write_bytes(read_raw_file(raw_file))
+        return extract_with_cache(file_path, file_type, content_hash=raw_file.content_hash)
@@ -0,0 +1,214 @@
+"""
+Persistent queue of files to download.
+
+Downloads are queued in FetchQueueItems with a priority and claimed by workers
+with SELECT ... FOR UPDATE SKIP LOCKED, so several collector processes, on one
+host or many, can drain the queue together without fetching a file twice. A
+claim that is never finished, because its worker crashed, can be taken again
+after FETCH_CLAIM_TIMEOUT, and failed fetches back off before their next attempt.
+"""
+
+import logging
+import os
+import socket
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from horsemen.models import FetchQueueItems
+from horsemen.data_collection.raw_store import get_raw_file
+from horsemen.data_collection.scraping import scrape_urls_as_completed
+from horsemen.data_collection.utils import SCRAPING_FOLDER
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# queue statuses
+FETCH_QUEUED = 'Q'
+FETCH_CLAIMED = 'C'
+FETCH_DONE = 'D'
+FETCH_FAILED = 'X'
+
+# todays and tomorrows cards go ahead of historic backfill
+FETCH_PRIORITY_CURRENT = 10
+FETCH_PRIORITY_BACKFILL = 0
+
+# items claimed at a time by a worker
+FETCH_CLAIM_BATCH_SIZE = 20
+
+# claims older than this are from a worker that died and can be taken again
+FETCH_CLAIM_TIMEOUT = timedelta(minutes=30)
+
+# attempts before an item is marked failed, each waiting twice as long as the last
+FETCH_MAX_ATTEMPTS = 5
+FETCH_RETRY_DELAY = timedelta(minutes=5)
+
+
+def get_worker_name():
+    """Name of this worker, unique across hosts and processes."""
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def get_fetch_priority(race_date):
+    """Priority for a race date's files, current cards over backfill."""
+    if race_date >= timezone.now().date() - timedelta(days=1):
+        return FETCH_PRIORITY_CURRENT
+    return FETCH_PRIORITY_BACKFILL
+
+
+def enqueue_fetches(url_filenames, kind, priority=FETCH_PRIORITY_BACKFILL):
+    """
+    Queue files to download.
+
+    Files already queued keep their place and are moved up if the new priority is
+    higher. Files that were done are queued again, since they are only asked for
+    when the database still needs them. Failed files stay failed until
+    retry_failed_fetches and claimed files are left to the worker that has them.
+
+    Args:
+        url_filenames: Iterable of (url, filename) tuples
+        kind: ENTRIES, HORSERESULTS or CHART
+        priority: Higher priorities are claimed first
+
+    Returns:
+        Number of files queued
+    """
+    url_filenames = dict((filename, url) for url, filename in url_filenames)
+    if not url_filenames:
+        return 0
+
+    now = timezone.now()
+    queued_items = FetchQueueItems.objects.filter(kind=kind, filename__in=url_filenames.keys())
+    existing_filenames = set(queued_items.values_list('filename', flat=True))
+
+    FetchQueueItems.objects.bulk_create([
+        FetchQueueItems(url=url, filename=filename, kind=kind, priority=priority, next_attempt_at=now)
+        for filename, url in url_filenames.items()
+        if filename not in existing_filenames
+    ], ignore_conflicts=True)
+
+    if existing_filenames:
+        queued_items.filter(status=FETCH_DONE).update(
+            status=FETCH_QUEUED, attempts=0, next_attempt_at=now, last_error=None, updated_at=now
+        )
+        queued_items.filter(priority__lt=priority).update(priority=priority, updated_at=now)
+
+    logger.info(f'queued {len(url_filenames)} {kind} files at priority {priority}')
+    return len(url_filenames)
+
+
+def retry_failed_fetches(kinds=None):
+    """
+    Queue failed items again with a fresh set of attempts.
+
+    Args:
+        kinds: Only retry these kinds, all kinds if None
+
+    Returns:
+        Number of items queued again
+    """
+    now = timezone.now()
+    failed_items = FetchQueueItems.objects.filter(status=FETCH_FAILED)
+    if kinds is not None:
+        failed_items = failed_items.filter(kind__in=kinds)
+    return failed_items.update(status=FETCH_QUEUED, attempts=0, next_attempt_at=now, updated_at=now)
+
+
+def claim_fetches(kinds=None, limit=FETCH_CLAIM_BATCH_SIZE, worker=None, filenames=None):
+    """
+    Claim the next items to download.
+
+    Rows locked by another worker's claim are skipped rather than waited on, so
+    concurrent workers each get a different batch.
+
+    Args:
+        kinds: Only claim these kinds, all kinds if None
+        limit: Most items to claim
+        worker: Name recorded on the claim, this process by default
+        filenames: Only claim these files, any file if None
+
+    Returns:
+        list of claimed FetchQueueItems in priority order
+    """
+    now = timezone.now()
+    claimable = FetchQueueItems.objects.filter(
+        Q(status=FETCH_QUEUED, next_attempt_at__lte=now) |
+        Q(status=FETCH_CLAIMED, claimed_at__lt=now - FETCH_CLAIM_TIMEOUT)
+    )
+    if kinds is not None:
+        claimable = claimable.filter(kind__in=kinds)
+    if filenames is not None:
+        claimable = claimable.filter(filename__in=filenames)
+
+    with transaction.atomic():
+        items = list(
+            claimable.select_for_update(skip_locked=True).order_by('-priority', 'next_attempt_at', 'id')[:limit]
+        )
+        if items:
+            FetchQueueItems.objects.filter(id__in=[item.id for item in items]).update(
+                status=FETCH_CLAIMED,
+                claimed_by=worker or get_worker_name(),
+                claimed_at=now,
+                attempts=F('attempts') + 1,
+                updated_at=now
+            )
+    return items
+
+
+def complete_fetch(item):
+    """Mark a claimed item as downloaded."""
+    FetchQueueItems.objects.filter(id=item.id).update(
+        status=FETCH_DONE, last_error=None, updated_at=timezone.now()
+    )
+
+
+def fail_fetch(item, error):
+    """
+    Put a claimed item back on the queue to try again later, or mark it failed once
+    it is out of attempts.
+
+    Args:
+        item: Claimed FetchQueueItems, attempts is from before the claim
+        error: Why the download failed
+    """
+    now = timezone.now()
+    attempts = item.attempts + 1
+    if attempts >= FETCH_MAX_ATTEMPTS:
+        logger.error(f'giving up on {item.filename} after {attempts} attempts: {error}')
+        status, next_attempt_at = FETCH_FAILED, item.next_attempt_at
+    else:
+        status, next_attempt_at = FETCH_QUEUED, now + FETCH_RETRY_DELAY * 2 ** (attempts - 1)
+    FetchQueueItems.objects.filter(id=item.id).update(
+        status=status, next_attempt_at=next_attempt_at, last_error=str(error), updated_at=now
+    )
+
+
+def fetch_queued_files(kinds=None, provider='zenrows', worker=None, filenames=None):
+    """
+    Claim and download queued files until there are none ready, yielding the path of
+    each file as soon as it lands.
+
+    Files that were already fetched into the raw store count as done without being
+    yielded, the same as the scrapers treat them.
+
+    Args:
+        kinds: Only download these kinds, all kinds if None
+        provider: zenrows or brightdata
+        worker: Name recorded on claims, this process by default
+        filenames: Only download these files, the whole queue if None
+
+    Yields:
+        Path: Downloaded file in the scraping folder
+    """
+    worker = worker or get_worker_name()
+    while items := claim_fetches(kinds, worker=worker, filenames=filenames):
+        items_by_filename = {item.filename: item for item in items}
+        for file_path in scrape_urls_as_completed([(item.url, item.filename) for item in items], provider):
+            complete_fetch(items_by_filename.pop(file_path.name))
+            yield file_path
+
+        for filename, item in items_by_filename.items():
+            if (SCRAPING_FOLDER / filename).exists() or get_raw_file(filename) is not None:
+                complete_fetch(item)
+            else:
+                fail_fetch(item, 'file was not downloaded')
@@ -0,0 +1,113 @@
+"""
+Fuzzy matching of parsed descriptions and names against known choices.
+Each set of choices is indexed once and every input string is matched at most once.
+"""
+
+import logging
+from functools import lru_cache
+from rapidfuzz import process, fuzz, utils
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# input strings remembered by each matcher
+MATCH_CACHE_SIZE = 1024
+
+# minimum score for a fuzzy track name match
+TRACK_NAME_SCORE_CUTOFF = 80
+
+
+class ChoiceMatcher:
+    """
+    Match input strings against (code, description) choices.
+
+    Descriptions are uppercased and preprocessed once. An exact description match
+    wins, otherwise the best WRatio scoring description at or above score_cutoff is
+    used. Results are memoized per input string.
+    """
+
+    def __init__(self, choices, score_cutoff=None):
+        self.codes = [choice for choice, description in choices]
+        self.descriptions = [description.upper() for choice, description in choices]
+        self.processed_descriptions = [utils.default_process(description) for description in self.descriptions]
+        self.score_cutoff = score_cutoff
+
+        # first code for each description
+        self.exact_matches = {}
+        for code, description in zip(self.codes, self.descriptions):
+            self.exact_matches.setdefault(description, code)
+
+        self.match = lru_cache(maxsize=MATCH_CACHE_SIZE)(self._match)
+
+    def _match(self, input_string):
+        """
+        Args:
+            input_string: Description to match
+
+        Returns:
+            The matching code or None
+        """
+        input_string = input_string.strip().upper()
+        if input_string != '':
+
+            # check for exact match first
+            if input_string in self.exact_matches:
+                return self.exact_matches[input_string]
+
+            # Find the best match
+            best_match = process.extractOne(
+                utils.default_process(input_string),
+                self.processed_descriptions,
+                scorer=fuzz.WRatio,
+                processor=None,
+                score_cutoff=self.score_cutoff
+            )
+            if best_match:
+                match_description, match_score, match_index = best_match
+                logger.debug(f'in ChoiceMatcher, {self.descriptions[match_index]} matches {input_string} with a score of {match_score}')
+                return self.codes[match_index]
+
+        logger.warning(f'in ChoiceMatcher, {input_string} did not return a match')
+        return None
+
+
+# matchers for choice lists, keyed by the list's id and holding the list so the id isnt reused
+_choice_matchers = {}
+
+
+def get_choice_matcher(choices):
+    """Get the matcher for a choices list such as BREED_CHOICES, building its index on first use."""
+    if id(choices) not in _choice_matchers:
+        _choice_matchers[id(choices)] = (choices, ChoiceMatcher(choices))
+    return _choice_matchers[id(choices)][1]
+
+
+# sorted track names the track name matcher was last asked for, and the same names as a set
+_track_names = ()
+_track_name_set = frozenset()
+
+
+def get_track_names_key(track_names):
+    """
+    Get the sorted tuple of track names, the same tuple object for as long as the
+    names dont change so the track name matcher cache key stays stable.
+    """
+    global _track_names, _track_name_set
+    track_name_set = frozenset(track_names)
+    if track_name_set != _track_name_set:
+        _track_names = tuple(sorted(track_name_set))
+        _track_name_set = track_name_set
+    return _track_names
+
+
+@lru_cache(maxsize=8)
+def get_track_name_matcher(track_names):
+    """
+    Get the matcher for a tuple of track names, reused until the set of names changes.
+
+    Codes and descriptions are both the track name so match returns the closest name.
+    """
+    return ChoiceMatcher(
+        [(track_name, track_name) for track_name in track_names],
+        score_cutoff=TRACK_NAME_SCORE_CUTOFF
+    )
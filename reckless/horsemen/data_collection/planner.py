@@ -0,0 +1,211 @@
+"""
+Work planner for Equibase downloads.
+
+Works out which entries cards, horse results and charts a set of races still needs
+with a few aggregate queries over the whole set instead of queries per race.
+"""
+
+import logging
+from dataclasses import dataclass
+from django.db.models import Count, Q
+from horsemen.models import Races, Entries, Horses, Tracks
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RaceDaySummary:
+    """What a single race date still needs, summed over its races."""
+    race_date: object
+    total_entries: int
+    null_id_entries: int
+    results_needed: int
+    charts_needed: int
+
+
+@dataclass(frozen=True)
+class DownloadPlan:
+    """
+    Files a set of races needs, each a frozenset of (url, filename) tuples, along
+    with a summary per race date in date order.
+    """
+    entries_cards: frozenset
+    horse_results: frozenset
+    charts: frozenset
+    race_days: tuple
+
+    def is_empty(self):
+        return not (self.entries_cards or self.horse_results or self.charts)
+
+
+def get_entries_card_filename(track, race_date):
+    return f'EQB_ENTRIES_{track.code}_{race_date.strftime("%Y%m%d")}.html'
+
+
+def get_horse_results_filename(horse, race_date):
+    return f'EQB_HORSERESULTS_{horse.equibase_horse_id}_{race_date.strftime("%Y%m%d")}.html'
+
+
+def get_chart_filename(track, race_date):
+    return f'EQB_CHART_{track.code}_{race_date.strftime("%Y%m%d")}.pdf'
+
+
+def get_entries_cards_to_download(races, include_empty_cards=True):
+    """
+    Entries cards for race days with a horse that doesnt have an equibase id yet.
+
+    Args:
+        races: Races queryset
+        include_empty_cards: Also get cards for races without any entries
+
+    Returns:
+        frozenset of (url, filename) tuples
+    """
+    needs_card = Q(null_id_entries__gt=0)
+    if include_empty_cards:
+        needs_card |= Q(total_entries=0)
+
+    track_dates = Races.objects.filter(
+        id__in=races.values('id')
+    ).annotate(
+        total_entries=Count('entries'),
+        null_id_entries=Count('entries', filter=Q(entries__horse__equibase_horse_id__isnull=True))
+    ).filter(needs_card).values_list('track_id', 'race_date').distinct()
+
+    return get_track_date_files(track_dates, Tracks.get_equibase_entries_url_for_date, get_entries_card_filename)
+
+
+def get_horse_results_to_download(races):
+    """
+    Horse results for entered horses with an equibase id whose history hasnt been imported.
+
+    Args:
+        races: Races queryset
+
+    Returns:
+        frozenset of (url, filename) tuples, horses without a results url are left out
+    """
+    horse_dates = Entries.objects.filter(
+        race__in=races.values('id'),
+        equibase_horse_results_import=False,
+        equibase_horse_entries_import=False,
+        horse__equibase_horse_id__isnull=False
+    ).values_list('horse_id', 'race__race_date').distinct()
+    horse_dates = list(horse_dates)
+
+    horses = Horses.objects.in_bulk({horse_id for horse_id, race_date in horse_dates})
+    files = set()
+    for horse_id, race_date in horse_dates:
+        horse = horses[horse_id]
+        url = horse.get_equibase_horse_results_url()
+        if url:
+            files.add((url, get_horse_results_filename(horse, race_date)))
+    return frozenset(files)
+
+
+def get_past_races_needing_charts(races, before_date):
+    """Races before before_date, without a chart, that a horse entered in races has run in."""
+    return Races.objects.filter(
+        entries__horse__entries__race__in=races.values('id'),
+        race_date__lt=before_date,
+        equibase_chart_import=False
+    )
+
+
+def get_charts_to_download(races, before_date):
+    """
+    Charts for past races of the horses entered in races.
+
+    Args:
+        races: Races queryset
+        before_date: Only races before this date have a chart
+
+    Returns:
+        frozenset of (url, filename) tuples
+    """
+    track_dates = get_past_races_needing_charts(races, before_date).values_list('track_id', 'race_date').distinct()
+    return get_track_date_files(track_dates, Tracks.get_equibase_chart_url_for_date, get_chart_filename)
+
+
+def get_track_date_files(track_dates, get_url, get_filename):
+    """Build (url, filename) tuples for (track_id, race_date) rows, loading the tracks in one query."""
+    track_dates = list(track_dates)
+    tracks = Tracks.objects.in_bulk({track_id for track_id, race_date in track_dates})
+    return frozenset(
+        (get_url(tracks[track_id], race_date), get_filename(tracks[track_id], race_date))
+        for track_id, race_date in track_dates
+    )
+
+
+def get_race_day_summaries(races, before_date):
+    """
+    Count what each race date needs.
+
+    Entry counts are per entry and charts needed are distinct past races per race,
+    summed over the date's races.
+
+    Args:
+        races: Races queryset
+        before_date: Only races before this date have a chart
+
+    Returns:
+        tuple of RaceDaySummary in date order
+    """
+    race_dates = dict(Races.objects.filter(id__in=races.values('id')).values_list('id', 'race_date'))
+    counts = {
+        race_date: {'total_entries': 0, 'null_id_entries': 0, 'results_needed': 0, 'charts_needed': 0}
+        for race_date in race_dates.values()
+    }
+
+    entry_counts = Entries.objects.filter(race__in=races.values('id')).values('race_id').annotate(
+        total_entries=Count('id'),
+        null_id_entries=Count('id', filter=Q(horse__equibase_horse_id__isnull=True)),
+        results_needed=Count('id', filter=Q(
+            equibase_horse_results_import=False,
+            equibase_horse_entries_import=False,
+            horse__equibase_horse_id__isnull=False
+        ))
+    )
+    for row in entry_counts:
+        for field in ('total_entries', 'null_id_entries', 'results_needed'):
+            counts[race_dates[row['race_id']]][field] += row[field]
+
+    past_race_counts = get_past_races_needing_charts(races, before_date).values(
+        'entries__horse__entries__race_id'
+    ).annotate(charts_needed=Count('id', distinct=True))
+    for row in past_race_counts:
+        counts[race_dates[row['entries__horse__entries__race_id']]]['charts_needed'] += row['charts_needed']
+
+    return tuple(
+        RaceDaySummary(race_date=race_date, **counts[race_date])
+        for race_date in sorted(counts)
+    )
+
+
+def plan_downloads(races, before_date, include_empty_cards=True):
+    """
+    Plan every download a set of races needs.
+
+    Loading entries fills in horse ids, which changes the horse results and charts
+    that are needed, so plan again after each stage is loaded.
+
+    Args:
+        races: Races queryset
+        before_date: Only races before this date have a chart
+        include_empty_cards: Also get entries cards for races without any entries
+
+    Returns:
+        DownloadPlan
+    """
+    plan = DownloadPlan(
+        entries_cards=get_entries_cards_to_download(races, include_empty_cards),
+        horse_results=get_horse_results_to_download(races),
+        charts=get_charts_to_download(races, before_date),
+        race_days=get_race_day_summaries(races, before_date)
+    )
+    logger.info(
+        'planned %s entries cards, %s horse results and %s charts over %s race days',
+        len(plan.entries_cards), len(plan.horse_results), len(plan.charts), len(plan.race_days)
+    )
+    return plan
@@ -0,0 +1,231 @@
+"""
+Content addressed store for downloaded files.
+
+Each file's bytes are kept once under RAW_STORE_FOLDER, named by their sha256 and
+optionally gzipped. The RawFiles manifest maps each (source, key) to its blob and
+records whether it has been parsed, so "already fetched" and "already parsed" are
+single indexed lookups instead of directory listings.
+"""
+
+import gzip
+import hashlib
+import logging
+import re
+import shutil
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from horsemen.models import RawFiles
+from horsemen.data_collection.utils import RAW_STORE_FOLDER
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# manifest statuses
+RAW_FILE_FETCHED = 'F'
+RAW_FILE_PARSED = 'P'
+RAW_FILE_FAILED = 'X'
+
+# gzip new blobs
+RAW_STORE_COMPRESS = False
+
+# bytes read at a time while hashing and copying
+RAW_STORE_CHUNK_SIZE = 1024 * 1024
+
+# EQB_CHART_CD_20241005.pdf is source EQB_CHART on 2024-10-05
+RAW_FILENAME_PATTERN = re.compile(r'^([A-Z]+_[A-Z]+)_(?:.*_)?(\d{8})\.\w+$')
+
+
+def get_source_and_date_from_filename(filename):
+    """
+    Args:
+        filename: Scraped filename such as EQB_CHART_CD_20241005.pdf
+
+    Returns:
+        Tuple of source and date, date is None when the name doesnt have one
+    """
+    match = RAW_FILENAME_PATTERN.match(filename)
+    if match:
+        return match.group(1), datetime.strptime(match.group(2), '%Y%m%d').date()
+    return '_'.join(filename.split('_')[:2]).split('.')[0], None
+
+
+def get_content_hash(file_path):
+    """Get the sha256 hex digest of a file's bytes."""
+    content_hash = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        while chunk := file.read(RAW_STORE_CHUNK_SIZE):
+            content_hash.update(chunk)
+    return content_hash.hexdigest()
+
+
+def get_blob_path(content_hash, compressed=False):
+    """Path of the blob for a hash, blobs are spread over folders by the first two characters."""
+    return RAW_STORE_FOLDER / content_hash[:2] / (f'{content_hash}.gz' if compressed else content_hash)
+
+
+def write_blob(file_path, content_hash, compress=RAW_STORE_COMPRESS):
+    """
+    Copy a file into the store unless its content is already there.
+
+    Args:
+        file_path: File to store
+        content_hash: sha256 of the file
+        compress: gzip the blob if it has to be written
+
+    Returns:
+        Whether the stored blob is compressed
+    """
+    for compressed in (False, True):
+        if get_blob_path(content_hash, compressed).exists():
+            return compressed
+
+    blob_path = get_blob_path(content_hash, compress)
+    blob_path.parent.mkdir(parents=True, exist_ok=True)
+
+    # write to a temp file of our own next to the blob then rename so a partial
+    # blob is never seen, even with other threads or processes storing the same file
+    with tempfile.NamedTemporaryFile(dir=blob_path.parent, prefix=f'{blob_path.name}.', suffix='.tmp', delete=False) as temp_file:
+        temp_path = Path(temp_file.name)
+        try:
+            with open(file_path, 'rb') as source_file:
+                with (gzip.GzipFile(fileobj=temp_file, mode='wb') if compress else temp_file) as blob_file:
+                    shutil.copyfileobj(source_file, blob_file, RAW_STORE_CHUNK_SIZE)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+    temp_path.replace(blob_path)
+    return compress
+
+
+def store_raw_file(file_path, compress=RAW_STORE_COMPRESS):
+    """
+    Add a file to the store and the manifest.
+
+    A key that comes back with different content is pointed at the new blob and
+    marked fetched again, the same content keeps its status.
+
+    Args:
+        file_path: Downloaded file, its name is the key
+        compress: gzip the blob if it has to be written
+
+    Returns:
+        RawFiles: The manifest entry
+    """
+    content_hash = get_content_hash(file_path)
+    compressed = write_blob(file_path, content_hash, compress)
+    source, file_date = get_source_and_date_from_filename(file_path.name)
+
+    raw_file, created = RawFiles.objects.get_or_create(
+        source=source,
+        key=file_path.name,
+        defaults={
+            'file_date': file_date,
+            'content_hash': content_hash,
+            'compressed': compressed,
+            'size': file_path.stat().st_size
+        }
+    )
+    if not created and raw_file.content_hash != content_hash:
+        logger.info('%s changed, storing new content %s', file_path.name, content_hash)
+        raw_file.content_hash = content_hash
+        raw_file.compressed = compressed
+        raw_file.size = file_path.stat().st_size
+        raw_file.status = RAW_FILE_FETCHED
+        raw_file.save()
+    return raw_file
+
+
+def get_raw_file(filename):
+    """Get the manifest entry for a scraped filename, or None if it was never stored."""
+    source = get_source_and_date_from_filename(filename)[0]
+    return RawFiles.objects.filter(source=source, key=filename).first()
+
+
+def is_content_parsed(content_hash):
+    """Whether byte identical content has been parsed under any key."""
+    return RawFiles.objects.filter(content_hash=content_hash, status=RAW_FILE_PARSED).exists()
+
+
+def set_raw_file_status(raw_file, status):
+    """Record a manifest entry's status."""
+    raw_file.status = status
+    raw_file.save(update_fields=['status', 'updated_at'])
+
+
+def read_raw_file(raw_file):
+    """Get a manifest entry's bytes from its blob."""
+    blob_path = get_blob_path(raw_file.content_hash, raw_file.compressed)
+    if raw_file.compressed:
+        with gzip.open(blob_path, 'rb') as blob_file:
+            return blob_file.read()
+    return blob_path.read_bytes()
+
+
+def restore_raw_file(filename, file_path):
+    """
+    Check the store before downloading a file.
+
+    Args:
+        filename: Scraped filename
+        file_path: Where the file would be downloaded to
+
+    Returns:
+        True if the file was already fetched, in which case it is written back to
+        file_path unless it has already been parsed
+    """
+    raw_file = get_raw_file(filename)
+    if raw_file is None:
+        return False
+    if raw_file.status != RAW_FILE_PARSED:
+        logger.info('%s already fetched, restoring it from the raw store', filename)
+        file_path.write_bytes(read_raw_file(raw_file))
+    else:
+        logger.info('%s already fetched and parsed', filename)
+    return True
+
+
+def store_unparsed_raw_file(file_path):
+    """
+    Store a file that's about to be parsed and drop it if identical content was already parsed.
+
+    Args:
+        file_path: File in the scraping folder
+
+    Returns:
+        RawFiles: The manifest entry to archive the file with once it is parsed, or
+        None if the file was already parsed and has been removed from the scraping folder
+    """
+    raw_file = store_raw_file(file_path)
+    if not is_content_parsed(raw_file.content_hash):
+        return raw_file
+
+    logger.info('Skipping %s, identical content was already parsed', file_path.name)
+    if raw_file.status != RAW_FILE_PARSED:
+        set_raw_file_status(raw_file, RAW_FILE_PARSED)
+    remove_scraped_file(file_path)
+    return None
+
+
+def archive_raw_file(file_path, status=RAW_FILE_PARSED, raw_file=None):
+    """
+    Store a processed file with its status and remove it from the scraping folder.
+
+    Args:
+        file_path: File in the scraping folder
+        status: Status to record, parsed by default
+        raw_file: Manifest entry from store_unparsed_raw_file, so the file isnt hashed and stored again
+    """
+    raw_file = raw_file or store_raw_file(file_path)
+    set_raw_file_status(raw_file, status)
+    remove_scraped_file(file_path)
+
+
+def remove_scraped_file(file_path):
+    """Remove a file from the scraping folder once the store has it."""
+    try:
+        file_path.unlink()
+    except PermissionError as p:
+        logger.error('Could not delete %s due to permission error %s', file_path.name, p)
+    except OSError as p:
+        logger.error('Could not delete %s due to os error %s', file_path.name, p)
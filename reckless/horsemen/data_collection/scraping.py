@@ -3,12 +3,20 @@ from zenrows import ZenRowsClient
 
 # brightdata requests
 import requests
+from requests.adapters import HTTPAdapter
 
 # support
 import logging
 import environ
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from urllib.parse import urlparse
+from django.db import connection
 from horsemen.data_collection.utils import SCRAPING_FOLDER
+from horsemen.data_collection.raw_store import restore_raw_file
 
 # init logging
 logger = logging.getLogger(__name__)
@@ -22,6 +30,234 @@ environ.Env.read_env(BASE_DIR / '.env')
 # FAIL_LIMIT
 FAIL_LIMIT = 2
 
+# concurrent downloads and request starts per second allowed for each provider, and
+# how many blocks in a row pause the provider for block_cooldown seconds
+PROVIDER_LIMITS = {
+    'zenrows': {
+        'concurrency': env.int('ZENROWS_CONCURRENCY', default=5),
+        'requests_per_second': env.float('ZENROWS_REQUESTS_PER_SECOND', default=5.0),
+        'block_limit': env.int('ZENROWS_BLOCK_LIMIT', default=5),
+        'block_cooldown': env.float('ZENROWS_BLOCK_COOLDOWN', default=300.0)
+    },
+    'brightdata': {
+        'concurrency': env.int('BRIGHTDATA_CONCURRENCY', default=5),
+        'requests_per_second': env.float('BRIGHTDATA_REQUESTS_PER_SECOND', default=5.0),
+        'block_limit': env.int('BRIGHTDATA_BLOCK_LIMIT', default=5),
+        'block_cooldown': env.float('BRIGHTDATA_BLOCK_COOLDOWN', default=300.0)
+    }
+}
+
+# request starts per second and burst allowed for each target site, whichever
+# provider fetches it, the rate halves on a block and creeps back up on success
+DOMAIN_LIMITS = {
+    'equibase.com': {
+        'requests_per_second': env.float('EQUIBASE_REQUESTS_PER_SECOND', default=2.0),
+        'burst': env.int('EQUIBASE_BURST', default=4)
+    },
+    'drf.com': {
+        'requests_per_second': env.float('DRF_REQUESTS_PER_SECOND', default=10.0),
+        'burst': env.int('DRF_BURST', default=8)
+    }
+}
+
+# a blocked domain isnt slowed below this fraction of its configured rate
+MIN_RATE_FRACTION = 0.1
+
+# retry delays in seconds, doubling each attempt up to the cap with full jitter
+BACKOFF_BASE = 2.0
+BACKOFF_CAP = 60.0
+
+
+class RateLimiter:
+    """
+    Token bucket limiting request starts to requests_per_second, allowing bursts of
+    up to burst requests after a quiet spell.
+
+    slow_down and speed_up adapt the rate between MIN_RATE_FRACTION of the
+    configured rate and the configured rate itself.
+    """
+
+    def __init__(self, requests_per_second, burst=1):
+        self.max_rate = requests_per_second
+        self.rate = requests_per_second
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+            # take a token now, waiting for it to refill if the bucket is empty
+            self.tokens -= 1
+            wait_time = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+    def slow_down(self):
+        with self.lock:
+            if self.rate:
+                self.rate = max(self.max_rate * MIN_RATE_FRACTION, self.rate / 2)
+
+    def speed_up(self):
+        with self.lock:
+            if self.rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * MIN_RATE_FRACTION)
+
+
+class CircuitBreaker:
+    """
+    Pause a provider for cooldown seconds after block_limit blocks in a row.
+
+    Once the pause is over a single further block pauses it again, a success
+    closes the breaker.
+    """
+
+    def __init__(self, name, block_limit, cooldown):
+        self.name = name
+        self.block_limit = block_limit
+        self.cooldown = cooldown
+        self.blocks = 0
+        self.open_until = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            wait_time = self.open_until - time.monotonic()
+        if wait_time > 0:
+            logger.info(f'{self.name} is paused, waiting {wait_time:.0f} seconds')
+            time.sleep(wait_time)
+
+    def record_success(self):
+        with self.lock:
+            self.blocks = 0
+
+    def record_block(self):
+        with self.lock:
+            self.blocks += 1
+            if self.blocks >= self.block_limit:
+                logger.warning(f'{self.name} blocked {self.blocks} times in a row, pausing for {self.cooldown} seconds')
+                self.open_until = time.monotonic() + self.cooldown
+                self.blocks = self.block_limit - 1
+
+
+def get_backoff_delay(attempt):
+    """Seconds to wait before retrying after the given attempt, exponential with full jitter."""
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** (attempt - 1)))
+
+
+# shared clients and rate limiters, created on first use
+_provider_lock = threading.Lock()
+_zenrows_client = None
+_brightdata_session = None
+_rate_limiters = {}
+_domain_rate_limiters = {}
+_circuit_breakers = {}
+
+
+def get_rate_limiter(provider):
+    with _provider_lock:
+        if provider not in _rate_limiters:
+            _rate_limiters[provider] = RateLimiter(PROVIDER_LIMITS[provider]['requests_per_second'])
+        return _rate_limiters[provider]
+
+
+def get_domain(url):
+    """The DOMAIN_LIMITS domain a url belongs to, or None if it isnt limited."""
+    hostname = urlparse(url).hostname or ''
+    for domain in DOMAIN_LIMITS:
+        if hostname == domain or hostname.endswith(f'.{domain}'):
+            return domain
+    return None
+
+
+def get_domain_rate_limiter(url):
+    """Get the rate limiter shared by every request to a url's domain, or None if it isnt limited."""
+    domain = get_domain(url)
+    if domain is None:
+        return None
+    with _provider_lock:
+        if domain not in _domain_rate_limiters:
+            limits = DOMAIN_LIMITS[domain]
+            _domain_rate_limiters[domain] = RateLimiter(limits['requests_per_second'], limits['burst'])
+        return _domain_rate_limiters[domain]
+
+
+def get_circuit_breaker(provider):
+    with _provider_lock:
+        if provider not in _circuit_breakers:
+            limits = PROVIDER_LIMITS[provider]
+            _circuit_breakers[provider] = CircuitBreaker(provider, limits['block_limit'], limits['block_cooldown'])
+        return _circuit_breakers[provider]
+
+
+def wait_for_request(provider, url):
+    """Wait until the provider isnt paused and both the provider and the url's domain allow another request."""
+    get_circuit_breaker(provider).wait()
+    get_rate_limiter(provider).wait()
+    domain_rate_limiter = get_domain_rate_limiter(url)
+    if domain_rate_limiter:
+        domain_rate_limiter.wait()
+
+
+def record_success(provider, url):
+    """Close the provider's breaker and let the url's domain speed back up."""
+    get_circuit_breaker(provider).record_success()
+    domain_rate_limiter = get_domain_rate_limiter(url)
+    if domain_rate_limiter:
+        domain_rate_limiter.speed_up()
+
+
+def back_off(provider, url, attempt, blocked=True):
+    """
+    Wait before retrying a failed request.
+
+    Args:
+        provider: zenrows or brightdata
+        url: Url that failed
+        attempt: Attempts made so far, there is no wait after the last one
+        blocked: The site or provider refused the request, which counts towards
+            pausing the provider and slows the url's domain down
+    """
+    if blocked:
+        get_circuit_breaker(provider).record_block()
+        domain_rate_limiter = get_domain_rate_limiter(url)
+        if domain_rate_limiter:
+            domain_rate_limiter.slow_down()
+    if attempt < FAIL_LIMIT:
+        delay = get_backoff_delay(attempt)
+        logger.info(f'retrying {url} in {delay:.1f} seconds')
+        time.sleep(delay)
+
+
+def get_zenrows_client():
+    """Get the zenrows client shared by every download, with a connection pool sized for its concurrency."""
+    global _zenrows_client
+    with _provider_lock:
+        if _zenrows_client is None:
+            concurrency = PROVIDER_LIMITS['zenrows']['concurrency']
+            _zenrows_client = ZenRowsClient(env('ZENROWS_API_KEY'), concurrency=concurrency)
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+            _zenrows_client.requests_session.mount('https://', adapter)
+            _zenrows_client.requests_session.mount('http://', adapter)
+        return _zenrows_client
+
+
+def get_brightdata_session():
+    """Get the requests session shared by every brightdata download."""
+    global _brightdata_session
+    with _provider_lock:
+        if _brightdata_session is None:
+            _brightdata_session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=PROVIDER_LIMITS['brightdata']['concurrency'])
+            _brightdata_session.mount('https://', adapter)
+        return _brightdata_session
+
 def detect_problem(html_content):
     if detect_incapsula_block(html_content):
         logger.error('incapsula block!')
@@ -54,6 +290,10 @@ def scrape_url_zenrows(url, filename):
     if Path(processed_filepath).exists():
             Path(processed_filepath).rename(full_filepath)
 
+    # already fetched, restore it from the raw store if it still needs parsing
+    if not full_filepath.exists() and restore_raw_file(filename, full_filepath):
+        return
+
     # init counter
     fail_counter = 0
 
@@ -63,9 +303,10 @@ def scrape_url_zenrows(url, filename):
         if fail_counter > FAIL_LIMIT:
             return
 
-        client = ZenRowsClient(env('ZENROWS_API_KEY'))
+        client = get_zenrows_client()
 
         try:
+            wait_for_request('zenrows', url)
             response = client.get(url)
 
             logger.info(f'response code for {url} was {response.status_code}')
@@ -75,6 +316,7 @@ def scrape_url_zenrows(url, filename):
                     break
                 else:
                     print(response.text)
+                    back_off('zenrows', url, fail_counter)
                     continue
 
             if full_filepath.name.split('.')[-1] == 'pdf':
@@ -88,6 +330,7 @@ def scrape_url_zenrows(url, filename):
                 if full_filepath.stat().st_size < (25*1024):
                     logger.warning(f'{full_filepath} was too small, deleting and trying again')
                     full_filepath.unlink()
+                    back_off('zenrows', url, fail_counter)
                     continue
 
             else:
@@ -95,18 +338,21 @@ def scrape_url_zenrows(url, filename):
                 html_content = response.text
                 # detect problems with html
                 if detect_problem(html_content):
+                    back_off('zenrows', url, fail_counter)
                     continue
                 
                 # no problems detected
                 with open(full_filepath, 'w', encoding='utf-8') as file:
                     file.write(html_content)
             
+            record_success('zenrows', url)
             logger.info(f"Content successfully saved to {full_filepath}")
 
 
         except Exception as e:  # Handle all exceptions
 
             logger.error(f"An error occurred: {e}")
+            back_off('zenrows', url, fail_counter, blocked=False)
 
 
 def scrape_url_brightdata(url, filename):
@@ -116,6 +362,10 @@ def scrape_url_brightdata(url, filename):
     # create filepath
     full_filepath = SCRAPING_FOLDER / filename
 
+    # already fetched, restore it from the raw store if it still needs parsing
+    if not full_filepath.exists() and restore_raw_file(filename, full_filepath):
+        return
+
     # init counter
     fail_counter = 0
 
@@ -142,7 +392,8 @@ def scrape_url_brightdata(url, filename):
             }
 
             # Make request to Brightdata
-            response = requests.post(brightdata_url, headers=headers, json=payload)
+            wait_for_request('brightdata', url)
+            response = get_brightdata_session().post(brightdata_url, headers=headers, json=payload)
 
             logger.info(f'response code for {url} was {response.status_code}')
             if response.status_code != 200:
@@ -151,6 +402,7 @@ def scrape_url_brightdata(url, filename):
                     break
                 else:
                     print(response.text)
+                    back_off('brightdata', url, fail_counter)
                     continue
 
             if full_filepath.name.split('.')[-1] == 'pdf':
@@ -163,19 +415,87 @@ def scrape_url_brightdata(url, filename):
                 if full_filepath.stat().st_size < (25*1024):
                     logger.warning(f'{full_filepath} was too small, deleting and trying again')
                     full_filepath.unlink()
+                    back_off('brightdata', url, fail_counter)
                     continue
 
             else:
                 html_content = response.text
                 # detect problems with html
                 if detect_problem(html_content):
+                    back_off('brightdata', url, fail_counter)
                     continue
                 
                 # no problems detected
                 with open(full_filepath, 'w', encoding='utf-8') as file:
                     file.write(html_content)
             
+            record_success('brightdata', url)
             logger.info(f"Content successfully saved to {full_filepath}")
 
         except Exception as e:
             logger.error(f"An error occurred: {e}")
+            back_off('brightdata', url, fail_counter, blocked=False)
+
+
+def scrape_url_in_worker(scrape_url, url, filename):
+    """Run a scraper in a pool thread, closing the thread's database connection when it is done."""
+    try:
+        return scrape_url(url, filename)
+    finally:
+        # restoring a file from the raw store opens a connection in this thread
+        connection.close()
+
+
+def scrape_urls_as_completed(url_filenames, provider='zenrows'):
+    """
+    Download many urls at once, keeping to the provider's concurrency and rate limits,
+    and yield the path of each file as soon as it lands.
+
+    Each download keeps the retry and problem detection of the single url scrapers,
+    files that could not be downloaded are not yielded.
+
+    Args:
+        url_filenames: Iterable of (url, filename) tuples
+        provider: zenrows or brightdata
+
+    Yields:
+        Path: Downloaded file in the scraping folder
+    """
+    scrape_url = {
+        'zenrows': scrape_url_zenrows,
+        'brightdata': scrape_url_brightdata
+    }[provider]
+
+    url_filenames = list(url_filenames)
+    if not url_filenames:
+        return
+
+    concurrency = PROVIDER_LIMITS[provider]['concurrency']
+    logger.info(f'downloading {len(url_filenames)} files from {provider} with {concurrency} workers')
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {
+            executor.submit(scrape_url_in_worker, scrape_url, url, filename): filename
+            for url, filename in url_filenames
+        }
+        for future in as_completed(futures):
+            filename = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f'An error occurred downloading {filename}: {e}')
+                continue
+            full_filepath = SCRAPING_FOLDER / filename
+            if full_filepath.exists():
+                yield full_filepath
+
+
+def scrape_urls(url_filenames, provider='zenrows'):
+    """
+    Download many urls at once, keeping to the provider's concurrency and rate limits.
+
+    Args:
+        url_filenames: Iterable of (url, filename) tuples
+        provider: zenrows or brightdata
+    """
+    for _ in scrape_urls_as_completed(url_filenames, provider):
+        pass
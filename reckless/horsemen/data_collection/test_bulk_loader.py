@@ -0,0 +1,180 @@
+from datetime import date, datetime
+from django.db import connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from horsemen.models import (
+    Tracks, Horses, Jockeys, Races, Entries, PointsOfCall, FractionalTimes, Payoffs, Workouts
+)
+from horsemen.data_collection.data_loader import process_parsed_objects
+from horsemen.data_collection.bulk_loader import bulk_process_parsed_objects
+
+def get_parsed_chart(variant=0, race_count=3):
+    """Parsed chart races plus horse results, variant 1 changes fields, fractions, positions and a horse."""
+    parsed_objects = []
+    for race_number in range(1, race_count+1):
+        route = race_number % 3 == 0
+        race = {
+            'object_type': 'race',
+            'equibase_chart_import': True,
+            'track': {'object_type': 'track', 'name': 'SARATOGA'},
+            'race_date': datetime(2024, 8, 1),
+            'race_number': race_number,
+            'distance': 8.5 if route else 6,
+            'purse': 50000+variant,
+            'breed': 'TB',
+            'race_surface': 'D',
+            'condition': 'FAST',
+            'children': [{
+                'object_type': 'fractional_time',
+                'fractional_time_array': [23.0, 47.1, 71.2, 96.3, 103.4] if route else [22.1, 45.3+variant, 57.8, 70.9]
+            }]
+        }
+        for index in range(8):
+            horse_name = f'ZZNEW {race_number}' if variant and index == 0 else f'HORSE {race_number}-{index}'
+            entry = {
+                'object_type': 'entry',
+                'program_number': str(index+1),
+                'post_position': index+1,
+                'horse': {'object_type': 'horse', 'horse_name': horse_name},
+                'jockey': {'object_type': 'jockey', 'first_name': 'JOHN', 'last_name': f'JOCK{index % 4}'},
+                'children': [
+                    {
+                        'object_type': 'point_of_call',
+                        'position': (index+line_index+variant) % 8+1,
+                        'lengths_back': 0.5*index,
+                        'text': text,
+                        'line_index': line_index
+                    }
+                    for line_index, text in enumerate(['Start', '1/4', '1/2', 'Str', 'Fin'])
+                ]
+            }
+            race['children'].append(entry)
+        race['children'].append({
+            'object_type': 'payoff', 'wager_type': 'E', 'winning_numbers': '1-2',
+            'payoff_amount': 12.4+variant, 'base_amount': 2
+        })
+        parsed_objects.append(race)
+
+    track = {'object_type': 'track', 'code': 'SAR', 'country': 'USA'}
+    for horse_index in range(3):
+        horse = {
+            'object_type': 'horse',
+            'equibase_horse_id': 500+horse_index,
+            'horse_name': f'HORSE 1-{horse_index}',
+            'equibase_horse_type': 'TB',
+            'equibase_horse_registry': 'T'
+        }
+        for day in range(1, 3):
+            parsed_objects.append({
+                'object_type': 'entry',
+                'race': {'object_type': 'race', 'track': dict(track), 'race_date': date(2024, 7, day), 'race_number': 2},
+                'horse': dict(horse),
+                'equibase_horse_results_import': True,
+                'equibase_speed_rating': 80+day+variant
+            })
+            parsed_objects.append({
+                'object_type': 'workout', 'track': dict(track), 'horse': dict(horse),
+                'workout_date': date(2024, 6, day), 'surface': 'D', 'distance': 800,
+                'time_seconds': 48.2+variant, 'note': 'B', 'workout_rank': 1, 'workout_total': 5
+            })
+    return parsed_objects
+
+def get_snapshot():
+    """Every loaded row by natural key, comparable across loads."""
+    return {
+        'tracks': sorted(Tracks.objects.values_list('code', 'name')),
+        'horses': sorted(Horses.objects.values_list('horse_name', 'equibase_horse_id')),
+        'jockeys': sorted(Jockeys.objects.values_list('first_name', 'last_name')),
+        'races': sorted(Races.objects.values_list(
+            'track__code', 'race_date', 'race_number', 'distance', 'purse', 'equibase_chart_import'
+        )),
+        'entries': sorted(Entries.objects.values_list(
+            'race__race_date', 'race__race_number', 'program_number', 'horse__horse_name', 'jockey__last_name',
+            'post_position', 'equibase_speed_rating', 'equibase_horse_results_import', 'split_call_velocities_calculated'
+        )),
+        'points_of_call': sorted(PointsOfCall.objects.values_list(
+            'entry__race__race_number', 'entry__horse__horse_name', 'point', 'text', 'distance', 'position', 'lengths_back'
+        )),
+        'fractional_times': sorted(FractionalTimes.objects.values_list('race__race_number', 'point', 'text', 'distance', 'time')),
+        'payoffs': sorted(Payoffs.objects.values_list('race__race_number', 'wager_type', 'winning_numbers', 'payoff_amount')),
+        'workouts': sorted(Workouts.objects.values_list('horse__horse_name', 'workout_date', 'time_seconds'))
+    }
+
+class TestBulkLoader(TestCase):
+    def setUp(self):
+        Tracks.objects.create(code='SAR', name='SARATOGA', country='USA')
+
+    def load_variants(self, load, variants):
+        """Snapshot after loading each variant, with velocities marked calculated in between."""
+        snapshots = []
+        for variant in variants:
+            load(get_parsed_chart(variant))
+            snapshots.append(get_snapshot())
+            Entries.objects.update(split_call_velocities_calculated=True)
+        return snapshots
+
+    def compare_with_row_loader(self, variants):
+        savepoint = transaction.savepoint()
+        row_snapshots = self.load_variants(process_parsed_objects, variants)
+        transaction.savepoint_rollback(savepoint)
+
+        bulk_snapshots = self.load_variants(bulk_process_parsed_objects, variants)
+        for row_snapshot, bulk_snapshot in zip(row_snapshots, bulk_snapshots):
+            for name, rows in row_snapshot.items():
+                self.assertEqual(bulk_snapshot[name], rows, name)
+        return bulk_snapshots
+
+    def test_first_load_matches_row_loader(self):
+        snapshot = self.compare_with_row_loader([0])[0]
+        self.assertEqual(len(snapshot['races']), 5)
+        self.assertEqual(len(snapshot['entries']), 30)
+        self.assertEqual(len(snapshot['points_of_call']), 120)
+
+    def test_changed_fields_are_upserted(self):
+        snapshots = self.compare_with_row_loader([0, 1])
+        self.assertEqual(len(snapshots[1]['races']), len(snapshots[0]['races']))
+        self.assertEqual(len(snapshots[1]['entries']), len(snapshots[0]['entries']))
+        self.assertEqual(set(Races.objects.filter(equibase_chart_import=True).values_list('purse', flat=True)), {50001})
+        self.assertEqual(set(Payoffs.objects.values_list('payoff_amount', flat=True)), {13.4})
+        self.assertEqual(set(Workouts.objects.values_list('time_seconds', flat=True)), {49.2})
+        self.assertTrue(Entries.objects.filter(horse__horse_name='ZZNEW 1', program_number='1').exists())
+
+    def test_changed_calls_and_fractions_clear_calculated_velocities(self):
+        snapshots = self.compare_with_row_loader([0, 0, 1])
+
+        # an unchanged reload keeps every entry calculated
+        self.assertTrue(all(entry[-1] for entry in snapshots[1]['entries']))
+
+        # changed points of call and fractions clear only the chart entries
+        for race_date, race_number, program_number, *fields, calculated in snapshots[2]['entries']:
+            self.assertEqual(calculated, race_date != date(2024, 8, 1))
+
+    def test_only_the_changed_entry_is_cleared(self):
+        bulk_process_parsed_objects(get_parsed_chart())
+        Entries.objects.update(split_call_velocities_calculated=True)
+
+        parsed_objects = get_parsed_chart()
+        parsed_objects[1]['children'][2]['children'][3]['lengths_back'] = 9
+        bulk_process_parsed_objects(parsed_objects)
+        self.assertEqual(
+            list(Entries.objects.filter(split_call_velocities_calculated=False).values_list(
+                'race__race_number', 'program_number'
+            )),
+            [(2, '2')]
+        )
+
+    def test_query_count_doesnt_grow_with_the_load(self):
+        with CaptureQueriesContext(connection) as row_queries:
+            process_parsed_objects(get_parsed_chart())
+
+        # a reload is a fixed number of set based queries, however many races it has
+        with self.assertNumQueries(12):
+            bulk_process_parsed_objects(get_parsed_chart())
+        bulk_process_parsed_objects(get_parsed_chart(race_count=6))
+        with self.assertNumQueries(12):
+            bulk_process_parsed_objects(get_parsed_chart(race_count=6))
+
+        with CaptureQueriesContext(connection) as row_reload_queries:
+            process_parsed_objects(get_parsed_chart())
+        self.assertGreater(len(row_reload_queries), 12 * 10)
+        self.assertGreater(len(row_queries), len(row_reload_queries))
@@ -0,0 +1,158 @@
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from django.test import override_settings
+from horsemen.data_collection import collector
+
+class TestDownloadPipeline(unittest.TestCase):
+    def setUp(self):
+        self.file_paths = [Path(f'EQB_CHART_CD_2024100{day}.pdf') for day in range(1, 6)]
+        self.loaded = []
+        self.archived = []
+        self.download_error = None
+        self.extract_error_at = None
+
+        # run every stage in this process with stand ins for the downloads, extraction and loading
+        stand_ins = {
+            'ProcessPoolExecutor': lambda max_workers, mp_context, initializer: ThreadPoolExecutor(max_workers=2),
+            'enqueue_fetches': lambda url_filenames, file_type, priority: len(url_filenames),
+            'fetch_queued_files': self.fetch_queued_files,
+            'store_unparsed_raw_file': self.store_unparsed_raw_file,
+            'extract_equibase_file': lambda file_path, file_type, debug_flag: [file_path.name],
+            'load_parsed_objects': self.loaded.extend,
+            'archive_raw_file': self.archive_raw_file
+        }
+        for name, stand_in in stand_ins.items():
+            self.addCleanup(setattr, collector, name, getattr(collector, name))
+            setattr(collector, name, stand_in)
+
+    def fetch_queued_files(self, kinds, filenames=None):
+        self.fetched_filenames = filenames
+        for index, file_path in enumerate(self.file_paths):
+            if self.download_error and index == 3:
+                raise self.download_error
+            yield file_path
+
+    def store_unparsed_raw_file(self, file_path):
+        if file_path == self.extract_error_at:
+            raise OSError('raw store unavailable')
+        return f'raw {file_path.name}'
+
+    def archive_raw_file(self, file_path, raw_file=None):
+        # each file is archived with the entry it was stored under before extraction
+        self.assertEqual(raw_file, f'raw {file_path.name}')
+        self.archived.append(file_path)
+
+    def run_pipeline(self):
+        collector.download_and_process_files([('url', 'file')], 'CHART')
+
+    def test_every_file_is_loaded_in_order(self):
+        self.run_pipeline()
+        self.assertEqual(self.loaded, [file_path.name for file_path in self.file_paths])
+        self.assertEqual(self.archived, self.file_paths)
+
+    def test_only_the_batch_is_downloaded(self):
+        self.run_pipeline()
+        self.assertEqual(self.fetched_filenames, ['file'])
+
+    def test_download_error_is_raised_after_earlier_files_load(self):
+        self.download_error = ConnectionError('provider down')
+        with self.assertLogs(collector.logger, 'ERROR'), self.assertRaises(ConnectionError):
+            self.run_pipeline()
+        self.assertEqual(self.archived, self.file_paths[:3])
+
+    def test_extract_error_is_raised(self):
+        self.extract_error_at = self.file_paths[1]
+        with self.assertLogs(collector.logger, 'ERROR'), self.assertRaises(OSError):
+            self.run_pipeline()
+        self.assertEqual(self.archived, self.file_paths[:1])
+
+class TestParseEquibaseFiles(unittest.TestCase):
+    def setUp(self):
+        scraping_folder = tempfile.TemporaryDirectory()
+        self.addCleanup(scraping_folder.cleanup)
+        for filename in ['EQB_ENTRIES_CD_20241001.html', 'EQB_CHART_CD_20241001.pdf']:
+            Path(scraping_folder.name, filename).touch()
+
+        self.loaded = []
+        self.pools = []
+        stand_ins = {
+            'SCRAPING_FOLDER': Path(scraping_folder.name),
+            'parse_equibase_entries': lambda file_path: file_path.name,
+            'parse_extracted_entries_data': lambda extracted_data: [extracted_data],
+            'parse_equibase_chart': lambda file_path, debug_flag: file_path.name,
+            'parse_extracted_chart_data': lambda extracted_data: [extracted_data],
+            'load_parsed_objects': self.loaded.extend,
+            'archive_raw_file': lambda file_path, raw_file=None: None,
+            'parse_equibase_chart_files_in_parallel': lambda debug_flag=False, max_workers=None: self.pools.append(max_workers)
+        }
+        for name, stand_in in stand_ins.items():
+            self.addCleanup(setattr, collector, name, getattr(collector, name))
+            setattr(collector, name, stand_in)
+
+    def test_serial_by_default(self):
+        collector.parse_equibase_files()
+        self.assertCountEqual(self.loaded, ['EQB_ENTRIES_CD_20241001.html', 'EQB_CHART_CD_20241001.pdf'])
+        self.assertEqual(self.pools, [])
+
+    def test_parallel_sends_charts_to_the_pool(self):
+        collector.parse_equibase_files(parallel=True, max_workers=3)
+        self.assertEqual(self.loaded, ['EQB_ENTRIES_CD_20241001.html'])
+        self.assertEqual(self.pools, [3])
+
+class StandInResponseCache:
+    def __init__(self, urls):
+        self.pending = set(urls)
+        self.saved = set()
+
+    def discard(self, url):
+        self.pending.discard(url)
+
+    def save(self):
+        self.saved |= self.pending
+        self.pending = set()
+
+class TestLoadDrfCards(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(setattr, collector, 'load_parsed_objects', collector.load_parsed_objects)
+        collector.load_parsed_objects = self.load_parsed_objects
+
+    def load_parsed_objects(self, parsed_objects):
+        if parsed_objects == ['bad race']:
+            raise ValueError('bad race')
+        return parsed_objects.count('bad entry')
+
+    def test_only_cards_that_loaded_whole_are_cached(self):
+        objects_by_url = {
+            'whole': ['race', 'race'],
+            'partial': ['race', 'bad entry'],
+            'failed': ['bad race']
+        }
+        response_cache = StandInResponseCache(objects_by_url)
+        with self.assertLogs(collector.logger, 'WARNING'):
+            collector.load_drf_cards(objects_by_url, response_cache)
+        self.assertEqual(response_cache.saved, {'whole'})
+
+class TestLoadingBackends(unittest.TestCase):
+    def setUp(self):
+        self.loads = []
+        original_backends = collector.LOADING_BACKENDS
+        collector.LOADING_BACKENDS = {
+            'row': lambda parsed_objects: self.loads.append(('row', parsed_objects)),
+            'bulk': lambda parsed_objects: self.loads.append(('bulk', parsed_objects))
+        }
+        self.addCleanup(setattr, collector, 'LOADING_BACKENDS', original_backends)
+
+    def test_backend_comes_from_settings(self):
+        with override_settings(DATA_LOADING_BACKEND='bulk'):
+            collector.load_parsed_objects(['race'])
+        collector.load_parsed_objects(['entry'], backend='row')
+        self.assertEqual(self.loads, [('bulk', ['race']), ('row', ['entry'])])
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            collector.load_parsed_objects([], backend='copy')
+
+if __name__ == '__main__':
+    unittest.main()
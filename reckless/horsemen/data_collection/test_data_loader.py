@@ -0,0 +1,200 @@
+from datetime import date
+from django.test import TestCase
+from horsemen.models import Tracks, Races, Horses, Entries, PointsOfCall, FractionalTimes
+from horsemen.data_collection import data_loader
+from horsemen.data_collection.data_loader import IdentityMap, current_identity_map
+
+class TestIdentityMap(TestCase):
+    def setUp(self):
+        self.track = Tracks.objects.create(code='SAR', name='SARATOGA', country='USA')
+        self.horse = Horses.objects.create(horse_name='KNOWN HORSE')
+
+    def start_session(self):
+        identity_map = IdentityMap()
+        self.addCleanup(current_identity_map.reset, current_identity_map.set(identity_map))
+        return identity_map
+
+    def horse_results_entry(self, horse_name, day):
+        return {
+            'object_type': 'entry',
+            'race': {
+                'object_type': 'race',
+                'track': {'object_type': 'track', 'code': 'SAR', 'country': 'USA'},
+                'race_date': date(2024, 7, day),
+                'race_number': 2
+            },
+            'horse': {
+                'object_type': 'horse',
+                'equibase_horse_id': 500,
+                'horse_name': horse_name,
+                'equibase_horse_type': 'TB',
+                'equibase_horse_registry': 'T'
+            },
+            'equibase_horse_results_import': True
+        }
+
+    def test_preload_answers_lookups_from_memory(self):
+        identity_map = IdentityMap()
+        identity_map.preload([{
+            'object_type': 'entry',
+            'horse': {'object_type': 'horse', 'horse_name': 'KNOWN HORSE'},
+            'children': [{'object_type': 'horse', 'horse_name': 'UNKNOWN HORSE'}]
+        }])
+        self.assertEqual(identity_map.loaded_values[(Horses, 'horse_name')], {'KNOWN HORSE', 'UNKNOWN HORSE'})
+
+        # tracks are small enough to load whole
+        with self.assertNumQueries(0):
+            self.assertEqual(identity_map.get(Horses, horse_name='KNOWN HORSE'), self.horse)
+            self.assertIsNone(identity_map.get(Horses, horse_name='UNKNOWN HORSE'))
+            self.assertEqual(identity_map.get(Tracks, code='SAR'), self.track)
+            self.assertEqual(identity_map.get(Tracks, name__startswith='SARA'), self.track)
+
+    def test_lookups_share_one_instance(self):
+        identity_map = IdentityMap()
+        with self.assertNumQueries(1):
+            horse = identity_map.get(Horses, horse_name='KNOWN HORSE')
+
+        # lookups on identifiers that werent loaded go to the database but keep the held instance
+        with self.assertNumQueries(1):
+            self.assertIs(identity_map.get(Horses, horse_name='KNOWN HORSE'), horse)
+        same_row = Horses.objects.get(pk=horse.pk)
+        self.assertIs(identity_map.add(same_row), horse)
+
+        identity_map.load(Horses, 'horse_name', ['KNOWN HORSE'])
+        with self.assertNumQueries(0):
+            self.assertIs(identity_map.get(Horses, horse_name='KNOWN HORSE'), horse)
+
+    def test_instances_created_mid_load_are_found(self):
+        identity_map = self.start_session()
+        identity_map.preload([{'object_type': 'horse', 'horse_name': 'NEW HORSE'}])
+
+        horse = data_loader.remember_instance(Horses.objects.create(horse_name='NEW HORSE'))
+        with self.assertNumQueries(0):
+            self.assertIs(data_loader.find_instance(Horses, horse_name='NEW HORSE'), horse)
+
+    def test_load_creates_a_new_horse_once(self):
+        data_loader.process_parsed_objects([
+            self.horse_results_entry('NEW HORSE', 1),
+            self.horse_results_entry('NEW HORSE', 2)
+        ])
+        horse = Horses.objects.get(horse_name='NEW HORSE')
+        self.assertEqual(Entries.objects.filter(horse=horse).count(), 2)
+
+    def test_failed_child_clears_identity_map(self):
+        identity_map = self.start_session()
+        identity_map.load_all(Tracks)
+        race = Races.objects.create(track=self.track, race_date=date(2024, 8, 1), race_number=1, distance=6, breed='TB')
+        entry = Entries.objects.create(race=race, horse=self.horse, program_number='1')
+
+        with self.assertLogs(data_loader.logger, 'ERROR'):
+            data_loader.process_child_objects([
+                {'object_type': 'point_of_call', 'position': 1, 'lengths_back': 0, 'text': 'Bad', 'line_index': 99}
+            ], entry)
+        self.assertEqual(identity_map.instances, {})
+        self.assertEqual(identity_map.loaded_models, set())
+
+    def test_session_ends_with_the_load(self):
+        sessions = []
+        original_parser = data_loader.OBJECT_MAP['track']
+        self.addCleanup(data_loader.OBJECT_MAP.__setitem__, 'track', original_parser)
+
+        def parse_track(track_data):
+            sessions.append(current_identity_map.get())
+            return original_parser(track_data)
+        data_loader.OBJECT_MAP['track'] = parse_track
+
+        data_loader.process_parsed_objects([{'object_type': 'track', 'code': 'SAR'}])
+        self.assertIsInstance(sessions[0], IdentityMap)
+        self.assertIsNone(current_identity_map.get())
+
+        # and when the load fails
+        with self.assertLogs(data_loader.logger, 'ERROR'), self.assertRaises(ValueError):
+            data_loader.process_parsed_objects([{'object_type': 'track', 'code': 'SAR'}, {'object_type': 'unknown'}])
+        self.assertIsNot(sessions[1], sessions[0])
+        self.assertIsNone(current_identity_map.get())
+
+class TestChildObjects(TestCase):
+    def setUp(self):
+        Tracks.objects.create(code='SAR', name='SARATOGA', country='USA')
+
+    def parsed_race(self, race_number, horse_names):
+        return {
+            'object_type': 'race',
+            'track': {'object_type': 'track', 'code': 'SAR'},
+            'race_date': date(2024, 8, 1),
+            'race_number': race_number,
+            'distance': 6,
+            'breed': 'TB',
+            'children': [{'object_type': 'fractional_time', 'fractional_time_array': [22.1, 45.3, 57.8, 70.9]}] + [
+                {
+                    'object_type': 'entry',
+                    'program_number': str(index+1),
+                    'horse': {'object_type': 'horse', 'horse_name': horse_name},
+                    'children': [
+                        {'object_type': 'point_of_call', 'position': index+1, 'lengths_back': index, 'text': text, 'line_index': line_index}
+                        for line_index, text in enumerate(['Start', '1/4', '1/2', 'Str', 'Fin'])
+                    ]
+                }
+                for index, horse_name in enumerate(horse_names)
+            ]
+        }
+
+    def test_failed_child_keeps_its_siblings(self):
+        parsed_race = self.parsed_race(1, ['FIRST', 'BAD (HORSE)', 'THIRD'])
+        parsed_race['children'][1]['children'][2]['line_index'] = 99
+
+        with self.assertLogs(data_loader.logger, 'ERROR') as logs:
+            skipped_count = data_loader.process_parsed_objects([parsed_race])
+        self.assertTrue(all(record.exc_info for record in logs.records if record.msg.startswith('Skipping')))
+        self.assertEqual(skipped_count, 2)
+
+        # the bad entry is rolled back with its horse and points of call, the bad point of call on its own
+        self.assertEqual(
+            sorted(Entries.objects.values_list('horse__horse_name', flat=True)),
+            ['FIRST', 'THIRD']
+        )
+        self.assertFalse(Horses.objects.filter(horse_name__startswith='BAD').exists())
+        self.assertEqual(PointsOfCall.objects.filter(entry__horse__horse_name='FIRST').count(), 4)
+        self.assertEqual(PointsOfCall.objects.filter(entry__horse__horse_name='THIRD').count(), 5)
+        self.assertEqual(FractionalTimes.objects.count(), 4)
+
+        # a clean load skips nothing
+        self.assertEqual(data_loader.process_parsed_objects([self.parsed_race(2, ['FOURTH'])]), 0)
+
+    def test_failed_race_rolls_back_whole_race(self):
+        good_race = self.parsed_race(1, ['FIRST', 'SECOND'])
+        bad_race = self.parsed_race(2, ['THIRD', 'FOURTH'])
+        bad_race['children'].append({'program_number': '3'})
+
+        with self.assertLogs(data_loader.logger, 'ERROR'), self.assertRaises(KeyError):
+            data_loader.process_parsed_objects([good_race, bad_race])
+
+        # the race before it is kept
+        self.assertEqual(list(Races.objects.values_list('race_number', flat=True)), [1])
+        self.assertEqual(
+            sorted(Entries.objects.values_list('horse__horse_name', flat=True)),
+            ['FIRST', 'SECOND']
+        )
+        self.assertFalse(Horses.objects.filter(horse_name__in=['THIRD', 'FOURTH']).exists())
+        self.assertEqual(FractionalTimes.objects.count(), 4)
+
+    def test_failed_child_clears_identity_map(self):
+        sessions = []
+        original_parser = data_loader.OBJECT_MAP['payoff']
+        self.addCleanup(data_loader.OBJECT_MAP.__setitem__, 'payoff', original_parser)
+
+        def parse_payoff(payoff_data, parent_object=None):
+            identity_map = current_identity_map.get()
+            sessions.append(dict(identity_map.instances))
+            raise ValueError('bad payoff')
+        data_loader.OBJECT_MAP['payoff'] = parse_payoff
+
+        parsed_race = self.parsed_race(1, ['FIRST'])
+        parsed_race['children'] += [{'object_type': 'payoff'}, {'object_type': 'payoff'}]
+        with self.assertLogs(data_loader.logger, 'ERROR'):
+            data_loader.process_parsed_objects([parsed_race])
+
+        # the first payoff sees the preloaded rows, the second an emptied map
+        self.assertIn(Tracks, sessions[0])
+        self.assertEqual(sessions[1], {})
+        self.assertEqual(Entries.objects.count(), 1)
@@ -0,0 +1,56 @@
+import tempfile
+import unittest
+from datetime import date
+from pathlib import Path
+from types import SimpleNamespace
+from horsemen.data_collection import extraction_cache
+
+class TestExtractionCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+        # cache into the temp folder
+        original_folder = extraction_cache.EXTRACTION_CACHE_FOLDER
+        extraction_cache.EXTRACTION_CACHE_FOLDER = Path(self.temp_dir.name) / 'extracted'
+        self.addCleanup(setattr, extraction_cache, 'EXTRACTION_CACHE_FOLDER', original_folder)
+
+        # count extractions with a stand in extractor
+        self.calls = []
+        self.extractor_module = SimpleNamespace(EXTRACTOR_VERSION=1)
+        original_extractor = extraction_cache.EXTRACTORS['ENTRIES']
+        extraction_cache.EXTRACTORS['ENTRIES'] = (self.extract, self.extractor_module)
+        self.addCleanup(extraction_cache.EXTRACTORS.__setitem__, 'ENTRIES', original_extractor)
+
+        self.file_path = Path(self.temp_dir.name) / 'EQB_ENTRIES_CD_20241005.html'
+        self.file_path.write_text('<html></html>')
+
+    def extract(self, file_path):
+        self.calls.append(file_path)
+        return [{'race_date': date(2024, 10, 5), 'race_number': 1, 'entries': []}]
+
+    def test_identical_content_uses_cache(self):
+        first = extraction_cache.extract_with_cache(self.file_path, 'ENTRIES')
+        second = extraction_cache.extract_with_cache(self.file_path, 'ENTRIES')
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_changed_content_or_version_extracts_again(self):
+        extraction_cache.extract_with_cache(self.file_path, 'ENTRIES')
+        self.file_path.write_text('<html>changed</html>')
+        extraction_cache.extract_with_cache(self.file_path, 'ENTRIES')
+        self.extractor_module.EXTRACTOR_VERSION = 2
+        extraction_cache.extract_with_cache(self.file_path, 'ENTRIES')
+        self.assertEqual(len(self.calls), 3)
+
+    def test_debug_extracts_again(self):
+        extraction_cache.extract_with_cache(self.file_path, 'ENTRIES')
+        extraction_cache.extract_with_cache(self.file_path, 'ENTRIES', debug_flag=True)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_unknown_file_type(self):
+        with self.assertRaises(ValueError):
+            extraction_cache.extract_with_cache(self.file_path, 'WORKOUTS')
+
+if __name__ == '__main__':
+    unittest.main()
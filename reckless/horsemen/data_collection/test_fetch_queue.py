@@ -0,0 +1,109 @@
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+from django.test import TestCase
+from django.utils import timezone
+from horsemen.models import FetchQueueItems
+from horsemen.data_collection import fetch_queue
+
+class TestFetchQueue(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        original_folder = fetch_queue.SCRAPING_FOLDER
+        fetch_queue.SCRAPING_FOLDER = Path(self.temp_dir.name)
+        self.addCleanup(setattr, fetch_queue, 'SCRAPING_FOLDER', original_folder)
+
+        # download with a stand in scraper that only lands files in self.available
+        self.available = set()
+        original_scraper = fetch_queue.scrape_urls_as_completed
+        fetch_queue.scrape_urls_as_completed = self.scrape
+        self.addCleanup(setattr, fetch_queue, 'scrape_urls_as_completed', original_scraper)
+
+    def scrape(self, url_filenames, provider='zenrows'):
+        for url, filename in url_filenames:
+            if filename in self.available:
+                file_path = fetch_queue.SCRAPING_FOLDER / filename
+                file_path.write_text(url)
+                yield file_path
+
+    def test_claims_higher_priority_first(self):
+        fetch_queue.enqueue_fetches([('url_old', 'EQB_CHART_CD_20200101.pdf')], 'CHART')
+        fetch_queue.enqueue_fetches(
+            [('url_new', 'EQB_CHART_CD_20241005.pdf')], 'CHART', fetch_queue.FETCH_PRIORITY_CURRENT
+        )
+        items = fetch_queue.claim_fetches(limit=1, worker='a')
+        self.assertEqual([item.filename for item in items], ['EQB_CHART_CD_20241005.pdf'])
+
+        # claimed items arent handed to another worker
+        items = fetch_queue.claim_fetches(worker='b')
+        self.assertEqual([item.filename for item in items], ['EQB_CHART_CD_20200101.pdf'])
+        self.assertEqual(fetch_queue.claim_fetches(worker='c'), [])
+
+    def test_enqueue_keeps_claims_and_raises_priority(self):
+        fetch_queue.enqueue_fetches([('url', 'EQB_ENTRIES_CD_20241005.html')], 'ENTRIES')
+        fetch_queue.enqueue_fetches(
+            [('url', 'EQB_ENTRIES_CD_20241005.html')], 'ENTRIES', fetch_queue.FETCH_PRIORITY_CURRENT
+        )
+        item = FetchQueueItems.objects.get()
+        self.assertEqual(item.priority, fetch_queue.FETCH_PRIORITY_CURRENT)
+
+        fetch_queue.claim_fetches(worker='a')
+        fetch_queue.enqueue_fetches([('url', 'EQB_ENTRIES_CD_20241005.html')], 'ENTRIES')
+        self.assertEqual(FetchQueueItems.objects.get().status, fetch_queue.FETCH_CLAIMED)
+
+    def test_stale_claims_are_claimed_again(self):
+        fetch_queue.enqueue_fetches([('url', 'EQB_CHART_CD_20241005.pdf')], 'CHART')
+        fetch_queue.claim_fetches(worker='crashed')
+        FetchQueueItems.objects.update(claimed_at=timezone.now() - fetch_queue.FETCH_CLAIM_TIMEOUT * 2)
+
+        items = fetch_queue.claim_fetches(worker='b')
+        self.assertEqual(len(items), 1)
+        self.assertEqual(FetchQueueItems.objects.get().claimed_by, 'b')
+
+    def test_failed_fetches_back_off_then_fail(self):
+        fetch_queue.enqueue_fetches([('url', 'EQB_CHART_CD_20241005.pdf')], 'CHART')
+        self.assertEqual(list(fetch_queue.fetch_queued_files(worker='a')), [])
+
+        item = FetchQueueItems.objects.get()
+        self.assertEqual((item.status, item.attempts), (fetch_queue.FETCH_QUEUED, 1))
+        self.assertGreater(item.next_attempt_at, timezone.now() + timedelta(minutes=4))
+        self.assertEqual(fetch_queue.claim_fetches(worker='a'), [])
+
+        # out of attempts
+        FetchQueueItems.objects.update(attempts=fetch_queue.FETCH_MAX_ATTEMPTS - 1, next_attempt_at=timezone.now())
+        list(fetch_queue.fetch_queued_files(worker='a'))
+        self.assertEqual(FetchQueueItems.objects.get().status, fetch_queue.FETCH_FAILED)
+
+        # failed items are only queued again on purpose
+        fetch_queue.enqueue_fetches([('url', 'EQB_CHART_CD_20241005.pdf')], 'CHART')
+        self.assertEqual(FetchQueueItems.objects.get().status, fetch_queue.FETCH_FAILED)
+        self.assertEqual(fetch_queue.retry_failed_fetches(['CHART']), 1)
+        self.assertEqual(FetchQueueItems.objects.get().attempts, 0)
+
+    def test_fetch_queued_files(self):
+        self.available = {'EQB_ENTRIES_CD_20241005.html'}
+        fetch_queue.enqueue_fetches([('url', 'EQB_ENTRIES_CD_20241005.html')], 'ENTRIES')
+        fetch_queue.enqueue_fetches([('url', 'EQB_CHART_CD_20241005.pdf')], 'CHART')
+
+        file_paths = list(fetch_queue.fetch_queued_files(['ENTRIES'], worker='a'))
+        self.assertEqual([file_path.name for file_path in file_paths], ['EQB_ENTRIES_CD_20241005.html'])
+        self.assertEqual(
+            FetchQueueItems.objects.get(kind='ENTRIES').status, fetch_queue.FETCH_DONE
+        )
+        self.assertEqual(FetchQueueItems.objects.get(kind='CHART').status, fetch_queue.FETCH_QUEUED)
+
+    def test_fetch_queued_files_by_filename(self):
+        self.available = {'EQB_CHART_CD_20241005.pdf', 'EQB_CHART_CD_20241006.pdf'}
+        fetch_queue.enqueue_fetches([('url', 'EQB_CHART_CD_20241005.pdf')], 'CHART')
+        fetch_queue.enqueue_fetches([('url', 'EQB_CHART_CD_20241006.pdf')], 'CHART')
+
+        # another caller's queued file is left for it or a worker draining the queue
+        file_paths = list(fetch_queue.fetch_queued_files(['CHART'], worker='a', filenames=['EQB_CHART_CD_20241006.pdf']))
+        self.assertEqual([file_path.name for file_path in file_paths], ['EQB_CHART_CD_20241006.pdf'])
+        self.assertEqual(
+            FetchQueueItems.objects.get(filename='EQB_CHART_CD_20241005.pdf').status, fetch_queue.FETCH_QUEUED
+        )
+
+        file_paths = list(fetch_queue.fetch_queued_files(['CHART'], worker='a'))
+        self.assertEqual([file_path.name for file_path in file_paths], ['EQB_CHART_CD_20241005.pdf'])
@@ -0,0 +1,50 @@
+import unittest
+from horsemen.constants import BREED_CHOICES
+from .matching import ChoiceMatcher, get_choice_matcher, get_track_name_matcher, get_track_names_key
+
+class TestChoiceMatcher(unittest.TestCase):
+    def setUp(self):
+        self.choices = [
+            ('ALW', 'Allowance'),
+            ('CLM', 'Claiming'),
+            ('MSW', 'Maiden Special Weight'),
+            ('STK', 'Stakes'),
+            ('MCL', 'Maiden Claiming')
+        ]
+        self.matcher = ChoiceMatcher(self.choices)
+
+    def test_exact_match_ignores_case_and_whitespace(self):
+        self.assertEqual(self.matcher.match(' stakes '), 'STK')
+        self.assertEqual(self.matcher.match('MAIDEN CLAIMING'), 'MCL')
+
+    def test_fuzzy_match(self):
+        self.assertEqual(self.matcher.match('Maiden Spcl Wt'), 'MSW')
+        self.assertEqual(self.matcher.match('Allowance Optional Claiming'), 'ALW')
+
+    def test_empty_string_has_no_match(self):
+        self.assertIsNone(self.matcher.match('   '))
+
+    def test_matches_are_memoized(self):
+        self.matcher.match('Maiden Spcl Wt')
+        self.matcher.match('Maiden Spcl Wt')
+        self.assertEqual(self.matcher.match.cache_info().hits, 1)
+
+    def test_choice_matcher_is_shared_per_choices(self):
+        self.assertIs(get_choice_matcher(BREED_CHOICES), get_choice_matcher(BREED_CHOICES))
+
+    def test_track_name_score_cutoff(self):
+        matcher = get_track_name_matcher(('AQUEDUCT', 'CHURCHILL DOWNS', 'SARATOGA'))
+        self.assertEqual(matcher.match('Churchill Downs Racetrack'), 'CHURCHILL DOWNS')
+        self.assertIsNone(matcher.match('Del Mar'))
+
+    def test_track_names_key_is_stable(self):
+        track_names = get_track_names_key(['SARATOGA', 'AQUEDUCT'])
+        self.assertEqual(track_names, ('AQUEDUCT', 'SARATOGA'))
+        self.assertIs(get_track_names_key(['AQUEDUCT', 'SARATOGA', 'SARATOGA']), track_names)
+        self.assertIs(get_track_name_matcher(track_names), get_track_name_matcher(get_track_names_key(['AQUEDUCT', 'SARATOGA'])))
+
+        # a new track gives a new key
+        self.assertEqual(get_track_names_key(['SARATOGA', 'AQUEDUCT', 'DEL MAR']), ('AQUEDUCT', 'DEL MAR', 'SARATOGA'))
+
+if __name__ == '__main__':
+    unittest.main()
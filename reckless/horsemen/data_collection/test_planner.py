@@ -0,0 +1,52 @@
+from datetime import date
+from django.test import TestCase
+from horsemen.models import Tracks, Races, Horses, Entries
+from horsemen.data_collection.planner import plan_downloads
+
+class TestPlanDownloads(TestCase):
+    def setUp(self):
+        self.track = Tracks.objects.create(code='AQU', name='AQUEDUCT', country='USA')
+        self.race_date = date(2024, 12, 1)
+        self.race = Races.objects.create(track=self.track, race_date=self.race_date, race_number=1, distance=6)
+        self.empty_race = Races.objects.create(track=self.track, race_date=date(2024, 12, 2), race_number=1, distance=6)
+
+        self.known_horse = Horses.objects.create(
+            horse_name='KNOWN', equibase_horse_id=123, equibase_horse_type='TB', equibase_horse_registry='T'
+        )
+        self.unknown_horse = Horses.objects.create(horse_name='UNKNOWN')
+        Entries.objects.create(race=self.race, horse=self.known_horse, program_number='1')
+        Entries.objects.create(race=self.race, horse=self.unknown_horse, program_number='2')
+
+        # two past races of the known horse, only one still needs its chart
+        for day, imported in ((1, False), (2, True)):
+            past_race = Races.objects.create(
+                track=self.track, race_date=date(2024, 11, day), race_number=1, distance=6,
+                equibase_chart_import=imported, cancelled=imported
+            )
+            Entries.objects.create(race=past_race, horse=self.known_horse, program_number='1')
+
+        self.races = Races.objects.filter(race_date__gte=self.race_date)
+
+    def test_plan(self):
+        plan = plan_downloads(self.races, before_date=self.race_date)
+        self.assertEqual({filename for url, filename in plan.entries_cards}, {
+            'EQB_ENTRIES_AQU_20241201.html', 'EQB_ENTRIES_AQU_20241202.html'
+        })
+        self.assertEqual({filename for url, filename in plan.horse_results}, {'EQB_HORSERESULTS_123_20241201.html'})
+        self.assertEqual({filename for url, filename in plan.charts}, {'EQB_CHART_AQU_20241101.pdf'})
+
+        summary = plan.race_days[0]
+        self.assertEqual(summary.race_date, self.race_date)
+        self.assertEqual(
+            (summary.total_entries, summary.null_id_entries, summary.results_needed, summary.charts_needed),
+            (2, 1, 1, 1)
+        )
+        self.assertEqual(plan.race_days[1].total_entries, 0)
+
+    def test_plan_without_empty_cards(self):
+        plan = plan_downloads(self.races, before_date=self.race_date, include_empty_cards=False)
+        self.assertEqual({filename for url, filename in plan.entries_cards}, {'EQB_ENTRIES_AQU_20241201.html'})
+
+    def test_plan_is_a_few_queries(self):
+        with self.assertNumQueries(9):
+            plan_downloads(self.races, before_date=self.race_date)
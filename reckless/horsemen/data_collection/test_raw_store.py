@@ -0,0 +1,96 @@
+import gzip
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from pathlib import Path
+from django.test import TestCase
+from horsemen.models import RawFiles
+from horsemen.data_collection import raw_store
+
+class TestRawStore(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.scraping_folder = Path(self.temp_dir.name) / 'files_to_scrape'
+        self.scraping_folder.mkdir()
+        self.original_folder = raw_store.RAW_STORE_FOLDER
+        raw_store.RAW_STORE_FOLDER = Path(self.temp_dir.name) / 'raw_store'
+        self.addCleanup(setattr, raw_store, 'RAW_STORE_FOLDER', self.original_folder)
+
+    def write_file(self, filename, content):
+        file_path = self.scraping_folder / filename
+        file_path.write_bytes(content)
+        return file_path
+
+    def test_source_and_date_from_filename(self):
+        self.assertEqual(
+            raw_store.get_source_and_date_from_filename('EQB_CHART_CD_20241005.pdf'),
+            ('EQB_CHART', date(2024, 10, 5))
+        )
+        self.assertEqual(
+            raw_store.get_source_and_date_from_filename('EQB_HORSERESULTS_123456_20241005.html'),
+            ('EQB_HORSERESULTS', date(2024, 10, 5))
+        )
+
+    def test_archive_then_skip_identical_content(self):
+        file_path = self.write_file('EQB_CHART_CD_20241005.pdf', b'chart')
+        raw_file = raw_store.store_unparsed_raw_file(file_path)
+        self.assertEqual(raw_file.status, raw_store.RAW_FILE_FETCHED)
+
+        # archiving with the stored entry doesnt hash the file again
+        original_hash = raw_store.get_content_hash
+        self.addCleanup(setattr, raw_store, 'get_content_hash', original_hash)
+        raw_store.get_content_hash = None
+        with self.assertNumQueries(1):
+            raw_store.archive_raw_file(file_path, raw_file=raw_file)
+        raw_store.get_content_hash = original_hash
+        self.assertFalse(file_path.exists())
+        self.assertEqual(RawFiles.objects.get().status, raw_store.RAW_FILE_PARSED)
+
+        # same bytes under the same or a different name dont need parsing again
+        file_path = self.write_file('EQB_CHART_CD_20241005.pdf', b'chart')
+        self.assertIsNone(raw_store.store_unparsed_raw_file(file_path))
+        self.assertFalse(file_path.exists())
+        file_path = self.write_file('EQB_CHART_KEE_20241005.pdf', b'chart')
+        self.assertIsNone(raw_store.store_unparsed_raw_file(file_path))
+        self.assertEqual(RawFiles.objects.filter(status=raw_store.RAW_FILE_PARSED).count(), 2)
+
+    def test_changed_content_is_fetched_again(self):
+        file_path = self.write_file('EQB_CHART_CD_20241005.pdf', b'chart')
+        raw_store.archive_raw_file(file_path)
+        file_path = self.write_file('EQB_CHART_CD_20241005.pdf', b'corrected chart')
+        self.assertIsNotNone(raw_store.store_unparsed_raw_file(file_path))
+        raw_file = RawFiles.objects.get(key='EQB_CHART_CD_20241005.pdf')
+        self.assertEqual(raw_file.status, raw_store.RAW_FILE_FETCHED)
+        self.assertEqual(raw_file.content_hash, raw_store.get_content_hash(file_path))
+
+    def test_restore_unparsed_file(self):
+        file_path = self.write_file('EQB_ENTRIES_CD_20241005.html', b'entries')
+        raw_store.archive_raw_file(file_path, raw_store.RAW_FILE_FAILED)
+        self.assertTrue(raw_store.restore_raw_file(file_path.name, file_path))
+        self.assertEqual(file_path.read_bytes(), b'entries')
+        self.assertFalse(raw_store.restore_raw_file('EQB_ENTRIES_KEE_20241005.html', self.scraping_folder / 'missing'))
+
+    def test_compressed_blob(self):
+        file_path = self.write_file('EQB_CHART_CD_20241005.pdf', b'chart' * 100)
+        raw_file = raw_store.store_raw_file(file_path, compress=True)
+        self.assertTrue(raw_file.compressed)
+        self.assertTrue(raw_store.get_blob_path(raw_file.content_hash, True).exists())
+        self.assertEqual(raw_store.read_raw_file(raw_file), b'chart' * 100)
+
+    def test_concurrent_writes_of_the_same_blob(self):
+        file_path = self.write_file('EQB_CHART_CD_20241005.pdf', b'chart' * 100000)
+        content_hash = raw_store.get_content_hash(file_path)
+
+        # every writer gets its own temp file, the last rename wins with identical bytes
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(lambda compress: raw_store.write_blob(file_path, content_hash, compress), [True] * 8))
+        blob_path = raw_store.get_blob_path(content_hash, True)
+        self.assertEqual(gzip.decompress(blob_path.read_bytes()), b'chart' * 100000)
+        self.assertEqual(list(blob_path.parent.glob('*.tmp')), [])
+
+    def test_failed_write_leaves_no_temp_file(self):
+        content_hash = raw_store.get_content_hash(self.write_file('EQB_CHART_CD_20241005.pdf', b'chart'))
+        with self.assertRaises(FileNotFoundError):
+            raw_store.write_blob(self.scraping_folder / 'missing.pdf', content_hash)
+        self.assertEqual(list(raw_store.get_blob_path(content_hash).parent.glob('*')), [])
@@ -0,0 +1,93 @@
+import unittest
+from types import SimpleNamespace
+from horsemen.data_collection import scraping
+
+class TestRateLimiting(unittest.TestCase):
+    def setUp(self):
+        # run the limiters on a fake clock that sleeping moves forward
+        self.now = 100.0
+        self.sleeps = []
+        original_time = scraping.time
+        scraping.time = SimpleNamespace(monotonic=lambda: self.now, sleep=self.sleep)
+        self.addCleanup(setattr, scraping, 'time', original_time)
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def test_token_bucket_allows_burst_then_spaces_requests(self):
+        limiter = scraping.RateLimiter(2.0, burst=3)
+        for _ in range(5):
+            limiter.wait()
+        self.assertEqual(self.sleeps, [0.5, 0.5])
+
+        # a quiet spell refills the bucket up to the burst
+        self.now += 10
+        self.sleeps.clear()
+        for _ in range(3):
+            limiter.wait()
+        self.assertEqual(self.sleeps, [])
+
+    def test_rate_adapts_between_floor_and_configured_rate(self):
+        limiter = scraping.RateLimiter(2.0)
+        for _ in range(10):
+            limiter.slow_down()
+        self.assertAlmostEqual(limiter.rate, 2.0 * scraping.MIN_RATE_FRACTION)
+        for _ in range(20):
+            limiter.speed_up()
+        self.assertEqual(limiter.rate, 2.0)
+
+    def test_circuit_breaker_pauses_after_repeated_blocks(self):
+        breaker = scraping.CircuitBreaker('zenrows', block_limit=3, cooldown=60)
+        for _ in range(2):
+            breaker.record_block()
+        breaker.wait()
+        self.assertEqual(self.sleeps, [])
+
+        breaker.record_block()
+        breaker.wait()
+        self.assertEqual(self.sleeps, [60])
+
+        # one more block once the pause is over pauses again, a success resets it
+        breaker.record_block()
+        breaker.wait()
+        self.assertEqual(self.sleeps, [60, 60])
+        breaker.record_success()
+        breaker.record_block()
+        breaker.wait()
+        self.assertEqual(self.sleeps, [60, 60])
+
+    def test_backoff_delay_is_capped_with_jitter(self):
+        for attempt in range(1, 10):
+            delay = scraping.get_backoff_delay(attempt)
+            self.assertGreaterEqual(delay, 0)
+            self.assertLessEqual(delay, min(scraping.BACKOFF_CAP, scraping.BACKOFF_BASE * 2 ** (attempt - 1)))
+
+    def test_domain_from_url(self):
+        self.assertEqual(scraping.get_domain('https://www.equibase.com/static/chart/pdf/CD100524USA.pdf'), 'equibase.com')
+        self.assertEqual(scraping.get_domain('https://www.drf.com/results'), 'drf.com')
+        self.assertIsNone(scraping.get_domain('https://notequibase.com/'))
+
+class TestScrapeWorkers(unittest.TestCase):
+    def setUp(self):
+        self.closed = 0
+        original_connection = scraping.connection
+        scraping.connection = SimpleNamespace(close=self.close)
+        self.addCleanup(setattr, scraping, 'connection', original_connection)
+
+    def close(self):
+        self.closed += 1
+
+    def test_worker_closes_connection(self):
+        self.assertEqual(scraping.scrape_url_in_worker(lambda url, filename: filename, 'url', 'file'), 'file')
+        self.assertEqual(self.closed, 1)
+
+    def test_worker_closes_connection_when_scraper_fails(self):
+        def scrape_url(url, filename):
+            raise ValueError('blocked')
+        with self.assertRaises(ValueError):
+            scraping.scrape_url_in_worker(scrape_url, 'url', 'file')
+        self.assertEqual(self.closed, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+import unittest
+import numpy as np
+from horsemen.constants import FRACTIONALS, POINTS_OF_CALL, POINTS_OF_CALL_QH
+from .utils import (
+    KNOWN_DISTANCES,
+    parse_distance_string,
+    convert_string_to_furlongs,
+    convert_string_to_seconds,
+    convert_lengths_back_string,
+    get_fractional_time_object_from_furlongs,
+    get_fractional_time_objects_from_furlongs,
+    get_point_of_call_object_from_furlongs,
+    get_point_of_call_objects_from_furlongs
+)
+
+# distinct strings from the charts, results and drf feeds with the values they parsed to
+DISTANCE_CORPUS = [
+    ('Four Furlongs', 4),
+    ('Four And One Half Furlongs', 4.5),
+    ('Five Furlongs', 5),
+    ('Five And One Half Furlongs', 5.5),
+    ('Six Furlongs', 6),
+    ('Six And One Half Furlongs', 6.5),
+    ('Seven Furlongs', 7),
+    ('Seven And One Half Furlongs', 7.5),
+    ('Eight Furlongs', 8),
+    ('Nine Furlongs', 9),
+    ('About Five Furlongs', 5),
+    ('One Mile', 8),
+    ('One Mile And One Sixteenth', 8.5),
+    ('One And One Sixteenth Miles', 8.5),
+    ('One And One Eighth Miles', 9.0),
+    ('One And Three Sixteenths Miles', 9.5),
+    ('One And One Fourth Miles', 10.0),
+    ('One And Three Eighths Miles', 11.0),
+    ('One And One Half Miles', 12.0),
+    ('Two Miles', 16),
+    ('One Mile And Seventy Yards', 8.318181818181818),
+    ('One Mile Seventy Yards', 8.318181818181818),
+    ('1 Mile 70 Yards', 8.318181818181818),
+    ('1 1/16 Miles', 8.5),
+    ('1 1/8 Miles', 9.0),
+    ('1 3/4 Miles', 14.0),
+    ('6 1/2 Furlongs', 6.5),
+    ('6F', 6.0),
+    ('5 1/2F', 5.5),
+    ('1M', 8.0),
+    ('1 1/16M', 8.5),
+    ('6', 6.0),
+    ('1', 8.0),
+    ('870', 3.9545415000000004),
+    ('350 Yards', 1.5909075000000001),
+    ('Two Hundred Fifty Yards', 1.1363625000000002),
+    ('Three Hundred Yards', 1.3636350000000002),
+    ('Three Hundred Thirty Yards', 1.4999985),
+    ('Three Hundred Fifty Yards', 1.5909075000000001),
+    ('Three Hundred And Fifty Yards', 1.5909075000000001),
+    ('Four Hundred Forty Yards', 1.9999980000000002)
+]
+
+TIME_CORPUS = [
+    ('22.45', 22.45),
+    ('58.12', 58.12),
+    ('1:09.8', 69.8),
+    ('1:11.44', 71.44),
+    ('2:01.04', 121.04)
+]
+
+LENGTHS_BACK_CORPUS = [
+    ('Nose', 0.05),
+    ('Head', 0.2),
+    ('Neck', 0.3),
+    (' neck ', 0.3),
+    ('1/2', 0.5),
+    ('3/4', 0.75),
+    ('1 1/4', 1.25),
+    ('2 3/4', 2.75),
+    ('12', 12.0)
+]
+
+class TestStringParsers(unittest.TestCase):
+    def assertIdentical(self, value, expected):
+        self.assertEqual(value, expected)
+        self.assertIs(type(value), type(expected))
+
+    def test_distance_corpus(self):
+        for distance_string, furlongs in DISTANCE_CORPUS:
+            self.assertIdentical(convert_string_to_furlongs(distance_string), furlongs)
+            self.assertIdentical(parse_distance_string(distance_string), furlongs)
+
+    def test_known_distances_match_parser(self):
+        for distance_string, furlongs in KNOWN_DISTANCES.items():
+            self.assertIdentical(parse_distance_string(distance_string), furlongs)
+
+    def test_time_corpus(self):
+        for time_string, seconds in TIME_CORPUS:
+            self.assertIdentical(convert_string_to_seconds(time_string), seconds)
+        with self.assertRaises(ValueError):
+            convert_string_to_seconds('DNF')
+
+    def test_lengths_back_corpus(self):
+        for lengths_back_string, lengths_back in LENGTHS_BACK_CORPUS:
+            self.assertIdentical(convert_lengths_back_string(lengths_back_string), lengths_back)
+
+    def test_parsers_are_memoized(self):
+        convert_string_to_furlongs('Six Furlongs')
+        hits = convert_string_to_furlongs.cache_info().hits
+        convert_string_to_furlongs('Six Furlongs')
+        self.assertEqual(convert_string_to_furlongs.cache_info().hits, hits + 1)
+
+def find_layout(layouts, distance_feet, past_last_flag):
+    # linear scan the index replaces
+    last_layout = None
+    for layout in layouts:
+        if distance_feet < layout['floor'] - 10:
+            return last_layout
+        last_layout = layout
+    return last_layout if past_last_flag else None
+
+class TestFloorIndex(unittest.TestCase):
+    def setUp(self):
+        self.distances = [0, 0.5, 2, 4.5, 5.5, 6, 6.5, 1 + 1/16, 8.5, 10, 12, 14, 18, 40]
+
+    def test_point_of_call_matches_linear_scan(self):
+        for distance in self.distances:
+            self.assertIs(
+                get_point_of_call_object_from_furlongs(distance),
+                find_layout(POINTS_OF_CALL, distance * 660, True)
+            )
+            self.assertIs(
+                get_point_of_call_object_from_furlongs(distance, quarter_horse_flag=True),
+                find_layout(POINTS_OF_CALL_QH, distance * 660, True)
+            )
+
+    def test_fractional_matches_linear_scan(self):
+        for distance in self.distances:
+            self.assertIs(
+                get_fractional_time_object_from_furlongs(distance),
+                find_layout(FRACTIONALS, distance * 660, False)
+            )
+
+    def test_floor_is_inclusive_within_ten_feet(self):
+        floor = POINTS_OF_CALL[3]['floor']
+        self.assertIs(get_point_of_call_object_from_furlongs((floor - 10) / 660), POINTS_OF_CALL[3])
+        self.assertIs(get_point_of_call_object_from_furlongs((floor - 11) / 660), POINTS_OF_CALL[2])
+
+    def test_array_variant_matches_scalar(self):
+        distances = np.array(self.distances)
+        for layout, distance in zip(get_point_of_call_objects_from_furlongs(distances), distances):
+            self.assertIs(layout, get_point_of_call_object_from_furlongs(distance))
+        for layout, distance in zip(get_fractional_time_objects_from_furlongs(self.distances), distances):
+            self.assertIs(layout, get_fractional_time_object_from_furlongs(distance))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,9 +4,13 @@ import fractions
 from word2number import w2n
 import pytz
 from datetime import datetime
-from fuzzywuzzy import process
 import logging
+from bisect import bisect_right
+from functools import lru_cache
+from itertools import accumulate
+import numpy as np
 from horsemen.constants import FRACTIONALS, POINTS_OF_CALL, POINTS_OF_CALL_QH
+from horsemen.data_collection.matching import get_choice_matcher
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -16,10 +20,13 @@ BASE_FOLDER = Path.cwd()
 if BASE_FOLDER.name == 'reckless_web':
     HISTORY_FOLDER = BASE_FOLDER / 'scraping_history'
     SCRAPING_FOLDER = BASE_FOLDER / 'files_to_scrape'
+    RAW_STORE_FOLDER = BASE_FOLDER / 'raw_store'
 else:
     HISTORY_FOLDER = BASE_FOLDER.parent / 'scraping_history'
     SCRAPING_FOLDER = BASE_FOLDER.parent / 'files_to_scrape'
-logger.info("Paths initialized: HISTORY_FOLDER=%s, SCRAPING_FOLDER=%s", HISTORY_FOLDER, SCRAPING_FOLDER)
+    RAW_STORE_FOLDER = BASE_FOLDER.parent / 'raw_store'
+EXTRACTION_CACHE_FOLDER = RAW_STORE_FOLDER / 'extracted'
+logger.info("Paths initialized: HISTORY_FOLDER=%s, SCRAPING_FOLDER=%s, RAW_STORE_FOLDER=%s", HISTORY_FOLDER, SCRAPING_FOLDER, RAW_STORE_FOLDER)
 
 
 def make_safe_filename(filename) -> str:
@@ -37,42 +44,93 @@ def make_safe_filename(filename) -> str:
     return safe_filename[:255]
 
 
+# distinct strings remembered by each string parser
+PARSE_CACHE_SIZE = 4096
+
+# UNITS
+FURLONGS_PER_MILE = 8
+FURLONGS_PER_YARD = 0.00454545
+
+# Fraction dictionary
+DENOMINATOR_DICTIONARY = {
+    'HALF': 2,
+    'THIRD': 3,
+    'FOURTH': 4,
+    'FIFTH': 5,
+    'SIXTH': 6,
+    'SEVENTH': 7,
+    'EIGHTH': 8,
+    'NINTH': 9,
+    'TENTH': 10,
+    'ELEVENTH': 11,
+    'TWELFTH': 12,
+    'THIRTEENTH': 13,
+    'FOURTEENTH': 14,
+    'FIFTEENTH': 15,
+    'SIXTEENTH': 16
+}
+
+# special case X miles X yards
+MILES_YARDS_PATTERN = re.compile(r'(\d+)\s*MILES?\s+(\d+)\s*YARDS?')
+WORD_MILES_YARDS_PATTERN = re.compile(r'(\w+)\s*MILES?\s+(AND\s+)?(\w+)\s*YARDS?')
+
+# Pattern to match both formats (e.g., '1:11.44' or '11.44')
+TIME_PATTERN = re.compile(r'(?:(\d+):)?(\d+\.\d+)')
+
+# common distance descriptions, same values parse_distance_string gives
+KNOWN_DISTANCES = {
+    'FOUR FURLONGS': 4,
+    'FOUR AND ONE HALF FURLONGS': 4.5,
+    'FIVE FURLONGS': 5,
+    'FIVE AND ONE HALF FURLONGS': 5.5,
+    'SIX FURLONGS': 6,
+    'SIX AND ONE HALF FURLONGS': 6.5,
+    'SEVEN FURLONGS': 7,
+    'SEVEN AND ONE HALF FURLONGS': 7.5,
+    'ONE MILE': 8,
+    'ONE MILE AND SEVENTY YARDS': 8 + 70 / 220,
+    'ONE AND ONE SIXTEENTH MILES': 8.5,
+    'ONE AND ONE EIGHTH MILES': 9.0,
+    'ONE AND THREE SIXTEENTHS MILES': 9.5,
+    'ONE AND ONE FOURTH MILES': 10.0,
+    'ONE AND ONE HALF MILES': 12.0
+}
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
 def convert_string_to_furlongs(distance_string):
 
-    # UNITS
-    FURLONGS_PER_MILE = 8
-    FURLONGS_PER_YARD = 0.00454545
-
-    # Fraction dictionary
-    denominator_dictionary = {
-        'HALF': 2,
-        'THIRD': 3,
-        'FOURTH': 4,
-        'FIFTH': 5,
-        'SIXTH': 6,
-        'SEVENTH': 7,
-        'EIGHTH': 8,
-        'NINTH': 9,
-        'TENTH': 10,
-        'ELEVENTH': 11,
-        'TWELFTH': 12,
-        'THIRTEENTH': 13,
-        'FOURTEENTH': 14,
-        'FIFTEENTH': 15,
-        'SIXTEENTH': 16
-    }
+    # massage string
+    distance_string = distance_string.strip().upper()
+
+    # skip parsing common descriptions
+    if distance_string in KNOWN_DISTANCES:
+        return KNOWN_DISTANCES[distance_string]
+    return parse_distance_string(distance_string)
+
+def parse_distance_string(distance_string):
+    """
+    Parse a distance description such as 'SIX FURLONGS' or '1 1/16 MILES' without
+    the known distance table or cache.
+
+    Args:
+        distance_string: Distance description
+
+    Returns:
+        Distance in furlongs or -1 if it could not be parsed
+    """
 
     # massage string
     distance_string = distance_string.strip().upper()
 
     # special case X miles X yards
-    match = re.search(r'(\d+)\s*MILES?\s+(\d+)\s*YARDS?', distance_string)
+    match = MILES_YARDS_PATTERN.search(distance_string)
     if match:
         miles = int(match.group(1))
         yards = int(match.group(2))
         furlongs = (miles * 8) + (yards / 220)
         return furlongs
-    match = re.search(r'(\w+)\s*MILES?\s+(AND\s+)?(\w+)\s*YARDS?', distance_string)
+    match = WORD_MILES_YARDS_PATTERN.search(distance_string)
     if match:
         miles = w2n.word_to_num(match.group(1))
         yards = w2n.word_to_num(match.group(3))
@@ -140,9 +198,9 @@ def convert_string_to_furlongs(distance_string):
             return -1
         fraction_string = split_string[1]
         denominator_value = 0
-        for denominator_word in denominator_dictionary.keys():
+        for denominator_word in DENOMINATOR_DICTIONARY.keys():
             if denominator_word in fraction_string:
-                denominator_value = denominator_dictionary[denominator_word]
+                denominator_value = DENOMINATOR_DICTIONARY[denominator_word]
                 fraction_string = fraction_string.replace(denominator_word,'')
         if denominator_value == 0:
             # this is just a big number e.g. one hundred and twenty yards
@@ -164,12 +222,10 @@ def convert_string_to_furlongs(distance_string):
     # final calcs
     return (return_value + fraction_value) * conversion_factor
 
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
 def convert_string_to_seconds(time_string):
 
-    # Pattern to match both formats (e.g., '1:11.44' or '11.44')
-    pattern = r'(?:(\d+):)?(\d+\.\d+)' 
-    
-    match = re.match(pattern, time_string)
+    match = TIME_PATTERN.match(time_string)
     if not match:
         raise ValueError("Invalid time format")
     
@@ -181,6 +237,7 @@ def convert_string_to_seconds(time_string):
     total_seconds = minutes * 60 + seconds
     return total_seconds
 
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
 def convert_lengths_back_string(lengths_back_string):
 
     # Process
@@ -233,35 +290,17 @@ def get_horsename_and_country_from_drf(horse_name):
     
 
 def get_best_choice_from_description_code(input_string, choices):
-    
-    # process input string
-    input_string = input_string.strip().upper()
-    if input_string != '':
-    
-        # Extract race type descriptions from the choices
-        descriptions = [description.upper() for choice, description in choices]
-
-        # check for exact match first
-        if input_string in descriptions:
-            for choice, description in choices:
-                if description.upper() == input_string:
-                    return choice
-    
-        # Find the best match
-        best_match = process.extractOne(input_string, descriptions)
-    
-        if best_match:
-            # Retrieve the description and match score
-            match_description, match_score = best_match
-            logger.debug(f'in get_best_choice_from_description_code, {match_description} matches {input_string} with a score of {match_score}')
-    
-            # Find the corresponding code
-            for choice, description in choices:
-                if description.upper() == match_description:
-                    return choice
+    """
+    Get the code whose description best matches input_string.
 
-    logger.warning(f'in get_best_choice_from_description_code, {input_string} did not return a match')
-    return None
+    Args:
+        input_string: Description to match
+        choices: (code, description) choices such as BREED_CHOICES
+
+    Returns:
+        The matching code or None
+    """
+    return get_choice_matcher(choices).match(input_string)
 
 def convert_course_code_to_surface(course_code):
     # Define the mapping of course codes to surface codes
@@ -303,41 +342,85 @@ def drf_breed_word_to_code(breed_name):
     # Return the corresponding code or None if not found
     return breed_codes.get(breed_name_lower, None)
 
+class FloorIndex:
+    """
+    Bisect index over the floors of a distance layout list such as POINTS_OF_CALL.
+
+    A distance gets the layout before the first one whose floor is more than 10 feet
+    past it. Distances past every floor get the last layout, or None when
+    past_last_flag is False.
+    """
+
+    def __init__(self, layouts, past_last_flag=True):
+        self.layouts = layouts
+        self.past_last_flag = past_last_flag
+
+        # running max keeps the thresholds sorted even if the floors arent
+        self.thresholds = list(accumulate((layout['floor'] - 10 for layout in layouts), max))
+
+    def get_layout_for_index(self, index):
+        if index == 0:
+            return None
+        if index == len(self.layouts) and not self.past_last_flag:
+            return None
+        return self.layouts[index - 1]
+
+    def get(self, distance_feet):
+        """
+        Args:
+            distance_feet: Distance in feet
+
+        Returns:
+            The layout for the distance or None
+        """
+        return self.get_layout_for_index(bisect_right(self.thresholds, distance_feet))
+
+    def get_many(self, distances_feet):
+        """
+        Args:
+            distances_feet: Sequence or array of distances in feet
+
+        Returns:
+            List with the layout (or None) for each distance
+        """
+        indexes = np.searchsorted(self.thresholds, np.asarray(distances_feet, dtype=float), side='right')
+        return [self.get_layout_for_index(index) for index in indexes.tolist()]
+
+
+# built once, fractionals stop at the longest layout
+FRACTIONALS_INDEX = FloorIndex(FRACTIONALS, past_last_flag=False)
+POINTS_OF_CALL_INDEX = FloorIndex(POINTS_OF_CALL)
+POINTS_OF_CALL_QH_INDEX = FloorIndex(POINTS_OF_CALL_QH)
+
+
 def get_fractional_time_object_from_furlongs(distance_furlongs):
 
     # convert furlongs to feet
     distance_feet = distance_furlongs * 660
 
     # Figure out which fractional time object we need
-    last_fractional_object = None
-    for fractional_object in FRACTIONALS:
-        if distance_feet<fractional_object['floor']-10:
-            logger.debug(f'for {distance_feet} feet returning point of call for {last_fractional_object['floor']}')
-            return last_fractional_object
-        last_fractional_object = fractional_object
+    return FRACTIONALS_INDEX.get(distance_feet)
+
+def get_fractional_time_objects_from_furlongs(distances_furlongs):
+    """Get the fractional time object for each of many distances in furlongs."""
+    return FRACTIONALS_INDEX.get_many(np.asarray(distances_furlongs, dtype=float) * 660)
 
 def get_point_of_call_object_from_furlongs(distance_furlongs, quarter_horse_flag=False):
 
     # convert furlongs to feet
     distance_feet = distance_furlongs * 660
-    logger.debug(f' in get_point_of_call_object_from_furlongs, looking for {distance_feet} feet qh:{quarter_horse_flag}')
 
     #  quarterhorse
     if quarter_horse_flag:
-        points_of_call_to_use = POINTS_OF_CALL_QH
-    else:
-        points_of_call_to_use = POINTS_OF_CALL
-    
-    # Figure out which fractional time object we need
-    last_point_of_call_object = None
-    for point_of_call_object in points_of_call_to_use:
-        if distance_feet<point_of_call_object['floor']-10:
-            logger.debug(f'for {distance_feet} feet returning point of call for {last_point_of_call_object['floor']}')
-            return last_point_of_call_object
-        last_point_of_call_object = point_of_call_object
-    # were as long as we can get
-    logger.debug(f'for {distance_feet} feet returning point of call for {last_point_of_call_object['floor']}')
-    return last_point_of_call_object
+        return POINTS_OF_CALL_QH_INDEX.get(distance_feet)
+    return POINTS_OF_CALL_INDEX.get(distance_feet)
+
+def get_point_of_call_objects_from_furlongs(distances_furlongs, quarter_horse_flag=False):
+    """Get the point of call object for each of many distances in furlongs."""
+    distances_feet = np.asarray(distances_furlongs, dtype=float) * 660
+    if quarter_horse_flag:
+        return POINTS_OF_CALL_QH_INDEX.get_many(distances_feet)
+    return POINTS_OF_CALL_INDEX.get_many(distances_feet)
         
 def create_fractional_data_from_array_and_object(fractional_times, race_distance):
 
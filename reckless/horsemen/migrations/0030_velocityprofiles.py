@@ -0,0 +1,27 @@
+# Generated by Django 5.1.2 on 2026-10-18 00:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('horsemen', '0029_races_hurdles'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VelocityProfiles',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('distance', models.FloatField()),
+                ('last_split_call_velocity_id', models.BigIntegerField()),
+                ('split_call_velocity_count', models.IntegerField()),
+                ('velocities', models.JSONField()),
+                ('same_distance_velocities', models.JSONField()),
+                ('bandwidths', models.JSONField()),
+                ('horse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='horsemen.horses')),
+            ],
+        ),
+    ]
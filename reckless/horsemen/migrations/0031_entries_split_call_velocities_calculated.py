@@ -0,0 +1,28 @@
+# Generated by Django 5.1.2 on 2026-10-18 00:56
+
+from django.db import migrations, models
+
+
+def mark_calculated_entries(apps, schema_editor):
+    # entries that already have velocities dont need to be calculated again
+    Entries = apps.get_model('horsemen', 'Entries')
+    SplitCallVelocities = apps.get_model('horsemen', 'SplitCallVelocities')
+    Entries.objects.filter(
+        id__in=SplitCallVelocities.objects.values('entry_id')
+    ).update(split_call_velocities_calculated=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('horsemen', '0030_velocityprofiles'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='entries',
+            name='split_call_velocities_calculated',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_calculated_entries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 5.1.2 on 2026-10-18 01:06
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicates(apps, model_name, fields, child_models=()):
+    """Keep the first row of each duplicate group, moving the children of the others onto it, returning the kept ids."""
+    model = apps.get_model('horsemen', model_name)
+    duplicate_groups = model.objects.values(*fields).annotate(
+        first_id=Min('id'), row_count=Count('id')
+    ).filter(row_count__gt=1)
+    kept_ids = []
+    for group in duplicate_groups:
+        duplicate_ids = list(model.objects.filter(
+            **{field: group[field] for field in fields}
+        ).exclude(id=group['first_id']).values_list('id', flat=True))
+        for child_model_name, field in child_models:
+            apps.get_model('horsemen', child_model_name).objects.filter(
+                **{f'{field}__in': duplicate_ids}
+            ).update(**{field: group['first_id']})
+        model.objects.filter(id__in=duplicate_ids).delete()
+        kept_ids.append(group['first_id'])
+    return kept_ids
+
+
+def merge_duplicate_rows(apps, schema_editor):
+    Entries = apps.get_model('horsemen', 'Entries')
+    SplitCallVelocities = apps.get_model('horsemen', 'SplitCallVelocities')
+
+    # races first, merging them can make their entries, fractions and payoffs duplicates
+    merged_race_ids = merge_duplicates(apps, 'Races', ['track', 'race_date', 'race_number'], [
+        ('Entries', 'race'), ('FractionalTimes', 'race'), ('Payoffs', 'race')
+    ])
+    merged_entry_ids = merge_duplicates(apps, 'Entries', ['race', 'horse'], [('PointsOfCall', 'entry')])
+
+    # velocities of merged rows are calculated again from the merged calls and fractions
+    merged_entries = Entries.objects.filter(id__in=merged_entry_ids) | Entries.objects.filter(race_id__in=merged_race_ids)
+    SplitCallVelocities.objects.filter(entry__in=merged_entries).delete()
+    merged_entries.update(split_call_velocities_calculated=False)
+
+    # then keep the first row of anything else loaded twice
+    merge_duplicates(apps, 'PointsOfCall', ['entry', 'point'])
+    merge_duplicates(apps, 'FractionalTimes', ['race', 'point'])
+    merge_duplicates(apps, 'Payoffs', ['race', 'wager_type', 'winning_numbers'])
+    merge_duplicates(apps, 'Workouts', ['track', 'workout_date', 'horse'])
+
+
+class Migration(migrations.Migration):
+
+    # the merge updates foreign keys, postgres wont alter a table with their
+    # deferred checks still pending so the constraints are added after it commits
+    atomic = False
+
+    dependencies = [
+        ('horsemen', '0031_entries_split_call_velocities_calculated'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_rows, migrations.RunPython.noop, atomic=True),
+        migrations.AddConstraint(
+            model_name='entries',
+            constraint=models.UniqueConstraint(fields=('race', 'horse'), name='unique_entry_race_horse'),
+        ),
+        migrations.AddConstraint(
+            model_name='fractionaltimes',
+            constraint=models.UniqueConstraint(fields=('race', 'point'), name='unique_fractional_time_race_point'),
+        ),
+        migrations.AddConstraint(
+            model_name='payoffs',
+            constraint=models.UniqueConstraint(fields=('race', 'wager_type', 'winning_numbers'), name='unique_payoff_race_wager_numbers'),
+        ),
+        migrations.AddConstraint(
+            model_name='pointsofcall',
+            constraint=models.UniqueConstraint(fields=('entry', 'point'), name='unique_point_of_call_entry_point'),
+        ),
+        migrations.AddConstraint(
+            model_name='races',
+            constraint=models.UniqueConstraint(fields=('track', 'race_date', 'race_number'), name='unique_race_track_date_number'),
+        ),
+        migrations.AddConstraint(
+            model_name='workouts',
+            constraint=models.UniqueConstraint(fields=('track', 'workout_date', 'horse'), name='unique_workout_track_date_horse'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.2 on 2026-10-18 01:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('horsemen', '0032_natural_key_constraints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RawFiles',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=32)),
+                ('key', models.CharField(max_length=255)),
+                ('file_date', models.DateField(null=True)),
+                ('content_hash', models.CharField(db_index=True, max_length=64)),
+                ('compressed', models.BooleanField(default=False)),
+                ('size', models.BigIntegerField(default=0)),
+                ('status', models.CharField(choices=[('F', 'Fetched'), ('P', 'Parsed'), ('X', 'Failed')], default='F', max_length=1)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('source', 'key'), name='unique_raw_file_source_key')],
+            },
+        ),
+    ]
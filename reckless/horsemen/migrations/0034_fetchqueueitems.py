@@ -0,0 +1,35 @@
+# Generated by Django 5.1.2 on 2026-10-18 01:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('horsemen', '0033_rawfiles'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FetchQueueItems',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.TextField()),
+                ('filename', models.CharField(max_length=255)),
+                ('kind', models.CharField(choices=[('ENTRIES', 'Equibase Entries'), ('HORSERESULTS', 'Equibase Horse Results'), ('CHART', 'Equibase Chart')], max_length=16)),
+                ('priority', models.IntegerField(default=0)),
+                ('attempts', models.IntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField()),
+                ('status', models.CharField(choices=[('Q', 'Queued'), ('C', 'Claimed'), ('D', 'Done'), ('X', 'Failed')], default='Q', max_length=1)),
+                ('claimed_by', models.CharField(max_length=255, null=True)),
+                ('claimed_at', models.DateTimeField(null=True)),
+                ('last_error', models.TextField(null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', '-priority', 'next_attempt_at'], name='fetch_queue_claim_idx')],
+                'constraints': [models.UniqueConstraint(fields=('kind', 'filename'), name='unique_fetch_queue_kind_filename')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.2 on 2026-10-18 01:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('horsemen', '0034_fetchqueueitems'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CachedResponses',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.CharField(max_length=1024, unique=True)),
+                ('etag', models.CharField(max_length=255, null=True)),
+                ('last_modified', models.CharField(max_length=64, null=True)),
+                ('content_hash', models.CharField(max_length=64)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.2 on 2026-10-18 01:37
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def remove_duplicate_velocity_profiles(apps, schema_editor):
+    # profiles are a cache, keep the newest row for each horse and distance
+    VelocityProfiles = apps.get_model('horsemen', 'VelocityProfiles')
+    last_ids = VelocityProfiles.objects.values('horse', 'distance').annotate(last_id=Max('id')).values('last_id')
+    VelocityProfiles.objects.exclude(id__in=last_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('horsemen', '0035_cachedresponses'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_velocity_profiles, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='velocityprofiles',
+            constraint=models.UniqueConstraint(fields=('horse', 'distance'), name='unique_velocity_profile_horse_distance'),
+        ),
+    ]
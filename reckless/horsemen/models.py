@@ -5,7 +5,8 @@ from django.utils.translation import gettext as _
 from horsemen.constants import BREED_CHOICES, DAY_EVENING_CHOICES, \
     EQUIBASE_RACE_TYPE_CHOICES, DRF_AGE_RESTRICTION_CHOICES, \
         DRF_SEX_RESTRICTION_CHOICES, RACE_SURFACE, SCRATCH_REASON_CHOICES, \
-        BET_CHOICES
+        BET_CHOICES, RAW_FILE_STATUS_CHOICES, FETCH_KIND_CHOICES, \
+        FETCH_STATUS_CHOICES
 
 class Tracks(models.Model):
     TIMEZONES = tuple(zip(pytz.all_timezones, pytz.all_timezones))
@@ -85,6 +86,11 @@ class Races(models.Model):
     record_date = models.DateField(null=True)
     hurdles = models.BooleanField(default=False)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['track', 'race_date', 'race_number'], name='unique_race_track_date_number')
+        ]
+
     def clean(self):
         # Choice Field Validation
         if self.day_evening and self.day_evening not in dict(DAY_EVENING_CHOICES):
@@ -368,7 +374,15 @@ class Entries(models.Model):
 
     # equibase charts
     comment = models.CharField(max_length=255, null=True)
-    
+
+    # split call velocities are up to date with the points of call and fractional times
+    split_call_velocities_calculated = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['race', 'horse'], name='unique_entry_race_horse')
+        ]
+
     def clean(self):
         # Choice Field Validation
         if self.scratch_indicator is not None and self.scratch_indicator not in dict(SCRATCH_REASON_CHOICES):
@@ -418,7 +432,12 @@ class Workouts(models.Model):
     note = models.CharField(max_length=255)
     workout_rank = models.IntegerField()
     workout_total = models.IntegerField()
-    
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['track', 'workout_date', 'horse'], name='unique_workout_track_date_horse')
+        ]
+
     def clean(self):
         # Choice Field Validation
         if self.surface and self.surface not in dict(RACE_SURFACE):
@@ -469,6 +488,11 @@ class Payoffs(models.Model):
     payoff_amount = models.FloatField(default=0)
     base_amount = models.FloatField(default=0)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['race', 'wager_type', 'winning_numbers'], name='unique_payoff_race_wager_numbers')
+        ]
+
     def clean(self):
         # Choice Field Validation
         if self.wager_type and self.wager_type not in dict(BET_CHOICES):
@@ -490,6 +514,11 @@ class PointsOfCall(models.Model):
     position = models.IntegerField()
     lengths_back = models.FloatField()
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['entry', 'point'], name='unique_point_of_call_entry_point')
+        ]
+
 class FractionalTimes(models.Model):
     race = models.ForeignKey(Races, on_delete=models.CASCADE)
     point = models.IntegerField()
@@ -497,6 +526,91 @@ class FractionalTimes(models.Model):
     distance = models.FloatField()
     time = models.FloatField()
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['race', 'point'], name='unique_fractional_time_race_point')
+        ]
+
+class RawFiles(models.Model):
+    # manifest of downloaded files, the content lives in the raw store under its hash
+    source = models.CharField(max_length=32)
+    key = models.CharField(max_length=255)
+    file_date = models.DateField(null=True)
+    content_hash = models.CharField(max_length=64, db_index=True)
+    compressed = models.BooleanField(default=False)
+    size = models.BigIntegerField(default=0)
+    status = models.CharField(max_length=1, choices=RAW_FILE_STATUS_CHOICES, default='F')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'key'], name='unique_raw_file_source_key')
+        ]
+
+    def clean(self):
+        # Choice Field Validation
+        if self.status and self.status not in dict(RAW_FILE_STATUS_CHOICES):
+            raise ValidationError(
+                _("Invalid status: %(value)s"),
+                params={'value': self.status},
+                code='invalid_choice'
+            )
+
+    def save(self, *args, **kwargs):
+        self.clean()
+        super().save(*args, **kwargs)
+
+class FetchQueueItems(models.Model):
+    # files waiting to be downloaded, claimed by collector workers with skip locked
+    url = models.TextField()
+    filename = models.CharField(max_length=255)
+    kind = models.CharField(max_length=16, choices=FETCH_KIND_CHOICES)
+    priority = models.IntegerField(default=0)
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField()
+    status = models.CharField(max_length=1, choices=FETCH_STATUS_CHOICES, default='Q')
+    claimed_by = models.CharField(max_length=255, null=True)
+    claimed_at = models.DateTimeField(null=True)
+    last_error = models.TextField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'filename'], name='unique_fetch_queue_kind_filename')
+        ]
+        indexes = [
+            models.Index(fields=['status', '-priority', 'next_attempt_at'], name='fetch_queue_claim_idx')
+        ]
+
+    def clean(self):
+        # Choice Field Validation
+        if self.kind and self.kind not in dict(FETCH_KIND_CHOICES):
+            raise ValidationError(
+                _("Invalid kind: %(value)s"),
+                params={'value': self.kind},
+                code='invalid_choice'
+            )
+
+        if self.status and self.status not in dict(FETCH_STATUS_CHOICES):
+            raise ValidationError(
+                _("Invalid status: %(value)s"),
+                params={'value': self.status},
+                code='invalid_choice'
+            )
+
+    def save(self, *args, **kwargs):
+        self.clean()
+        super().save(*args, **kwargs)
+
+class CachedResponses(models.Model):
+    # validators and body hash of the last loaded response for each DRF url
+    url = models.CharField(max_length=1024, unique=True)
+    etag = models.CharField(max_length=255, null=True)
+    last_modified = models.CharField(max_length=64, null=True)
+    content_hash = models.CharField(max_length=64)
+    updated_at = models.DateTimeField(auto_now=True)
+
 class SplitCallVelocities(models.Model):
     entry = models.ForeignKey(Entries, on_delete=models.CASCADE)
     point = models.IntegerField()
@@ -506,3 +620,22 @@ class SplitCallVelocities(models.Model):
     total_time = models.FloatField()
     velocity = models.FloatField()
     lengths_back = models.FloatField()
+
+class VelocityProfiles(models.Model):
+    # cached split call velocities for a horse, grouped by point, for simulating a race at distance
+    horse = models.ForeignKey(Horses, on_delete=models.CASCADE)
+    distance = models.FloatField()
+
+    # the split call velocities the profile was built from
+    last_split_call_velocity_id = models.BigIntegerField()
+    split_call_velocity_count = models.IntegerField()
+
+    # lists indexed by point
+    velocities = models.JSONField()
+    same_distance_velocities = models.JSONField()
+    bandwidths = models.JSONField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['horse', 'distance'], name='unique_velocity_profile_horse_distance')
+        ]
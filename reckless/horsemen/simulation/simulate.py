@@ -1,5 +1,7 @@
-from django.db.models import F, FloatField, Avg, Count, StdDev
-from horsemen.models import Entries, SplitCallVelocities, Workouts
+import threading
+from collections import OrderedDict
+from django.db.models import F, FloatField, Avg, Count, Max, StdDev
+from horsemen.models import SplitCallVelocities, VelocityProfiles, Workouts
 from django.db.models.expressions import ExpressionWrapper
 from scipy.stats import gaussian_kde
 import numpy as np
@@ -8,18 +10,33 @@ from horsemen.constants import METERS_PER_FURLONG, METERS_PER_LENGTH
 
 MONTE_CARLO_RACE_COUNT = 1000
 
+# fitted kdes kept in memory for the most recently simulated velocity profiles
+KDE_CACHE_SIZE = 2048
+
 class Simulation:
-    def __init__(self, race, num_points=5):
+    def __init__(self, race, num_points=5, simulation_count=MONTE_CARLO_RACE_COUNT):
         
         # store race
         self.race = race
-        self.simulation_count = MONTE_CARLO_RACE_COUNT
+        self.simulation_count = simulation_count
+
+        # get the entries that will run
+        entries = [
+            entry for entry in race.entries_set.select_related('horse')
+            if not entry.scratch_indicator != 'N' and entry.program_number
+        ]
+
+        # load every horse's history up front
+        history = load_simulation_history(race, [entry.horse for entry in entries])
 
         # create a simulation entry
         self.simulation_entries = {}
-        for entry in race.entries_set.all():
-            if not entry.scratch_indicator != 'N' and entry.program_number:
-                self.simulation_entries[entry.program_number] = SimulationEntry(entry)
+        for entry in entries:
+            self.simulation_entries[entry.program_number] = SimulationEntry(
+                entry,
+                velocity_profile=history[entry.horse_id]['velocity_profile'],
+                workout_stats=history[entry.horse_id]['workout_stats']
+            )
 
         # results entries
         self.results = {
@@ -33,56 +50,266 @@ class Simulation:
         evaluation_distances, simulation_step_distance = np.linspace(0, race_distance, num_points+1, retstep=True)
         evaluation_distances = evaluation_distances[1:]
 
-        # run monte carlo
-        for simulation_number in range(MONTE_CARLO_RACE_COUNT):
+        # horses are indexed by their position in simulation_entries
+        program_numbers = list(self.simulation_entries.keys())
+
+        # draw every velocity up front into a (simulation, horse, point) array,
+        # points without a kde keep the tiny velocity so that horse finishes last
+        random_velocities = np.full(
+            (self.simulation_count, len(program_numbers), len(evaluation_distances)),
+            0.00000001
+        )
+        for horse_index, program_number in enumerate(program_numbers):
+            simulation_entry = self.simulation_entries[program_number]
+            for point in range(len(evaluation_distances)):
+                kde = simulation_entry.kde[point]
+                if kde:
+                    random_velocities[:, horse_index, point] = kde.resample(size=self.simulation_count)[0]
+
+        # calculate time it takes each horse to run the race in each simulation
+        finish_times = (simulation_step_distance / random_velocities).sum(axis=2)
+
+        # rank horses in each simulation (stable so ties keep entry order)
+        finish_order = np.argsort(finish_times, axis=1, kind='stable')
+
+        # count the first four finish places for each horse
+        for finish_index in range(min(4, len(program_numbers))):
+            place_counts = np.bincount(finish_order[:, finish_index], minlength=len(program_numbers))
+            for horse_index, count in enumerate(place_counts):
+                self.simulation_entries[program_numbers[horse_index]].simulation_finishes[finish_index+1] += int(count)
+
+        # exactas, trifectas and superfectas
+        for wager_type, wager_length in [('exactas', 2), ('trifectas', 3), ('superfectas', 4)]:
+            if not program_numbers:
+                continue
+            combinations, counts = np.unique(finish_order[:, :wager_length], axis=0, return_counts=True)
+            for combination, count in zip(combinations, counts):
+                wager_key = '-'.join([program_numbers[horse_index] for horse_index in combination])
+                self.results[wager_type][wager_key] = int(count)
+
+
+def build_velocity_profile(split_call_velocities, race_distance, key=None):
+    """
+    Group split call velocities by point and pick a kde bandwidth for each point.
+
+    Args:
+        split_call_velocities: (point, velocity, race_distance) tuples in race date order
+        race_distance: Distance of the race being simulated in furlongs
+        key: (horse id, distance, last split call velocity id, count) the profile
+            was built from, None for a horse without velocities
+
+    Returns:
+        dict: velocity_by_point, same_distance_velocity_by_point, bandwidth_by_point and key
+    """
+    velocity_by_point = {}
+    same_distance_velocity_by_point = {}
+    bandwidth_by_point = {}
+    for point in range(5):
+        velocity_by_point[point] = []
+        same_distance_velocity_by_point[point] = []
+    for point, velocity, velocity_race_distance in split_call_velocities:
+        velocity_by_point[point].append(velocity)
+        if abs(velocity_race_distance - race_distance)/race_distance < 0.1:
+            same_distance_velocity_by_point[point].append(velocity)
+
+    # bandwidth of the kde for each point, None when there isnt enough data for one
+    for point, velocities in same_distance_velocity_by_point.items():
+        if len(velocities)<2:
+            bandwidth_by_point[point] = None
+        else:
+            bandwidth_by_point[point] = float(gaussian_kde(np.array(velocities)).factor)
+
+    return {
+        'velocity_by_point': velocity_by_point,
+        'same_distance_velocity_by_point': same_distance_velocity_by_point,
+        'bandwidth_by_point': bandwidth_by_point,
+        'key': key
+    }
+
+
+def get_velocity_profiles(race, horses):
+    """
+    Get the velocity profile of each horse for simulating race, using the
+    VelocityProfiles cache when the horse has no new split call velocities.
+
+    Args:
+        race: Race being simulated, only velocities before its race date are used
+        horses: Horses entered in the race
+
+    Returns:
+        dict: horse id -> velocity profile (see build_velocity_profile)
+    """
+    horse_ids = [horse.id for horse in horses]
 
-            # store time it takes to race
-            finish_times = {}
-            for program_number in self.simulation_entries.keys():
-                finish_times[program_number] = 0
+    # key each horse by the split call velocities a profile would be built from
+    velocity_keys = {}
+    for key in SplitCallVelocities.objects.filter(
+        entry__horse_id__in=horse_ids,
+        entry__race__race_date__lt=race.race_date
+    ).values('entry__horse_id').annotate(
+        last_id=Max('id'),
+        count=Count('id')
+    ):
+        velocity_keys[key['entry__horse_id']] = (key['last_id'], key['count'])
 
-            for point, end_distance in enumerate(evaluation_distances):
-                for program_number, simulation_entry in self.simulation_entries.items():
+    # horses without velocities have empty profiles
+    profiles = {}
+    for horse_id in horse_ids:
+        if horse_id not in velocity_keys:
+            profiles[horse_id] = build_velocity_profile([], race.distance)
 
-                    # get a velocity from the de
-                    kde = simulation_entry.kde[point]
-                    if kde:
-                        random_velocity = kde.resample(size=1)[0]
-                    else:
-                        random_velocity = 0.00000001
+    # cached profiles that are still current
+    for velocity_profile in VelocityProfiles.objects.filter(
+        horse_id__in=velocity_keys.keys(),
+        distance=race.distance
+    ):
+        if velocity_keys[velocity_profile.horse_id] == (
+            velocity_profile.last_split_call_velocity_id,
+            velocity_profile.split_call_velocity_count
+        ):
+            profiles[velocity_profile.horse_id] = {
+                'velocity_by_point': dict(enumerate(velocity_profile.velocities)),
+                'same_distance_velocity_by_point': dict(enumerate(velocity_profile.same_distance_velocities)),
+                'bandwidth_by_point': dict(enumerate(velocity_profile.bandwidths)),
+                'key': (velocity_profile.horse_id, race.distance) + velocity_keys[velocity_profile.horse_id]
+            }
+    stale_horse_ids = [horse_id for horse_id in velocity_keys.keys() if horse_id not in profiles]
+    if not stale_horse_ids:
+        return profiles
 
-                    # calculate time
-                    finish_times[program_number] += simulation_step_distance / random_velocity
+    # build the rest from the split call velocities
+    split_call_velocities = {}
+    for horse_id in stale_horse_ids:
+        split_call_velocities[horse_id] = []
+    for horse_id, point, velocity, race_distance in SplitCallVelocities.objects.filter(
+        entry__horse_id__in=stale_horse_ids,
+        entry__race__race_date__lt=race.race_date
+    ).order_by('entry__race__race_date', 'point').values_list(
+        'entry__horse_id', 'point', 'velocity', 'entry__race__distance'
+    ):
+        split_call_velocities[horse_id].append((point, velocity, race_distance))
 
-            # Sort finish_times by value (finish times)
-            sorted_finish_times = sorted(finish_times.items(), key=lambda item: item[1])
+    # replace the stale cache rows, the unique horse and distance keeps concurrent
+    # simulations from storing a profile twice
+    for horse_id in stale_horse_ids:
+        profile = build_velocity_profile(
+            split_call_velocities[horse_id],
+            race.distance,
+            key=(horse_id, race.distance) + velocity_keys[horse_id]
+        )
+        profiles[horse_id] = profile
+        VelocityProfiles.objects.update_or_create(
+            horse_id=horse_id,
+            distance=race.distance,
+            defaults={
+                'last_split_call_velocity_id': velocity_keys[horse_id][0],
+                'split_call_velocity_count': velocity_keys[horse_id][1],
+                'velocities': [profile['velocity_by_point'][point] for point in range(5)],
+                'same_distance_velocities': [profile['same_distance_velocity_by_point'][point] for point in range(5)],
+                'bandwidths': [profile['bandwidth_by_point'][point] for point in range(5)]
+            }
+        )
+
+    return profiles
+
+
+# fitted kdes by velocity profile key, oldest first
+_kde_cache = OrderedDict()
+_kde_cache_lock = threading.Lock()
+
+
+def get_velocity_profile_kdes(velocity_profile):
+    """
+    Get a kde for each point of a velocity profile, fitted with the profile's bandwidth.
+
+    Kdes are kept in memory by the profile's key, so simulating the same horses
+    again, as every view of a card does, doesnt fit them again.
+
+    Args:
+        velocity_profile: Profile from get_velocity_profiles
+
+    Returns:
+        dict: point -> gaussian_kde, None when there isnt enough data for one
+    """
+    key = velocity_profile.get('key')
+    if key is not None:
+        with _kde_cache_lock:
+            if key in _kde_cache:
+                _kde_cache.move_to_end(key)
+                return _kde_cache[key]
 
-            # Iterate through the first four horses and update their finish places
-            for finish_index, (program_number, finish_time) in enumerate(sorted_finish_times[:4], start=0):
-                # Increment the corresponding simulation finish counter
-                self.simulation_entries[program_number].simulation_finishes[finish_index+1] += 1
+    kdes = {}
+    for point, velocities in velocity_profile['same_distance_velocity_by_point'].items():
+        bandwidth = velocity_profile['bandwidth_by_point'][point]
+        if bandwidth is None:
+            kdes[point] = None
+        else:
+            kdes[point] = gaussian_kde(np.array(velocities), bw_method=bandwidth)
 
-            # exactas
-            exacta_key = '-'.join([program_number for program_number, finish_times in sorted_finish_times[:2]])
-            if exacta_key not in self.results['exactas']:
-                self.results['exactas'][exacta_key] = 0
-            self.results['exactas'][exacta_key] += 1
+    if key is not None:
+        with _kde_cache_lock:
+            _kde_cache[key] = kdes
+            while len(_kde_cache) > KDE_CACHE_SIZE:
+                _kde_cache.popitem(last=False)
+    return kdes
 
-            # trifectas
-            trifecta_key = '-'.join([program_number for program_number, finish_times in sorted_finish_times[:3]])
-            if trifecta_key not in self.results['trifectas']:
-                self.results['trifectas'][trifecta_key] = 0
-            self.results['trifectas'][trifecta_key] += 1
 
-            #superfectas
-            superfecta_key = '-'.join([program_number for program_number, finish_times in sorted_finish_times[:4]])
-            if superfecta_key not in self.results['superfectas']:
-                self.results['superfectas'][superfecta_key] = 0
-            self.results['superfectas'][superfecta_key] += 1
+def load_simulation_history(race, horses):
+    """
+    Load the history every horse in a race needs for simulation in a constant
+    number of queries.
+
+    Args:
+        race: Race being simulated, only history before its race date is used
+        horses: Horses entered in the race
+
+    Returns:
+        dict: horse id -> {'velocity_profile': see build_velocity_profile,
+                           'workout_stats': {'average_velocity', 'standard_deviation', 'count'}}
+    """
+    horse_ids = [horse.id for horse in horses]
+    velocity_profiles = get_velocity_profiles(race, horses)
+    history = {}
+    for horse_id in horse_ids:
+        history[horse_id] = {
+            'velocity_profile': velocity_profiles[horse_id],
+            'workout_stats': {
+                'average_velocity': None,
+                'standard_deviation': None,
+                'count': 0
+            }
+        }
+
+    # workout velocity stats grouped by horse
+    workout_stats = Workouts.objects.filter(
+        horse_id__in=horse_ids,
+        workout_date__lt=race.race_date
+    ).annotate(
+        calculated_velocity=ExpressionWrapper(
+            F('distance') / F('time_seconds'),
+            output_field=FloatField()
+        )
+    ).values('horse_id').annotate(
+        average_velocity=Avg('calculated_velocity'),
+        standard_deviation=StdDev('calculated_velocity'),
+        count=Count('calculated_velocity')
+    )
+    for stats in workout_stats:
+        history[stats.pop('horse_id')]['workout_stats'] = stats
+
+    return history
 
 
 class SimulationEntry:
-    def __init__(self, entry):
+    def __init__(self, entry, velocity_profile=None, workout_stats=None):
+        """
+        Args:
+            entry: Entry to simulate
+            velocity_profile: Optional preloaded velocity profile from load_simulation_history,
+                looked up for this entry when not given
+            workout_stats: Optional preloaded workout stats from load_simulation_history,
+                queried for this entry when not given
+        """
 
         # base data
         self.entry = entry
@@ -97,49 +324,29 @@ class SimulationEntry:
             4: 0
         }
         
-        # Get all previous entries for this horse
-        self.previous_entries = Entries.objects.filter(
-            horse=self.horse,
-            race__race_date__lt=self.race.race_date
-        ).select_related('race').order_by('-race__race_date')
-        
-        # Get all previous split call velocities
-        self.previous_split_call_velocities = SplitCallVelocities.objects.filter(
-            entry__in=self.previous_entries
-        ).order_by('entry__race__race_date', 'point')
-        
-        # Organize velocities by point
-        self.velocity_by_point = {}
-        self.same_distance_velocity_by_point = {}
-        for point in range(5):
-            self.velocity_by_point[point] = []
-            self.same_distance_velocity_by_point[point] = []
-        for velocity in self.previous_split_call_velocities:
-            self.velocity_by_point[velocity.point].append(velocity.velocity)
-            if abs(velocity.entry.race.distance - self.race.distance)/self.race.distance < 0.1:
-                self.same_distance_velocity_by_point[velocity.point].append(velocity.velocity)
+        # Get previous velocities organized by point
+        if velocity_profile is None:
+            velocity_profile = get_velocity_profiles(self.race, [self.horse])[self.horse.id]
+        self.velocity_by_point = velocity_profile['velocity_by_point']
+        self.same_distance_velocity_by_point = velocity_profile['same_distance_velocity_by_point']
+        self.bandwidth_by_point = velocity_profile['bandwidth_by_point']
 
         # Get workout velocity
-        self.workout_stats = Workouts.objects.filter(
-            horse=self.horse,
-            workout_date__lt=self.race.race_date
-        ).annotate(
-            calculated_velocity=ExpressionWrapper(
-                F('distance') / F('time_seconds'),
-                output_field=FloatField()
+        if workout_stats is None:
+            workout_stats = Workouts.objects.filter(
+                horse=self.horse,
+                workout_date__lt=self.race.race_date
+            ).annotate(
+                calculated_velocity=ExpressionWrapper(
+                    F('distance') / F('time_seconds'),
+                    output_field=FloatField()
+                )
+            ).aggregate(
+                average_velocity=Avg('calculated_velocity'),
+                standard_deviation=StdDev('calculated_velocity'),
+                count=Count('calculated_velocity')
             )
-        ).aggregate(
-            average_velocity=Avg('calculated_velocity'),
-            standard_deviation=StdDev('calculated_velocity'),
-            count=Count('calculated_velocity')
-        )
-
-        # create guassian Kernel Density Estimation 
-        self.kde = {}
-        for point in self.same_distance_velocity_by_point.keys():
-            velocities = self.same_distance_velocity_by_point[point]
-            if len(velocities)<2:
-                self.kde[point] = None
-            else:
-                self.kde[point] = gaussian_kde(np.array(velocities))
+        self.workout_stats = workout_stats
 
+        # guassian Kernel Density Estimation with the profile bandwidth, fitted once per profile
+        self.kde = get_velocity_profile_kdes(velocity_profile)
@@ -0,0 +1,211 @@
+from datetime import date
+import numpy as np
+from django.db import IntegrityError, transaction
+from django.test import TestCase
+from horsemen.constants import METERS_PER_FURLONG
+from horsemen.models import Tracks, Races, Horses, Entries, SplitCallVelocities, VelocityProfiles, Workouts
+from horsemen.simulation import simulate
+from horsemen.simulation.simulate import get_velocity_profiles, get_velocity_profile_kdes
+
+class TestVelocityProfiles(TestCase):
+    def setUp(self):
+        self.track = Tracks.objects.create(code='AQU', name='AQUEDUCT', country='USA')
+        self.horse = Horses.objects.create(horse_name='PROFILED')
+        self.race = Races.objects.create(track=self.track, race_date=date(2024, 12, 1), race_number=1, distance=6)
+        for day in range(1, 4):
+            self.add_past_race(day)
+
+    def add_past_race(self, day):
+        race = Races.objects.create(track=self.track, race_date=date(2024, 11, day), race_number=1, distance=6)
+        entry = Entries.objects.create(race=race, horse=self.horse, program_number='1')
+        for point in range(5):
+            SplitCallVelocities.objects.create(
+                entry=entry, point=point, start_distance=0, end_distance=1, split_time=1,
+                total_time=1, velocity=16 + point + day / 10, lengths_back=0
+            )
+
+    def test_profile_is_stored_once_and_updated_in_place(self):
+        profile = get_velocity_profiles(self.race, [self.horse])[self.horse.id]
+        self.assertEqual(len(profile['same_distance_velocity_by_point'][0]), 3)
+        self.assertEqual(VelocityProfiles.objects.count(), 1)
+
+        # current profile comes from the cache without writing
+        with self.assertNumQueries(2):
+            cached_profile = get_velocity_profiles(self.race, [self.horse])[self.horse.id]
+        self.assertEqual(cached_profile['key'], profile['key'])
+
+        # new velocities update the same row
+        self.add_past_race(4)
+        profile = get_velocity_profiles(self.race, [self.horse])[self.horse.id]
+        self.assertEqual(len(profile['same_distance_velocity_by_point'][0]), 4)
+        self.assertEqual(VelocityProfiles.objects.get().split_call_velocity_count, 20)
+
+    def test_horse_and_distance_are_unique(self):
+        get_velocity_profiles(self.race, [self.horse])
+        velocity_profile = VelocityProfiles.objects.get()
+        velocity_profile.pk = None
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            velocity_profile.save()
+
+    def test_kdes_are_fitted_once_per_profile(self):
+        profile = get_velocity_profiles(self.race, [self.horse])[self.horse.id]
+        kdes = get_velocity_profile_kdes(profile)
+        self.assertIsNotNone(kdes[0])
+        self.assertIs(get_velocity_profile_kdes(get_velocity_profiles(self.race, [self.horse])[self.horse.id]), kdes)
+
+        self.add_past_race(4)
+        profile = get_velocity_profiles(self.race, [self.horse])[self.horse.id]
+        self.assertIsNot(get_velocity_profile_kdes(profile), kdes)
+
+class ConstantKde:
+    """Stand in kde that always draws the same velocity."""
+
+    def __init__(self, velocity):
+        self.velocity = velocity
+
+    def resample(self, size):
+        return np.full((1, size), self.velocity)
+
+def run_per_iteration(simulation, num_points=5):
+    """The Monte Carlo loop as it was before it was vectorized, one race and one draw at a time."""
+    race_distance = simulation.race.distance * METERS_PER_FURLONG
+    evaluation_distances, simulation_step_distance = np.linspace(0, race_distance, num_points+1, retstep=True)
+    finishes = {program_number: {1: 0, 2: 0, 3: 0, 4: 0} for program_number in simulation.simulation_entries}
+    results = {'exactas': {}, 'trifectas': {}, 'superfectas': {}}
+    for simulation_number in range(simulation.simulation_count):
+        finish_times = {program_number: 0 for program_number in simulation.simulation_entries}
+        for point in range(num_points):
+            for program_number, simulation_entry in simulation.simulation_entries.items():
+                kde = simulation_entry.kde[point]
+                random_velocity = kde.resample(size=1)[0][0] if kde else 0.00000001
+                finish_times[program_number] += simulation_step_distance / random_velocity
+        sorted_program_numbers = [program_number for program_number, finish_time in sorted(finish_times.items(), key=lambda item: item[1])]
+        for finish_index, program_number in enumerate(sorted_program_numbers[:4]):
+            finishes[program_number][finish_index+1] += 1
+        for wager_type, wager_length in [('exactas', 2), ('trifectas', 3), ('superfectas', 4)]:
+            wager_key = '-'.join(sorted_program_numbers[:wager_length])
+            results[wager_type][wager_key] = results[wager_type].get(wager_key, 0) + 1
+    return finishes, results
+
+class TestSimulation(TestCase):
+    def setUp(self):
+        # ids are reused between tests, dont draw from another test's kdes
+        simulate._kde_cache.clear()
+
+        track = Tracks.objects.create(code='AQU', name='AQUEDUCT', country='USA')
+        self.race = Races.objects.create(track=track, race_date=date(2024, 12, 1), race_number=1, distance=6)
+        self.horses = []
+        for index in range(5):
+            horse = Horses.objects.create(horse_name=f'HORSE {index}')
+            self.horses.append(horse)
+            Entries.objects.create(race=self.race, horse=horse, program_number=str(index+1), scratch_indicator='N')
+
+            # past races with velocities spread around a speed for each horse
+            for day in range(1, 5):
+                past_race = Races.objects.create(track=track, race_date=date(2024, 11, day), race_number=index+1, distance=6)
+                entry = Entries.objects.create(race=past_race, horse=horse, program_number='1')
+                for point in range(5):
+                    SplitCallVelocities.objects.create(
+                        entry=entry, point=point, start_distance=0, end_distance=1, split_time=1, total_time=1,
+                        velocity=16 + index * 0.15 + (day - 2.5) * 0.3, lengths_back=0
+                    )
+
+    def use_constant_kdes(self, velocities):
+        """Replace each horse's kdes with constant velocities, None for a horse without any."""
+        original_kdes = simulate.get_velocity_profile_kdes
+        self.addCleanup(setattr, simulate, 'get_velocity_profile_kdes', original_kdes)
+        simulate.get_velocity_profile_kdes = lambda velocity_profile: {
+            point: ConstantKde(velocities[velocity_profile['key'][0]]) if velocities[velocity_profile['key'][0]] else None
+            for point in range(5)
+        }
+
+    def assert_counts_add_up(self, simulation):
+        for place in range(1, 5):
+            self.assertEqual(
+                sum(entry.simulation_finishes[place] for entry in simulation.simulation_entries.values()),
+                simulation.simulation_count
+            )
+        for wager_type, wager_length in [('exactas', 2), ('trifectas', 3), ('superfectas', 4)]:
+            self.assertEqual(sum(simulation.results[wager_type].values()), simulation.simulation_count)
+            for wager_key in simulation.results[wager_type]:
+                program_numbers = wager_key.split('-')
+                self.assertEqual(len(program_numbers), wager_length)
+                self.assertEqual(len(set(program_numbers)), wager_length)
+
+    def test_deterministic_kdes_match_per_iteration_engine(self):
+        self.use_constant_kdes({
+            self.horses[0].id: 16.2, self.horses[1].id: 17.0, self.horses[2].id: None,
+            self.horses[3].id: 16.8, self.horses[4].id: 15.9
+        })
+        simulation = simulate.Simulation(self.race, simulation_count=50)
+        self.assert_counts_add_up(simulation)
+
+        finishes, results = run_per_iteration(simulation)
+        self.assertEqual(simulation.results, results)
+        self.assertEqual(simulation.results['superfectas'], {'2-4-1-5': 50})
+        for program_number, simulation_entry in simulation.simulation_entries.items():
+            self.assertEqual(simulation_entry.simulation_finishes, finishes[program_number])
+
+    def test_random_draws_match_per_iteration_engine(self):
+        np.random.seed(1)
+        simulation = simulate.Simulation(self.race, simulation_count=1000)
+        self.assert_counts_add_up(simulation)
+
+        finishes, results = run_per_iteration(simulation)
+        for program_number, simulation_entry in simulation.simulation_entries.items():
+            for place in range(1, 5):
+                self.assertAlmostEqual(
+                    simulation_entry.simulation_finishes[place] / 1000,
+                    finishes[program_number][place] / 1000,
+                    delta=0.06
+                )
+        for exacta in set(results['exactas']) | set(simulation.results['exactas']):
+            self.assertAlmostEqual(
+                simulation.results['exactas'].get(exacta, 0) / 1000,
+                results['exactas'].get(exacta, 0) / 1000,
+                delta=0.05
+            )
+
+    def add_entries(self, count):
+        for index in range(len(self.horses), len(self.horses) + count):
+            horse = Horses.objects.create(horse_name=f'HORSE {index}')
+            self.horses.append(horse)
+            Entries.objects.create(race=self.race, horse=horse, program_number=str(index+1), scratch_indicator='N')
+            self.add_workouts(horse)
+
+    def add_workouts(self, horse):
+        track = self.race.track
+        Workouts.objects.create(horse=horse, workout_date=date(2024, 11, 20), track=track, distance=800, time_seconds=48, note='B', workout_rank=1, workout_total=5)
+        Workouts.objects.create(horse=horse, workout_date=date(2024, 11, 27), track=track, distance=800, time_seconds=50, note='B', workout_rank=2, workout_total=5)
+
+    def test_query_count_doesnt_grow_with_the_field(self):
+        for horse in self.horses:
+            self.add_workouts(horse)
+
+        # the first simulation stores every velocity profile
+        simulate.Simulation(self.race, simulation_count=10)
+        with self.assertNumQueries(4):
+            simulate.Simulation(self.race, simulation_count=10)
+
+        self.add_entries(5)
+        simulate.Simulation(self.race, simulation_count=10)
+        with self.assertNumQueries(4):
+            simulation = simulate.Simulation(self.race, simulation_count=10)
+        self.assertEqual(len(simulation.simulation_entries), 10)
+
+    def test_workout_stats_match_single_entry_query(self):
+        horse = self.horses[0]
+        self.add_workouts(horse)
+
+        # workouts from after the race arent counted
+        Workouts.objects.create(
+            horse=horse, workout_date=date(2024, 12, 5), track=self.race.track, distance=800,
+            time_seconds=47, note='B', workout_rank=1, workout_total=5
+        )
+
+        workout_stats = simulate.load_simulation_history(self.race, [horse])[horse.id]['workout_stats']
+        entry = Entries.objects.get(race=self.race, horse=horse)
+        single_entry_stats = simulate.SimulationEntry(entry).workout_stats
+        self.assertEqual(workout_stats['count'], 2)
+        self.assertEqual(workout_stats['count'], single_entry_stats['count'])
+        self.assertAlmostEqual(workout_stats['average_velocity'], single_entry_stats['average_velocity'])
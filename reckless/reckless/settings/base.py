@@ -132,6 +132,9 @@ X_FRAME_OPTIONS = 'SAMEORIGIN'
 
 DJANGO_ALLOW_ASYNC_UNSAFE = True
 
+# How the collector writes parsed data: row (one savepoint per object) or bulk (set based upserts)
+DATA_LOADING_BACKEND = env('DATA_LOADING_BACKEND', default='row')
+
 # Logging Configuration
 LOGGING = {
     'version': 1,